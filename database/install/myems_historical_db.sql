@@ -36,6 +36,21 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_analog_value_latest` (
 CREATE INDEX `tbl_analog_value_latest_index_1`
 ON `myems_historical_db`.`tbl_analog_value_latest` (`point_id`, `utc_date_time`);
 CREATE INDEX `tbl_analog_value_latest_index_2` ON `myems_historical_db`.`tbl_analog_value_latest` (`utc_date_time`);
+CREATE UNIQUE INDEX `tbl_analog_value_latest_index_3`
+ON `myems_historical_db`.`tbl_analog_value_latest` (`point_id`);
+
+-- ---------------------------------------------------------------------------------------------------------------------
+-- Table `myems_historical_db`.`tbl_analog_value_watermarks`
+-- ---------------------------------------------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `myems_historical_db`.`tbl_analog_value_watermarks` ;
+
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_analog_value_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `utc_date_time` DATETIME NOT NULL COMMENT 'the time of the last new value of the point checked with cleaning rules',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_analog_value_watermarks_index_1`
+ON `myems_historical_db`.`tbl_analog_value_watermarks` (`point_id`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_historical_db`.`tbl_cost_files`
@@ -80,6 +95,8 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_digital_value_latest` (
 CREATE INDEX `tbl_digital_value_latest_index_1`
 ON `myems_historical_db`.`tbl_digital_value_latest` (`point_id`, `utc_date_time`);
 CREATE INDEX `tbl_digital_value_latest_index_2` ON `myems_historical_db`.`tbl_digital_value_latest` (`utc_date_time`);
+CREATE UNIQUE INDEX `tbl_digital_value_latest_index_3`
+ON `myems_historical_db`.`tbl_digital_value_latest` (`point_id`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_historical_db`.`tbl_energy_value`
@@ -110,6 +127,21 @@ CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_latest` (
 CREATE INDEX `tbl_energy_value_latest_index_1`
 ON `myems_historical_db`.`tbl_energy_value_latest` (`point_id`, `utc_date_time`);
 CREATE INDEX `tbl_energy_value_latest_index_2` ON `myems_historical_db`.`tbl_energy_value_latest` (`utc_date_time`);
+CREATE UNIQUE INDEX `tbl_energy_value_latest_index_3`
+ON `myems_historical_db`.`tbl_energy_value_latest` (`point_id`);
+
+-- ---------------------------------------------------------------------------------------------------------------------
+-- Table `myems_historical_db`.`tbl_energy_value_watermarks`
+-- ---------------------------------------------------------------------------------------------------------------------
+DROP TABLE IF EXISTS `myems_historical_db`.`tbl_energy_value_watermarks` ;
+
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `utc_date_time` DATETIME NOT NULL COMMENT 'the last cleaned time of the point',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_energy_value_watermarks_index_1`
+ON `myems_historical_db`.`tbl_energy_value_watermarks` (`point_id`);
 
 -- ---------------------------------------------------------------------------------------------------------------------
 -- Table `myems_historical_db`.`tbl_offline_meter_files`
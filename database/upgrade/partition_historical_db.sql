@@ -0,0 +1,44 @@
+-- ---------------------------------------------------------------------------------------------------------------------
+-- OPTIONAL: Partition trend values of analog values and digital values by day
+--
+-- With daily partitions, myems-cleaning drops expired partitions as a whole instead of deleting expired values,
+-- and creates the partitions of the next RETENTION_PARTITIONS_AHEAD_IN_DAYS days ahead of time.
+-- Values older than LIVE_IN_DAYS are kept in partition p_history until it is dropped by myems-cleaning.
+--
+-- NOTE: The tables are rebuilt, it takes a long time and lots of disk space on big tables.
+-- Stop myems-modbus-tcp and myems-cleaning and back up the database before running this script.
+-- The primary keys are changed to (id, utc_date_time) because every unique key of a partitioned table
+-- must include the partitioning column.
+-- Change live_in_days (365) below to LIVE_IN_DAYS of myems-cleaning.
+-- ---------------------------------------------------------------------------------------------------------------------
+
+USE `myems_historical_db` ;
+
+DROP PROCEDURE IF EXISTS `partition_by_day` ;
+
+DELIMITER $$
+CREATE PROCEDURE `partition_by_day` (IN table_name VARCHAR(64), IN live_in_days INT, IN days_ahead INT)
+BEGIN
+  DECLARE partition_date DATE DEFAULT DATE_SUB(UTC_DATE(), INTERVAL live_in_days DAY);
+  DECLARE definitions TEXT;
+  SET definitions = CONCAT('PARTITION p_history VALUES LESS THAN (TO_DAYS(''', partition_date, '''))');
+  WHILE partition_date <= DATE_ADD(UTC_DATE(), INTERVAL days_ahead DAY) DO
+    SET definitions = CONCAT(definitions,
+                             ', PARTITION p', DATE_FORMAT(partition_date, '%Y%m%d'),
+                             ' VALUES LESS THAN (TO_DAYS(''', DATE_ADD(partition_date, INTERVAL 1 DAY), '''))');
+    SET partition_date = DATE_ADD(partition_date, INTERVAL 1 DAY);
+  END WHILE;
+  SET definitions = CONCAT(definitions, ', PARTITION p_future VALUES LESS THAN MAXVALUE');
+  SET @statement = CONCAT('ALTER TABLE `myems_historical_db`.`', table_name, '` ',
+                          'DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `utc_date_time`) ',
+                          'PARTITION BY RANGE (TO_DAYS(`utc_date_time`)) (', definitions, ')');
+  PREPARE partition_statement FROM @statement;
+  EXECUTE partition_statement;
+  DEALLOCATE PREPARE partition_statement;
+END$$
+DELIMITER ;
+
+CALL `partition_by_day`('tbl_analog_value', 365, 7);
+CALL `partition_by_day`('tbl_digital_value', 365, 7);
+
+DROP PROCEDURE IF EXISTS `partition_by_day` ;
@@ -28,6 +28,51 @@ VALUES
 (40002,'Work Order Repair','/workorder/repair',40000,1),
 (40003,'Work Order Inspection','/workorder/inspection',40000,1);
 
+DELETE t1 FROM myems_historical_db.tbl_analog_value_latest t1
+INNER JOIN myems_historical_db.tbl_analog_value_latest t2
+WHERE t1.point_id = t2.point_id AND t1.id < t2.id;
+CREATE UNIQUE INDEX `tbl_analog_value_latest_index_3`
+ON `myems_historical_db`.`tbl_analog_value_latest` (`point_id`);
+
+DELETE t1 FROM myems_historical_db.tbl_digital_value_latest t1
+INNER JOIN myems_historical_db.tbl_digital_value_latest t2
+WHERE t1.point_id = t2.point_id AND t1.id < t2.id;
+CREATE UNIQUE INDEX `tbl_digital_value_latest_index_3`
+ON `myems_historical_db`.`tbl_digital_value_latest` (`point_id`);
+
+DELETE t1 FROM myems_historical_db.tbl_energy_value_latest t1
+INNER JOIN myems_historical_db.tbl_energy_value_latest t2
+WHERE t1.point_id = t2.point_id AND t1.id < t2.id;
+CREATE UNIQUE INDEX `tbl_energy_value_latest_index_3`
+ON `myems_historical_db`.`tbl_energy_value_latest` (`point_id`);
+
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_energy_value_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `utc_date_time` DATETIME NOT NULL COMMENT 'the last cleaned time of the point',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_energy_value_watermarks_index_1`
+ON `myems_historical_db`.`tbl_energy_value_watermarks` (`point_id`);
+-- continue cleaning energy values of each point from the last cleaned time
+INSERT INTO `myems_historical_db`.`tbl_energy_value_watermarks` (point_id, utc_date_time)
+SELECT point_id, MAX(utc_date_time)
+FROM `myems_historical_db`.`tbl_energy_value`
+WHERE is_bad IS NOT NULL
+GROUP BY point_id;
+
+CREATE TABLE IF NOT EXISTS `myems_historical_db`.`tbl_analog_value_watermarks` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `point_id` BIGINT NOT NULL,
+  `utc_date_time` DATETIME NOT NULL COMMENT 'the time of the last new value of the point checked with cleaning rules',
+  PRIMARY KEY (`id`));
+CREATE UNIQUE INDEX `tbl_analog_value_watermarks_index_1`
+ON `myems_historical_db`.`tbl_analog_value_watermarks` (`point_id`);
+-- check analog values of each point from its latest value, the history before the upgrade is not checked
+INSERT INTO `myems_historical_db`.`tbl_analog_value_watermarks` (point_id, utc_date_time)
+SELECT point_id, MAX(utc_date_time)
+FROM `myems_historical_db`.`tbl_analog_value`
+GROUP BY point_id;
+
 -- UPDATE VERSION NUMBER
 UPDATE `myems_system_db`.`tbl_versions` SET version='4.7.0RC', release_date='2024-07-07' WHERE id=1;
 
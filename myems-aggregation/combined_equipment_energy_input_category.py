@@ -7,17 +7,24 @@ from multiprocessing import Pool
 import mysql.connector
 
 import config
+import connection_pool
 
 
 ########################################################################################################################
 # PROCEDURES
 # Step 1: get all combined equipments
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 2: Call worker in parallel with the multiprocessing pool
 ########################################################################################################################
 
 
 def main(logger):
 
+    # the multiprocessing pool lives as long as this process, so that its worker processes reuse their
+    # connections to databases in all cycles, see connection_pool.py
+    p = Pool(processes=config.pool_size,
+             initializer=connection_pool.initialize,
+             initargs=(logger, [config.myems_system_db, config.myems_energy_db],))
+
     while True:
         # the outermost while loop
         ################################################################################################################
@@ -72,12 +79,9 @@ def main(logger):
         random.shuffle(combined_equipment_list)
 
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Call worker in parallel with the multiprocessing pool
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
         error_list = p.map(worker, combined_equipment_list)
-        p.close()
-        p.join()
 
         for error in error_list:
             if error is not None and len(error) > 0:
@@ -117,7 +121,7 @@ def worker(combined_equipment):
     cnx_system_db = None
     cursor_system_db = None
     try:
-        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
+        cnx_system_db = connection_pool.connect(config.myems_system_db)
         cursor_system_db = cnx_system_db.cursor()
     except Exception as e:
         error_string = "Error in step 1.1 of combined_equipment_energy_input_category.worker " + str(e)
@@ -264,7 +268,7 @@ def worker(combined_equipment):
     cnx_energy_db = None
     cursor_energy_db = None
     try:
-        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+        cnx_energy_db = connection_pool.connect(config.myems_energy_db)
         cursor_energy_db = cnx_energy_db.cursor()
     except Exception as e:
         error_string = "Error in step 5.1 of combined_equipment_energy_input_category.worker " + str(e)
@@ -1,6 +1,5 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from multiprocessing import Process
 
 import combined_equipment_billing_input_category
 import combined_equipment_billing_input_item
@@ -9,6 +8,7 @@ import combined_equipment_carbon_input_category
 import combined_equipment_energy_input_category
 import combined_equipment_energy_input_item
 import combined_equipment_energy_output_category
+import config
 import energy_storage_container_billing_charge
 import energy_storage_container_energy_charge
 import energy_storage_container_carbon_charge
@@ -62,6 +62,7 @@ import tenant_energy_input_category
 import tenant_energy_input_item
 import virtual_meter_billing
 import virtual_meter_carbon
+from supervisor import Supervisor
 
 
 def main():
@@ -83,137 +84,159 @@ def main():
     # send logging output to sys.stderr
     logger.addHandler(logging.StreamHandler())
 
+    # worker processes terminated unexpectedly are restarted with exponential backoff
+    supervisor = Supervisor(logger,
+                            config.supervisor['start_interval_in_seconds'],
+                            config.supervisor['backoff_initial_in_seconds'],
+                            config.supervisor['backoff_max_in_seconds'],
+                            config.supervisor['stable_in_seconds'])
+
     # combined equipment billing input by energy categories
-    Process(target=combined_equipment_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_billing_input_category',
+                   combined_equipment_billing_input_category.main, (logger,))
     # combined equipment billing input by energy items
-    Process(target=combined_equipment_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_billing_input_item', combined_equipment_billing_input_item.main, (logger,))
     # combined equipment billing output by energy categories
-    Process(target=combined_equipment_billing_output_category.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_billing_output_category',
+                   combined_equipment_billing_output_category.main, (logger,))
     # combined equipment carbon dioxide emissions by energy categories
-    Process(target=combined_equipment_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_carbon_input_category', combined_equipment_carbon_input_category.main, (logger,))
     # combined equipment energy input by energy categories
-    Process(target=combined_equipment_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_energy_input_category', combined_equipment_energy_input_category.main, (logger,))
     # combined equipment energy input by energy items
-    Process(target=combined_equipment_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_energy_input_item', combined_equipment_energy_input_item.main, (logger,))
     # combined equipment energy output by energy categories
-    Process(target=combined_equipment_energy_output_category.main, args=(logger,)).start()
+    supervisor.add('combined_equipment_energy_output_category',
+                   combined_equipment_energy_output_category.main, (logger,))
 
     # energy storage container energy charge
-    Process(target=energy_storage_container_energy_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_energy_charge', energy_storage_container_energy_charge.main, (logger,))
     # energy storage container energy discharge
-    Process(target=energy_storage_container_energy_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_energy_discharge',
+                   energy_storage_container_energy_discharge.main, (logger,))
     # energy storage container billing charge
-    Process(target=energy_storage_container_billing_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_billing_charge', energy_storage_container_billing_charge.main, (logger,))
     # energy storage container billing discharge
-    Process(target=energy_storage_container_billing_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_billing_discharge',
+                   energy_storage_container_billing_discharge.main, (logger,))
     # energy storage container carbon charge
-    Process(target=energy_storage_container_carbon_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_carbon_charge', energy_storage_container_carbon_charge.main, (logger,))
     # energy storage container carbon discharge
-    Process(target=energy_storage_container_carbon_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_container_carbon_discharge',
+                   energy_storage_container_carbon_discharge.main, (logger,))
 
     # energy storage power station energy charge
-    Process(target=energy_storage_power_station_energy_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_energy_charge',
+                   energy_storage_power_station_energy_charge.main, (logger,))
     # energy storage power station energy discharge
-    Process(target=energy_storage_power_station_energy_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_energy_discharge',
+                   energy_storage_power_station_energy_discharge.main, (logger,))
     # energy storage power station billing charge
-    Process(target=energy_storage_power_station_billing_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_billing_charge',
+                   energy_storage_power_station_billing_charge.main, (logger,))
     # energy storage power station billing discharge
-    Process(target=energy_storage_power_station_billing_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_billing_discharge',
+                   energy_storage_power_station_billing_discharge.main, (logger,))
     # energy storage power station carbon charge
-    Process(target=energy_storage_power_station_carbon_charge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_carbon_charge',
+                   energy_storage_power_station_carbon_charge.main, (logger,))
     # energy storage power station carbon discharge
-    Process(target=energy_storage_power_station_carbon_discharge.main, args=(logger,)).start()
+    supervisor.add('energy_storage_power_station_carbon_discharge',
+                   energy_storage_power_station_carbon_discharge.main, (logger,))
 
     # equipment billing input by energy categories
-    Process(target=equipment_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('equipment_billing_input_category', equipment_billing_input_category.main, (logger,))
     # equipment billing input by energy items
-    Process(target=equipment_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('equipment_billing_input_item', equipment_billing_input_item.main, (logger,))
     # equipment billing output by energy categories
-    Process(target=equipment_billing_output_category.main, args=(logger,)).start()
+    supervisor.add('equipment_billing_output_category', equipment_billing_output_category.main, (logger,))
     # equipment carbon dioxide emissions by energy categories
-    Process(target=equipment_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('equipment_carbon_input_category', equipment_carbon_input_category.main, (logger,))
     # equipment energy input by energy categories
-    Process(target=equipment_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('equipment_energy_input_category', equipment_energy_input_category.main, (logger,))
     # equipment energy input by energy items
-    Process(target=equipment_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('equipment_energy_input_item', equipment_energy_input_item.main, (logger,))
     # equipment energy output by energy categories
-    Process(target=equipment_energy_output_category.main, args=(logger,)).start()
+    supervisor.add('equipment_energy_output_category', equipment_energy_output_category.main, (logger,))
 
     # meter carbon dioxide emissions
-    Process(target=meter_carbon.main, args=(logger,)).start()
+    supervisor.add('meter_carbon', meter_carbon.main, (logger,))
     # meter billing
-    Process(target=meter_billing.main, args=(logger,)).start()
+    supervisor.add('meter_billing', meter_billing.main, (logger,))
 
     # microgrid energy charge
-    Process(target=microgrid_energy_charge.main, args=(logger,)).start()
+    supervisor.add('microgrid_energy_charge', microgrid_energy_charge.main, (logger,))
     # microgrid energy discharge
-    Process(target=microgrid_energy_discharge.main, args=(logger,)).start()
+    supervisor.add('microgrid_energy_discharge', microgrid_energy_discharge.main, (logger,))
     # microgrid billing charge
-    Process(target=microgrid_billing_charge.main, args=(logger,)).start()
+    supervisor.add('microgrid_billing_charge', microgrid_billing_charge.main, (logger,))
     # microgrid billing discharge
-    Process(target=microgrid_billing_discharge.main, args=(logger,)).start()
+    supervisor.add('microgrid_billing_discharge', microgrid_billing_discharge.main, (logger,))
     # microgrid carbon charge
-    Process(target=microgrid_carbon_charge.main, args=(logger,)).start()
+    supervisor.add('microgrid_carbon_charge', microgrid_carbon_charge.main, (logger,))
     # microgrid carbon discharge
-    Process(target=microgrid_carbon_discharge.main, args=(logger,)).start()
+    supervisor.add('microgrid_carbon_discharge', microgrid_carbon_discharge.main, (logger,))
 
     # offline meter carbon dioxide emissions
-    Process(target=offline_meter_carbon.main, args=(logger,)).start()
+    supervisor.add('offline_meter_carbon', offline_meter_carbon.main, (logger,))
     # offline meter billing
-    Process(target=offline_meter_billing.main, args=(logger,)).start()
+    supervisor.add('offline_meter_billing', offline_meter_billing.main, (logger,))
 
     # shopfloor billing input by energy categories
-    Process(target=shopfloor_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('shopfloor_billing_input_category', shopfloor_billing_input_category.main, (logger,))
     # shopfloor billing input by energy items
-    Process(target=shopfloor_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('shopfloor_billing_input_item', shopfloor_billing_input_item.main, (logger,))
     # shopfloor carbon dioxide emissions by energy categories
-    Process(target=shopfloor_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('shopfloor_carbon_input_category', shopfloor_carbon_input_category.main, (logger,))
     # shopfloor energy input by energy categories
-    Process(target=shopfloor_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('shopfloor_energy_input_category', shopfloor_energy_input_category.main, (logger,))
     # shopfloor energy input by energy items
-    Process(target=shopfloor_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('shopfloor_energy_input_item', shopfloor_energy_input_item.main, (logger,))
 
     # space billing input by energy categories
-    Process(target=space_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('space_billing_input_category', space_billing_input_category.main, (logger,))
     # space billing input by energy items
-    Process(target=space_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('space_billing_input_item', space_billing_input_item.main, (logger,))
     # space billing output by energy categories
-    Process(target=space_billing_output_category.main, args=(logger,)).start()
+    supervisor.add('space_billing_output_category', space_billing_output_category.main, (logger,))
     # space carbon dioxide emissions by energy categories
-    Process(target=space_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('space_carbon_input_category', space_carbon_input_category.main, (logger,))
     # space energy input by energy categories
-    Process(target=space_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('space_energy_input_category', space_energy_input_category.main, (logger,))
     # space energy input by energy items
-    Process(target=space_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('space_energy_input_item', space_energy_input_item.main, (logger,))
     # space energy output by energy categories
-    Process(target=space_energy_output_category.main, args=(logger,)).start()
+    supervisor.add('space_energy_output_category', space_energy_output_category.main, (logger,))
 
     # store billing input by energy categories
-    Process(target=store_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('store_billing_input_category', store_billing_input_category.main, (logger,))
     # store billing input by energy items
-    Process(target=store_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('store_billing_input_item', store_billing_input_item.main, (logger,))
     # store carbon dioxide emissions by energy categories
-    Process(target=store_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('store_carbon_input_category', store_carbon_input_category.main, (logger,))
     # store energy input by energy categories
-    Process(target=store_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('store_energy_input_category', store_energy_input_category.main, (logger,))
     # store energy input by energy items
-    Process(target=store_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('store_energy_input_item', store_energy_input_item.main, (logger,))
 
     # tenant billing input by energy categories
-    Process(target=tenant_billing_input_category.main, args=(logger,)).start()
+    supervisor.add('tenant_billing_input_category', tenant_billing_input_category.main, (logger,))
     # tenant billing input by energy items
-    Process(target=tenant_billing_input_item.main, args=(logger,)).start()
+    supervisor.add('tenant_billing_input_item', tenant_billing_input_item.main, (logger,))
     # tenant carbon dioxide emissions by energy categories
-    Process(target=tenant_carbon_input_category.main, args=(logger,)).start()
+    supervisor.add('tenant_carbon_input_category', tenant_carbon_input_category.main, (logger,))
     # tenant energy input by energy categories
-    Process(target=tenant_energy_input_category.main, args=(logger,)).start()
+    supervisor.add('tenant_energy_input_category', tenant_energy_input_category.main, (logger,))
     # tenant energy input by energy items
-    Process(target=tenant_energy_input_item.main, args=(logger,)).start()
+    supervisor.add('tenant_energy_input_item', tenant_energy_input_item.main, (logger,))
 
     # virtual meter carbon dioxide emission
-    Process(target=virtual_meter_carbon.main, args=(logger,)).start()
+    supervisor.add('virtual_meter_carbon', virtual_meter_carbon.main, (logger,))
     # virtual meter billing (cost or income)
-    Process(target=virtual_meter_billing.main, args=(logger,)).start()
+    supervisor.add('virtual_meter_billing', virtual_meter_billing.main, (logger,))
+
+    # watch worker processes forever
+    supervisor.run_forever()
 
 
 if __name__ == '__main__':
@@ -5,17 +5,24 @@ from decimal import Decimal
 from multiprocessing import Pool
 import mysql.connector
 import config
+import connection_pool
 
 
 ########################################################################################################################
 # PROCEDURES
 # Step 1: get all microgrids
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 2: Call worker in parallel with the multiprocessing pool
 ########################################################################################################################
 
 
 def main(logger):
 
+    # the multiprocessing pool lives as long as this process, so that its worker processes reuse their
+    # connections to databases in all cycles, see connection_pool.py
+    p = Pool(processes=config.pool_size,
+             initializer=connection_pool.initialize,
+             initargs=(logger, [config.myems_system_db, config.myems_energy_db],))
+
     while True:
         # the outermost while loop
         ################################################################################################################
@@ -70,12 +77,9 @@ def main(logger):
         random.shuffle(microgrid_list)
 
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Call worker in parallel with the multiprocessing pool
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
         error_list = p.map(worker, microgrid_list)
-        p.close()
-        p.join()
 
         for error in error_list:
             if error is not None and len(error) > 0:
@@ -109,7 +113,7 @@ def worker(microgrid):
     cnx_system_db = None
     cursor_system_db = None
     try:
-        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
+        cnx_system_db = connection_pool.connect(config.myems_system_db)
         cursor_system_db = cnx_system_db.cursor()
     except Exception as e:
         error_string = "Error in step 1.1 of microgrid_energy_charge.worker " + str(e)
@@ -144,6 +148,11 @@ def worker(microgrid):
         print(error_string)
         return error_string
 
+    if cursor_system_db:
+        cursor_system_db.close()
+    if cnx_system_db:
+        cnx_system_db.close()
+
     ####################################################################################################################
     # stop to the next microgrid if this microgrid is empty
     ####################################################################################################################
@@ -158,7 +167,7 @@ def worker(microgrid):
     cnx_energy_db = None
     cursor_energy_db = None
     try:
-        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+        cnx_energy_db = connection_pool.connect(config.myems_energy_db)
         cursor_energy_db = cnx_energy_db.cursor()
     except Exception as e:
         error_string = "Error in step 2.1 of microgrid_energy_charge.worker " + str(e)
@@ -0,0 +1,115 @@
+import time
+from multiprocessing import Process
+
+########################################################################################################################
+# Process Supervisor
+# Worker processes are started with staggered delays to spread the start-up storm,
+# and a worker process terminated unexpectedly is restarted with exponential backoff.
+# The backoff is reset once the restarted process has run longer than the stable time.
+########################################################################################################################
+
+
+class SupervisedProcess:
+    """A worker process and its restart state"""
+    __slots__ = ('name', 'target', 'args', 'process', 'started_time', 'next_start_time', 'failures', 'restarts')
+
+    def __init__(self, name, target, args, next_start_time):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started_time = None
+        self.next_start_time = next_start_time
+        # the number of consecutive failures since the last stable run
+        self.failures = 0
+        # the number of restarts since the worker process was added
+        self.restarts = 0
+
+
+class Supervisor:
+    """Start, watch and restart worker processes"""
+
+    def __init__(self, logger, start_interval_in_seconds, backoff_initial_in_seconds, backoff_max_in_seconds,
+                 stable_in_seconds):
+        self.logger = logger
+        self.start_interval_in_seconds = start_interval_in_seconds
+        self.backoff_initial_in_seconds = backoff_initial_in_seconds
+        self.backoff_max_in_seconds = backoff_max_in_seconds
+        self.stable_in_seconds = stable_in_seconds
+        # name -> supervised process
+        self.supervised_process_dict = dict()
+        # the earliest time to start the next added worker process
+        self._next_stagger_time = 0.0
+
+    def add(self, name, target, args):
+        """
+        Add a worker process, it will be started after the worker processes added before it
+        :param name: the unique name of the worker process
+        :param target: the callable object invoked by the worker process
+        :param args: the argument tuple for the target invocation
+        """
+        if name in self.supervised_process_dict:
+            self.remove(name)
+        now = time.monotonic()
+        self._next_stagger_time = max(now, self._next_stagger_time)
+        self.supervised_process_dict[name] = SupervisedProcess(name, target, args, self._next_stagger_time)
+        self._next_stagger_time += self.start_interval_in_seconds
+        self.check()
+
+    def remove(self, name):
+        """Terminate and remove a worker process"""
+        supervised_process = self.supervised_process_dict.pop(name, None)
+        if supervised_process is not None and supervised_process.process is not None:
+            supervised_process.process.terminate()
+            supervised_process.process.join()
+
+    def check(self):
+        """Start pending worker processes and schedule restarts of terminated worker processes"""
+        now = time.monotonic()
+        for supervised_process in self.supervised_process_dict.values():
+            process = supervised_process.process
+            if process is not None:
+                if process.is_alive():
+                    continue
+                process.join()
+                supervised_process.process = None
+                if now - supervised_process.started_time >= self.stable_in_seconds:
+                    supervised_process.failures = 0
+                backoff_in_seconds = min(self.backoff_max_in_seconds,
+                                         self.backoff_initial_in_seconds * 2 ** min(supervised_process.failures, 30))
+                supervised_process.failures += 1
+                supervised_process.next_start_time = now + backoff_in_seconds
+                self.logger.error("Process " + str(supervised_process.name) +
+                                  " terminated unexpectedly with exit code " + str(process.exitcode) +
+                                  ", restart in " + str(backoff_in_seconds) + " seconds")
+
+            if now >= supervised_process.next_start_time:
+                if supervised_process.started_time is not None:
+                    supervised_process.restarts += 1
+                    # the services log at the level of ERROR, the restart is logged at the same level as
+                    # the termination, so that restart counts reach the log file
+                    self.logger.error("Restart process " + str(supervised_process.name) +
+                                      ", restarted " + str(supervised_process.restarts) + " times")
+                supervised_process.process = Process(target=supervised_process.target, args=supervised_process.args)
+                supervised_process.process.start()
+                supervised_process.started_time = now
+
+    def wait(self, seconds, check_interval_in_seconds=1.0):
+        """Watch worker processes for seconds"""
+        end_time = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(check_interval_in_seconds, remaining))
+
+    def run_forever(self):
+        """Watch worker processes forever"""
+        while True:
+            self.wait(60)
+
+    def restart_counts(self):
+        """Return dictionary of name to the number of restarts of worker processes"""
+        return {name: supervised_process.restarts
+                for name, supervised_process in self.supervised_process_dict.items()}
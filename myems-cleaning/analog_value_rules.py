@@ -0,0 +1,171 @@
+import json
+import math
+import os
+from itertools import accumulate
+
+########################################################################################################################
+# Cleaning rules of analog values
+# Each rule is a function over the window of values of a point, which is a list of values in time order
+# with the list of their datetimes, and returns the indexes of bad values in the window.
+# Rules are computed over whole lists with prefix sums and run lengths instead of row by row database round trips.
+#
+# Rules are configured in the JSON file of ANALOG_VALUE_RULES_FILE, for example:
+# {
+#     "default": [{"rule": "limit"}],
+#     "units": {"℃": [{"rule": "limit"}, {"rule": "spike", "threshold": 10}]},
+#     "points": {"1001": [{"rule": "stuck_value", "max_repeats": 120}]}
+# }
+# The rules of a point are the rules of its id in "points", else the rules of its units in "units",
+# else the rules in "default".
+########################################################################################################################
+
+
+def check_limit(value_list, datetime_list, point, parameters):
+    """
+    Values greater than the high limit or less than the low limit are bad
+    parameters: high_limit and low_limit, default to the limits of the point
+    """
+    high_limit = float(parameters.get('high_limit', point['high_limit']))
+    low_limit = float(parameters.get('low_limit', point['low_limit']))
+    return [i for i, value in enumerate(value_list) if value > high_limit or value < low_limit]
+
+
+def check_rate_of_change(value_list, datetime_list, point, parameters):
+    """
+    Values changed from the last good values faster than the max change per minute are bad,
+    so that the value after a spike is compared with the value before the spike instead of the spike
+    parameters: max_change_per_minute
+    """
+    max_change_per_minute = float(parameters['max_change_per_minute'])
+    bad_index_list = list()
+    last_good_index = 0
+    for i in range(1, len(value_list)):
+        if abs(value_list[i] - value_list[last_good_index]) > \
+                max_change_per_minute * \
+                max((datetime_list[i] - datetime_list[last_good_index]).total_seconds(), 1.0) / 60.0:
+            bad_index_list.append(i)
+        else:
+            last_good_index = i
+    return bad_index_list
+
+
+def check_stuck_value(value_list, datetime_list, point, parameters):
+    """
+    Values repeated more than max repeats times in a row are bad, for example frozen sensors or stale gateways
+    parameters: max_repeats, tolerance (default 0) of the difference between repeated values
+    """
+    max_repeats = int(parameters['max_repeats'])
+    tolerance = float(parameters.get('tolerance', 0))
+    # the number of consecutive repeats of the previous value up to each value
+    repeat_list = accumulate(range(len(value_list)),
+                             lambda repeats, i: repeats + 1 if abs(value_list[i] - value_list[i - 1]) <= tolerance
+                             else 0)
+    return [i for i, repeats in enumerate(repeat_list) if repeats > max_repeats]
+
+
+def check_spike(value_list, datetime_list, point, parameters):
+    """
+    Values jumped away from both the previous value and the next value in the same direction by more than threshold,
+    while the previous value and the next value are close to each other, are bad
+    parameters: threshold
+    """
+    threshold = float(parameters['threshold'])
+    return [i for i in range(1, len(value_list) - 1)
+            if abs(value_list[i] - value_list[i - 1]) > threshold
+            and abs(value_list[i] - value_list[i + 1]) > threshold
+            and (value_list[i] - value_list[i - 1]) * (value_list[i] - value_list[i + 1]) > 0
+            and abs(value_list[i + 1] - value_list[i - 1]) <= threshold]
+
+
+def check_z_score(value_list, datetime_list, point, parameters):
+    """
+    Values deviated from the mean of the previous window values by more than threshold standard deviations are bad
+    parameters: window (default 60) of the number of previous values, threshold (default 4.0)
+    """
+    window = int(parameters.get('window', 60))
+    threshold = float(parameters.get('threshold', 4.0))
+    if window < 2 or len(value_list) <= window:
+        return list()
+    # shift values by the first value to keep the precision of the prefix sums of squares
+    shift = value_list[0]
+    shifted_list = [value - shift for value in value_list]
+    sum_list = list(accumulate(shifted_list, initial=0.0))
+    square_sum_list = list(accumulate((value * value for value in shifted_list), initial=0.0))
+    bad_list = list()
+    for i in range(window, len(value_list)):
+        mean = (sum_list[i] - sum_list[i - window]) / window
+        variance = (square_sum_list[i] - square_sum_list[i - window]) / window - mean * mean
+        if variance <= 0.0:
+            continue
+        if abs(shifted_list[i] - mean) > threshold * math.sqrt(variance):
+            bad_list.append(i)
+    return bad_list
+
+
+# rule name -> (rule function, required parameters, function of the number of previous values the rule needs)
+RULES = {
+    'limit': (check_limit, (), lambda parameters: 0),
+    'rate_of_change': (check_rate_of_change, ('max_change_per_minute',), lambda parameters: 1),
+    'stuck_value': (check_stuck_value, ('max_repeats',), lambda parameters: int(parameters['max_repeats']) + 1),
+    'spike': (check_spike, ('threshold',), lambda parameters: 1),
+    'z_score': (check_z_score, (), lambda parameters: int(parameters.get('window', 60))),
+}
+
+
+def load_rules(logger, file_name):
+    """
+    Load the configuration of rules from the JSON file, rules with unknown names or missing parameters are dropped
+    :return: dictionary of 'default', 'units' and 'points', empty if the file is missing or invalid
+    """
+    if not os.path.exists(file_name):
+        return dict()
+    try:
+        with open(file_name, encoding='utf-8') as f:
+            rules = json.load(f)
+    except Exception as e:
+        logger.error("Error in load_rules of analog value rules " + str(e))
+        return dict()
+
+    def validate(rule_list):
+        valid_rule_list = list()
+        for rule in rule_list:
+            if not isinstance(rule, dict) or rule.get('rule') not in RULES:
+                logger.error("Unknown analog value rule " + str(rule))
+                continue
+            missing_parameter_list = [name for name in RULES[rule['rule']][1] if name not in rule]
+            if len(missing_parameter_list) > 0:
+                logger.error("Missing parameters " + ', '.join(missing_parameter_list) +
+                             " of analog value rule " + str(rule))
+                continue
+            valid_rule_list.append(rule)
+        return valid_rule_list
+
+    return {'default': validate(rules.get('default', list())),
+            'units': {units: validate(rule_list) for units, rule_list in rules.get('units', dict()).items()},
+            'points': {int(point_id): validate(rule_list)
+                       for point_id, rule_list in rules.get('points', dict()).items()}}
+
+
+def get_point_rules(rules, point_id, units):
+    """Return the rule list of a point, the most specific configuration wins"""
+    if point_id in rules.get('points', dict()):
+        return rules['points'][point_id]
+    if units in rules.get('units', dict()):
+        return rules['units'][units]
+    return rules.get('default', list())
+
+
+def get_context_size(rule_list):
+    """Return the number of previous values needed before new values to check them with the rules"""
+    return max([RULES[rule['rule']][2](rule) for rule in rule_list], default=0)
+
+
+def apply_rules(rule_list, value_list, datetime_list, point):
+    """
+    Apply the rules over the window of values of a point
+    :return: sorted list of indexes of bad values
+    """
+    bad_set = set()
+    for rule in rule_list:
+        bad_set.update(RULES[rule['rule']][0](value_list, datetime_list, point, rule))
+    return sorted(bad_set)
@@ -0,0 +1,265 @@
+import time
+from datetime import datetime, timezone
+
+import mysql.connector
+
+import analog_value_rules
+import config
+
+
+########################################################################################################################
+# This procedure will find and tag the bad analog values with the cleaning rules of points.
+#
+# Step 1: get the analog value points, the cleaning rules and the watermark of each point.
+# Step 2: get the previous good values of the point as context and the new values in chunks.
+# Step 3: apply the cleaning rules of the point over the context and the new values.
+# Step 4: tag the is_bad property of analog values and save the watermarks of points in batches.
+#
+# Each point is checked from its watermark, the time of the last new value of the point in tbl_analog_value_watermarks,
+# so that each cycle reads only new values of the point through the index on (point_id, utc_date_time).
+# The last new value of each point is left unchecked until the next cycle, because some rules need the next value.
+# See analog_value_rules.py for the rules and the configuration of rules.
+########################################################################################################################
+
+# the number of points tagged in one transaction
+TAG_BATCH_SIZE = 1000
+
+
+def tag_values(cnx_historical, cursor_historical, bad_list, slot_list, watermark_list):
+    """
+    Tag the is_bad property of analog values and save the watermarks of points in one transaction.
+    Ids of bad values and time slots of points are bulk inserted into temporary tables,
+    and analog values are tagged by joining them in a single UPDATE for each.
+    :param bad_list: list of ids of bad values
+    :param slot_list: list of (point_id, min_datetime, max_datetime) of the checked time slots
+    :param watermark_list: list of (point_id, utc_date_time) of the new watermarks
+    """
+    cursor_historical.execute(" CREATE TEMPORARY TABLE IF NOT EXISTS tmp_bad_analog_value_ids ( "
+                              " id BIGINT NOT NULL, "
+                              " PRIMARY KEY (id)) ")
+    cursor_historical.execute(" CREATE TEMPORARY TABLE IF NOT EXISTS tmp_analog_value_slots ( "
+                              " point_id BIGINT NOT NULL, "
+                              " min_datetime DATETIME NOT NULL, "
+                              " max_datetime DATETIME NOT NULL, "
+                              " PRIMARY KEY (point_id)) ")
+    cursor_historical.execute(" DELETE FROM tmp_bad_analog_value_ids ")
+    cursor_historical.execute(" DELETE FROM tmp_analog_value_slots ")
+
+    if len(bad_list) > 0:
+        cursor_historical.executemany(" INSERT INTO tmp_bad_analog_value_ids (id) VALUES (%s) ",
+                                      [(bad_id,) for bad_id in bad_list])
+        cursor_historical.execute(" UPDATE tbl_analog_value v "
+                                  " INNER JOIN tmp_bad_analog_value_ids b ON v.id = b.id "
+                                  " SET v.is_bad = 1 ")
+
+    if len(slot_list) > 0:
+        cursor_historical.executemany(" INSERT INTO tmp_analog_value_slots (point_id, min_datetime, max_datetime) "
+                                      " VALUES (%s, %s, %s) ", slot_list)
+        # NOTE: use '<' instead of '<=' because the last new value is checked in the next cycle
+        cursor_historical.execute(" UPDATE tbl_analog_value v "
+                                  " INNER JOIN tmp_analog_value_slots s ON v.point_id = s.point_id "
+                                  " SET v.is_bad = 0 "
+                                  " WHERE v.utc_date_time >= s.min_datetime AND v.utc_date_time < s.max_datetime "
+                                  " AND v.is_bad IS NULL ")
+
+    if len(watermark_list) > 0:
+        cursor_historical.executemany(" INSERT INTO tbl_analog_value_watermarks (point_id, utc_date_time) "
+                                      " VALUES (%s, %s) "
+                                      " ON DUPLICATE KEY UPDATE utc_date_time = VALUES(utc_date_time) ",
+                                      watermark_list)
+    cnx_historical.commit()
+
+
+def process(logger):
+
+    while True:
+        # the outermost loop to reconnect server if there is a connection error
+        cnx_historical = None
+        cursor_historical = None
+        try:
+            cnx_historical = mysql.connector.connect(**config.myems_historical_db)
+            cursor_historical = cnx_historical.cursor()
+        except Exception as e:
+            logger.error("Error at the begin of check_analog_value.process " + str(e))
+            if cursor_historical:
+                cursor_historical.close()
+            if cnx_historical:
+                cnx_historical.close()
+            time.sleep(60)
+            continue
+
+        # Note:
+        # the default value of unchecked values' is_bad property is NULL
+        # if a value is checked and the result is bad then is_bad would be set to 1
+        # else if a value is checked and the result is good then is_bad would be set to 0
+
+        ################################################################################################################
+        # Step 1: get the analog value points, the cleaning rules and the watermark of each point.
+        ################################################################################################################
+        # the rules are loaded in every cycle, so that changes of the rules take effect without restart
+        rules = analog_value_rules.load_rules(logger, config.analog_value_rules_file)
+
+        cnx_system = None
+        cursor_system = None
+        point_dict = dict()
+        try:
+            cnx_system = mysql.connector.connect(**config.myems_system_db)
+            cursor_system = cnx_system.cursor()
+
+            query = (" SELECT id, units, high_limit, low_limit "
+                     " FROM tbl_points "
+                     " WHERE object_type='ANALOG_VALUE' ")
+            cursor_system.execute(query)
+            rows_points = cursor_system.fetchall()
+
+            if rows_points is not None and len(rows_points) > 0:
+                for row in rows_points:
+                    rule_list = analog_value_rules.get_point_rules(rules, row[0], row[1])
+                    # points without rules are not checked
+                    if len(rule_list) == 0:
+                        continue
+                    point_dict[row[0]] = {"high_limit": row[2],
+                                          "low_limit": row[3],
+                                          "rule_list": rule_list,
+                                          "context_size": analog_value_rules.get_context_size(rule_list)}
+        except Exception as e:
+            logger.error("Error in step 1.1 of check_analog_value.process " + str(e))
+            if cursor_historical:
+                cursor_historical.close()
+            if cnx_historical:
+                cnx_historical.close()
+            time.sleep(60)
+            continue
+        finally:
+            if cursor_system:
+                cursor_system.close()
+            if cnx_system:
+                cnx_system.close()
+
+        watermark_dict = dict()
+        try:
+            query = (" SELECT point_id, utc_date_time "
+                     " FROM tbl_analog_value_watermarks ")
+            cursor_historical.execute(query)
+            rows_watermarks = cursor_historical.fetchall()
+            if rows_watermarks is not None and len(rows_watermarks) > 0:
+                for row in rows_watermarks:
+                    watermark_dict[row[0]] = row[1]
+        except Exception as e:
+            logger.error("Error in step 1.2 of check_analog_value.process " + str(e))
+            if cursor_historical:
+                cursor_historical.close()
+            if cnx_historical:
+                cnx_historical.close()
+            time.sleep(60)
+            continue
+
+        # points without watermark are checked from the start datetime
+        start_datetime_utc = datetime.strptime(config.start_datetime_utc,
+                                               '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+        is_connection_error = False
+        bad_list = list()
+        slot_list = list()
+        watermark_list = list()
+        point_id_list = list(point_dict.keys())
+        for index, point_id in enumerate(point_id_list):
+            point = point_dict[point_id]
+            min_datetime = watermark_dict.get(point_id, start_datetime_utc)
+
+            while True:
+                ########################################################################################################
+                # Step 2: get the previous good values of the point as context and the new values in chunks.
+                # NOTE: bad values are not used as neighbours of the new values
+                ########################################################################################################
+                try:
+                    rows_context = list()
+                    if point['context_size'] > 0:
+                        query = (" SELECT id, utc_date_time, actual_value "
+                                 " FROM tbl_analog_value "
+                                 " WHERE point_id = %s AND utc_date_time < %s AND is_bad = 0 "
+                                 " ORDER BY utc_date_time DESC "
+                                 " LIMIT %s ")
+                        cursor_historical.execute(query, (point_id, min_datetime, point['context_size'],))
+                        rows_context = cursor_historical.fetchall()
+                        rows_context = list(reversed(rows_context)) if rows_context is not None else list()
+
+                    query = (" SELECT id, utc_date_time, actual_value "
+                             " FROM tbl_analog_value "
+                             " WHERE point_id = %s AND utc_date_time >= %s AND is_bad IS NULL "
+                             " ORDER BY utc_date_time "
+                             " LIMIT %s ")
+                    cursor_historical.execute(query, (point_id, min_datetime, config.fetch_size,))
+                    rows_analog_values = cursor_historical.fetchall()
+                    if rows_analog_values is None:
+                        rows_analog_values = list()
+                except Exception as e:
+                    logger.error("Error in step 2 of check_analog_value.process " + str(e))
+                    is_connection_error = True
+                    break
+
+                # the last new value is checked in the next cycle together with its next value
+                if len(rows_analog_values) < 2:
+                    break
+
+                ########################################################################################################
+                # Step 3: apply the cleaning rules of the point over the context and the new values.
+                ########################################################################################################
+                row_list = rows_context + rows_analog_values
+                bad_index_list = analog_value_rules.apply_rules(point['rule_list'],
+                                                                [float(row[2]) for row in row_list],
+                                                                [row[1] for row in row_list],
+                                                                point)
+                point_bad_list = [row_list[i][0] for i in bad_index_list
+                                  if len(rows_context) <= i < len(row_list) - 1]
+                if len(point_bad_list) > 0:
+                    logger.debug("Bad analog values of point %s: %s", point_id, point_bad_list)
+
+                max_datetime = rows_analog_values[-1][1]
+                bad_list.extend(point_bad_list)
+                slot_list.append((point_id, rows_analog_values[0][1], max_datetime))
+                watermark_list.append((point_id, max_datetime))
+                min_datetime = max_datetime
+
+                is_last_chunk = len(rows_analog_values) < config.fetch_size
+                if is_last_chunk and len(slot_list) < TAG_BATCH_SIZE and index < len(point_id_list) - 1:
+                    break
+
+                ########################################################################################################
+                # Step 4: tag the is_bad property of analog values and save the watermarks of points in the batch.
+                # NOTE: the batch is tagged before the next chunk of the point is fetched.
+                ########################################################################################################
+                try:
+                    tag_values(cnx_historical, cursor_historical, bad_list, slot_list, watermark_list)
+                except Exception as e:
+                    logger.error("Error in step 4 of check_analog_value.process " + str(e))
+                    is_connection_error = True
+                    break
+                bad_list = list()
+                slot_list = list()
+                watermark_list = list()
+
+                if is_last_chunk:
+                    break
+
+            if is_connection_error:
+                break
+
+        # tag the rest of the batch if the last points have no new values
+        if not is_connection_error and len(slot_list) > 0:
+            try:
+                tag_values(cnx_historical, cursor_historical, bad_list, slot_list, watermark_list)
+            except Exception as e:
+                logger.error("Error in step 4 of check_analog_value.process " + str(e))
+                is_connection_error = True
+
+        if cursor_historical:
+            cursor_historical.close()
+        if cnx_historical:
+            cnx_historical.close()
+
+        if is_connection_error:
+            time.sleep(60)
+            continue
+
+        time.sleep(900)
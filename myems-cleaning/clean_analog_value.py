@@ -5,6 +5,7 @@ import mysql.connector
 import schedule
 
 import config
+import retention
 
 
 def job(logger):
@@ -24,10 +25,7 @@ def job(logger):
 
     expired_utc = datetime.utcnow() - timedelta(days=config.live_in_days)
     try:
-        cursor_historical.execute(" DELETE "
-                                  " FROM tbl_analog_value "
-                                  " WHERE utc_date_time < %s ", (expired_utc,))
-        cnx_historical.commit()
+        retention.delete_expired_values(logger, cnx_historical, cursor_historical, 'tbl_analog_value', expired_utc)
     except Exception as e:
         logger.error("Error in delete_expired_trend process " + str(e))
     finally:
@@ -22,9 +22,40 @@ myems_historical_db = {
 # NOTE: By default, energy values in historical db will never be deleted automatically.
 live_in_days = config('LIVE_IN_DAYS', default=365, cast=int)
 
+# indicates how expired analog values and digital values are deleted
+# if the table is partitioned by day, expired partitions are dropped and partitions are created days ahead,
+# else expired values are deleted in batches with a pause between batches
+retention = {
+    'delete_batch_size': config('RETENTION_DELETE_BATCH_SIZE', default=10000, cast=int),
+    'delete_throttle_in_seconds': config('RETENTION_DELETE_THROTTLE_IN_SECONDS', default=0.5, cast=float),
+    'partitions_ahead_in_days': config('RETENTION_PARTITIONS_AHEAD_IN_DAYS', default=7, cast=int),
+}
+
 # indicates from when (in UTC timezone) to clean if all is_bad properties are null
 # format string: "%Y-%m-%d %H:%M:%S"
 start_datetime_utc = config('START_DATETIME_UTC', default='2021-12-31 16:00:00')
 
+# indicates how many rows are fetched at a time when streaming large scans of historical values
+fetch_size = config('FETCH_SIZE', default=10000, cast=int)
+
+# indicates the number of processes to clean energy values
+# points are partitioned into shards by point_id, and each shard is cleaned by its own process
+clean_energy_value_shards = config('CLEAN_ENERGY_VALUE_SHARDS', default=1, cast=int)
+
+# indicates the JSON file of the cleaning rules of analog values, analog values are not checked without the file
+# see analog_value_rules.py for the rules and the format of the file
+analog_value_rules_file = config('ANALOG_VALUE_RULES_FILE', default='analog_value_rules.json')
+
 # indicates if the program is in debug mode
 is_debug = config('IS_DEBUG', default=False, cast=bool)
+
+# indicates how the supervisor starts and restarts worker processes
+# worker processes are started one after another in start interval to spread the start-up storm,
+# and a worker process terminated unexpectedly is restarted with exponential backoff from initial to max,
+# the backoff is reset if the restarted process has run longer than stable time
+supervisor = {
+    'start_interval_in_seconds': config('SUPERVISOR_START_INTERVAL_IN_SECONDS', default=1.0, cast=float),
+    'backoff_initial_in_seconds': config('SUPERVISOR_BACKOFF_INITIAL_IN_SECONDS', default=5.0, cast=float),
+    'backoff_max_in_seconds': config('SUPERVISOR_BACKOFF_MAX_IN_SECONDS', default=600.0, cast=float),
+    'stable_in_seconds': config('SUPERVISOR_STABLE_IN_SECONDS', default=600.0, cast=float),
+}
@@ -1,10 +1,12 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from multiprocessing import Process
 
+import check_analog_value
 import clean_analog_value
 import clean_digital_value
 import clean_energy_value
+import config
+from supervisor import Supervisor
 
 
 def main():
@@ -26,12 +28,26 @@ def main():
     # send logging output to sys.stderr
     logger.addHandler(logging.StreamHandler())
 
+    # worker processes terminated unexpectedly are restarted with exponential backoff
+    supervisor = Supervisor(logger,
+                            config.supervisor['start_interval_in_seconds'],
+                            config.supervisor['backoff_initial_in_seconds'],
+                            config.supervisor['backoff_max_in_seconds'],
+                            config.supervisor['stable_in_seconds'])
+
     # clean analog values
-    Process(target=clean_analog_value.process, args=(logger,)).start()
+    supervisor.add('clean_analog_value', clean_analog_value.process, (logger,))
+    # check analog values with cleaning rules
+    supervisor.add('check_analog_value', check_analog_value.process, (logger,))
     # clean digital values
-    Process(target=clean_digital_value.process, args=(logger,)).start()
-    # clean energy values
-    Process(target=clean_energy_value.process, args=(logger,)).start()
+    supervisor.add('clean_digital_value', clean_digital_value.process, (logger,))
+    # clean energy values, one process for each shard of points
+    for shard_index in range(config.clean_energy_value_shards):
+        supervisor.add('clean_energy_value_' + str(shard_index), clean_energy_value.process,
+                       (logger, shard_index, config.clean_energy_value_shards))
+
+    # watch worker processes forever
+    supervisor.run_forever()
 
 
 if __name__ == '__main__':
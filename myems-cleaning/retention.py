@@ -0,0 +1,104 @@
+import time
+from datetime import date, datetime, timedelta
+
+import config
+
+########################################################################################################################
+# Retention of trend values
+# If the table is partitioned by day (see database/upgrade/partition_historical_db.sql),
+# expired partitions are dropped as a whole, and partitions of the next days are created ahead of time.
+# Else expired values are deleted in small batches with a pause between batches,
+# so that no single statement holds locks on the table or bloats the undo log for long.
+########################################################################################################################
+
+# TO_DAYS of MySQL is the proleptic Gregorian ordinal of python plus 365
+TO_DAYS_OFFSET = 365
+
+
+def to_days(d):
+    return d.toordinal() + TO_DAYS_OFFSET
+
+
+def get_partition_list(cursor_historical, table_name):
+    """
+    :return: list of (partition name, partition description) in order,
+             the description is the TO_DAYS upper bound or 'MAXVALUE', empty list if the table is not partitioned
+    """
+    cursor_historical.execute(" SELECT PARTITION_NAME, PARTITION_DESCRIPTION "
+                              " FROM information_schema.PARTITIONS "
+                              " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                              " ORDER BY PARTITION_ORDINAL_POSITION ", (table_name,))
+    rows = cursor_historical.fetchall()
+    if rows is None:
+        return list()
+    return [(row[0], row[1]) for row in rows if row[0] is not None]
+
+
+def rotate_partitions(logger, cursor_historical, table_name, partition_list, expired_utc):
+    """
+    Drop expired partitions and create partitions of the next days
+    :return: number of partitions dropped
+    """
+    expired_days = to_days(expired_utc.date())
+    # all values of a partition are expired if its upper bound is not later than the expired date
+    expired_name_list = [name for name, description in partition_list
+                         if description != 'MAXVALUE' and int(description) <= expired_days]
+    # keep at least one range partition
+    if len(expired_name_list) == len(partition_list):
+        expired_name_list = expired_name_list[:-1]
+    if len(expired_name_list) > 0:
+        cursor_historical.execute(" ALTER TABLE " + table_name + " DROP PARTITION " + ', '.join(expired_name_list))
+        logger.info("Dropped partitions " + ', '.join(expired_name_list) + " of " + table_name)
+
+    # create daily partitions until days ahead
+    range_list = [(name, int(description)) for name, description in partition_list if description != 'MAXVALUE']
+    maxvalue_name_list = [name for name, description in partition_list if description == 'MAXVALUE']
+    if len(range_list) == 0:
+        return len(expired_name_list)
+    last_date = date.fromordinal(range_list[-1][1] - TO_DAYS_OFFSET)
+    ahead_date = datetime.utcnow().date() + timedelta(days=config.retention['partitions_ahead_in_days'])
+    definition_list = list()
+    while last_date <= ahead_date:
+        definition_list.append("PARTITION p" + last_date.strftime('%Y%m%d') +
+                               " VALUES LESS THAN (" + str(to_days(last_date + timedelta(days=1))) + ")")
+        last_date += timedelta(days=1)
+    if len(definition_list) > 0:
+        if len(maxvalue_name_list) > 0:
+            # the partition of MAXVALUE is empty if partitions are created ahead of time, so it is cheap to split
+            definition_list.append("PARTITION " + maxvalue_name_list[0] + " VALUES LESS THAN MAXVALUE")
+            cursor_historical.execute(" ALTER TABLE " + table_name +
+                                      " REORGANIZE PARTITION " + maxvalue_name_list[0] +
+                                      " INTO (" + ', '.join(definition_list) + ")")
+        else:
+            cursor_historical.execute(" ALTER TABLE " + table_name +
+                                      " ADD PARTITION (" + ', '.join(definition_list) + ")")
+    return len(expired_name_list)
+
+
+def delete_in_batches(cnx_historical, cursor_historical, table_name, expired_utc):
+    """
+    Delete expired values in batches, each batch is committed in its own transaction
+    :return: number of values deleted
+    """
+    deleted_rows = 0
+    while True:
+        cursor_historical.execute(" DELETE "
+                                  " FROM " + table_name +
+                                  " WHERE utc_date_time < %s "
+                                  " LIMIT %s ", (expired_utc, config.retention['delete_batch_size']))
+        rowcount = cursor_historical.rowcount
+        cnx_historical.commit()
+        deleted_rows += rowcount
+        if rowcount < config.retention['delete_batch_size']:
+            return deleted_rows
+        # give way to inserts of acquisition
+        time.sleep(config.retention['delete_throttle_in_seconds'])
+
+
+def delete_expired_values(logger, cnx_historical, cursor_historical, table_name, expired_utc):
+    partition_list = get_partition_list(cursor_historical, table_name)
+    if len(partition_list) > 0:
+        rotate_partitions(logger, cursor_historical, table_name, partition_list, expired_utc)
+    else:
+        deleted_rows = delete_in_batches(cnx_historical, cursor_historical, table_name, expired_utc)
+        logger.info("Deleted " + str(deleted_rows) + " values of " + table_name)
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from analog_value_rules import RULES, apply_rules, check_limit, check_rate_of_change, check_spike, \
+    check_stuck_value, check_z_score, get_context_size, get_point_rules, load_rules
+
+
+########################################################################################################################
+# Unit tests of the cleaning rules of analog values
+# Each rule is checked on small hand-built windows of values,
+# and z_score is checked against the mean and the standard deviation computed window by window.
+#
+# Usage: python3 -m unittest test_analog_value_rules
+########################################################################################################################
+
+POINT = {'high_limit': 100.0, 'low_limit': 0.0}
+
+
+def minutes(length, start=datetime(2024, 1, 1)):
+    return [start + timedelta(minutes=i) for i in range(length)]
+
+
+class RulesTest(unittest.TestCase):
+
+    def test_limit(self):
+        value_list = [50.0, 101.0, -1.0, 100.0, 0.0]
+        self.assertEqual(check_limit(value_list, minutes(5), POINT, {'rule': 'limit'}), [1, 2])
+        # the limits in parameters override the limits of the point
+        self.assertEqual(check_limit(value_list, minutes(5), POINT, {'rule': 'limit', 'high_limit': 60}), [1, 2, 3])
+
+    def test_rate_of_change(self):
+        parameters = {'rule': 'rate_of_change', 'max_change_per_minute': 1}
+        # values after a step are bad until the change allowed since the last good value catches up with the step
+        self.assertEqual(check_rate_of_change([0.0, 0.5, 3.0, 3.5, 3.5], minutes(5), POINT, parameters), [2, 3])
+        # the value after a spike is compared with the value before the spike, not with the spike
+        self.assertEqual(check_rate_of_change([10.0, 10.5, 30.0, 11.0, 11.5], minutes(5), POINT, parameters), [2])
+        self.assertEqual(check_rate_of_change([10.0, 30.0, 30.0, 10.5], minutes(4), POINT, parameters), [1, 2])
+        # the change is allowed in proportion to the time between values
+        datetime_list = [datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 10)]
+        self.assertEqual(check_rate_of_change([0.0, 9.0], datetime_list, POINT, parameters), list())
+        # values at the same time are compared as if they were one second apart
+        datetime_list = [datetime(2024, 1, 1), datetime(2024, 1, 1)]
+        self.assertEqual(check_rate_of_change([0.0, 0.1], datetime_list, POINT, parameters), [1])
+        self.assertEqual(check_rate_of_change([1.0], minutes(1), POINT, parameters), list())
+
+    def test_stuck_value(self):
+        parameters = {'rule': 'stuck_value', 'max_repeats': 2}
+        # a value repeated max_repeats times after its first occurrence is good, the next repeat is bad
+        self.assertEqual(check_stuck_value([1.0, 1.0, 1.0, 2.0], minutes(4), POINT, parameters), list())
+        self.assertEqual(check_stuck_value([1.0, 1.0, 1.0, 1.0, 1.0, 2.0], minutes(6), POINT, parameters), [3, 4])
+        self.assertEqual(check_stuck_value([1.0, 1.0, 1.0, 2.0, 2.0, 2.0, 2.0], minutes(7), POINT, parameters),
+                         [6])
+        # values within tolerance of the previous values are repeats
+        parameters = {'rule': 'stuck_value', 'max_repeats': 2, 'tolerance': 0.06}
+        self.assertEqual(check_stuck_value([1.0, 1.05, 1.1, 1.15, 2.0], minutes(5), POINT, parameters), [3])
+        self.assertEqual(check_stuck_value(list(), list(), POINT, parameters), list())
+
+    def test_spike(self):
+        parameters = {'rule': 'spike', 'threshold': 5}
+        self.assertEqual(check_spike([10.0, 20.0, 10.5, 11.0], minutes(4), POINT, parameters), [1])
+        self.assertEqual(check_spike([10.0, 0.0, 10.5, 11.0], minutes(4), POINT, parameters), [1])
+        # a step is not a spike
+        self.assertEqual(check_spike([10.0, 20.0, 20.0, 20.0], minutes(4), POINT, parameters), list())
+        # the first value and the last value have no neighbour on one side
+        self.assertEqual(check_spike([30.0, 10.0, 10.0, 30.0], minutes(4), POINT, parameters), list())
+
+    def test_z_score(self):
+        parameters = {'rule': 'z_score', 'window': 3, 'threshold': 4.0}
+        # there are no values with a full window of previous values
+        self.assertEqual(check_z_score([1.0, 2.0, 100.0], minutes(3), POINT, parameters), list())
+        # values after a window of zero variance are not checked
+        self.assertEqual(check_z_score([1.0, 1.0, 1.0, 100.0], minutes(4), POINT, parameters), list())
+        # the mean of [1, 2, 3] is 2 and the standard deviation is 0.816
+        self.assertEqual(check_z_score([1.0, 2.0, 3.0, 100.0], minutes(4), POINT, parameters), [3])
+        self.assertEqual(check_z_score([1.0, 2.0, 3.0, 5.0], minutes(4), POINT, parameters), list())
+        self.assertEqual(check_z_score([1.0, 2.0, 3.0, 5.5], minutes(4), POINT, parameters), [3])
+        self.assertEqual(check_z_score([1.0, 2.0, 100.0], minutes(3), POINT, {'rule': 'z_score', 'window': 1}),
+                         list())
+
+    def test_z_score_large_values(self):
+        # values far from zero with small deviations, where naive prefix sums of squares lose the precision
+        random_generator = random.Random(20240707)
+        window = 20
+        threshold = 3.0
+        value_list = [1e9 + random_generator.gauss(0, 1) for _ in range(500)]
+        for i in range(50, 500, 50):
+            value_list[i] += 10
+        expected = [i for i in range(window, len(value_list))
+                    if statistics.pstdev(value_list[i - window:i]) > 0
+                    and abs(value_list[i] - statistics.fmean(value_list[i - window:i])) >
+                    threshold * statistics.pstdev(value_list[i - window:i])]
+        parameters = {'rule': 'z_score', 'window': window, 'threshold': threshold}
+        self.assertEqual(check_z_score(value_list, minutes(len(value_list)), POINT, parameters), expected)
+        self.assertTrue(set(range(50, 500, 50)).issubset(expected))
+
+    def test_apply_rules(self):
+        rule_list = [{'rule': 'limit'}, {'rule': 'spike', 'threshold': 5}, {'rule': 'stuck_value', 'max_repeats': 1}]
+        value_list = [10.0, 30.0, 10.0, 10.0, 10.0, 120.0]
+        self.assertEqual(apply_rules(rule_list, value_list, minutes(6), POINT), [1, 4, 5])
+        self.assertEqual(apply_rules(list(), value_list, minutes(6), POINT), list())
+
+
+class ConfigurationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_analog_value_rules')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, content):
+        file_name = os.path.join(self.directory.name, 'analog_value_rules.json')
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return file_name
+
+    def test_load_rules(self):
+        file_name = self.write(json.dumps({
+            'default': [{'rule': 'limit'}, {'rule': 'unknown'}],
+            'units': {'℃': [{'rule': 'spike', 'threshold': 10}, {'rule': 'spike'}]},
+            'points': {'1001': [{'rule': 'stuck_value', 'max_repeats': 120}, {'rule': 'rate_of_change'}]}}))
+        with self.assertLogs(self.logger, level='ERROR') as logs:
+            rules = load_rules(self.logger, file_name)
+        # rules with unknown names or missing parameters are dropped
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(rules, {'default': [{'rule': 'limit'}],
+                                 'units': {'℃': [{'rule': 'spike', 'threshold': 10}]},
+                                 'points': {1001: [{'rule': 'stuck_value', 'max_repeats': 120}]}})
+
+    def test_load_missing_or_invalid_rules(self):
+        self.assertEqual(load_rules(self.logger, os.path.join(self.directory.name, 'missing.json')), dict())
+        with self.assertLogs(self.logger, level='ERROR'):
+            self.assertEqual(load_rules(self.logger, self.write('{"default": [')), dict())
+
+    def test_get_point_rules(self):
+        rules = {'default': [{'rule': 'limit'}],
+                 'units': {'℃': [{'rule': 'spike', 'threshold': 10}], 'kW': list()},
+                 'points': {1001: [{'rule': 'stuck_value', 'max_repeats': 120}]}}
+        # the rules of the point win over the rules of its units and the default rules
+        self.assertEqual(get_point_rules(rules, 1001, '℃'), [{'rule': 'stuck_value', 'max_repeats': 120}])
+        self.assertEqual(get_point_rules(rules, 1002, '℃'), [{'rule': 'spike', 'threshold': 10}])
+        self.assertEqual(get_point_rules(rules, 1002, 'V'), [{'rule': 'limit'}])
+        # an empty rule list disables checking
+        self.assertEqual(get_point_rules(rules, 1002, 'kW'), list())
+        self.assertEqual(get_point_rules(dict(), 1001, '℃'), list())
+
+    def test_get_context_size(self):
+        self.assertEqual(get_context_size(list()), 0)
+        self.assertEqual(get_context_size([{'rule': 'limit'}]), 0)
+        self.assertEqual(get_context_size([{'rule': 'limit'}, {'rule': 'spike', 'threshold': 1}]), 1)
+        self.assertEqual(get_context_size([{'rule': 'stuck_value', 'max_repeats': 5}]), 6)
+        self.assertEqual(get_context_size([{'rule': 'z_score'}, {'rule': 'stuck_value', 'max_repeats': 5}]), 60)
+        self.assertEqual(get_context_size([{'rule': 'z_score', 'window': 3}]), 3)
+        self.assertEqual(set(RULES.keys()), {'limit', 'rate_of_change', 'stuck_value', 'spike', 'z_score'})
+
+
+if __name__ == '__main__':
+    unittest.main()
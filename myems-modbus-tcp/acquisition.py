@@ -1,14 +1,17 @@
-import json
-import math
+import os
 import telnetlib3
 import asyncio
 import time
 from datetime import datetime
-from decimal import Decimal
 import mysql.connector
 from modbus_tk import modbus_tcp
 import config
-from byte_swap import byte_swap_32_bit, byte_swap_64_bit
+from deadband import DeadbandFilter
+from read_plan import compile_point, point_read_block
+from slave_health import SlaveHealth
+from poll_schedule import advance, build_schedule, get_due_rate_classes, get_next_due_time
+from spool import Spool
+from telemetry import Telemetry
 
 
 ########################################################################################################################
@@ -19,16 +22,354 @@ async def check_connectivity(host, port):
     # Close the connection
     writer.close()
 
+
+########################################################################################################################
+# Get point list of the data source and compile the points into read points
+# Invalid points are rejected once at load time
+########################################################################################################################
+def get_point_list(logger, data_source_id, cursor_system_db):
+    query = (" SELECT id, name, object_type, is_trend, ratio, address "
+             " FROM tbl_points "
+             " WHERE data_source_id = %s AND is_virtual = 0 "
+             " ORDER BY id ")
+    cursor_system_db.execute(query, (data_source_id,))
+    rows_point = cursor_system_db.fetchall()
+
+    point_list = list()
+    if rows_point is None or len(rows_point) == 0:
+        return point_list
+
+    for row_point in rows_point:
+        try:
+            point_list.append(compile_point(row_point))
+        except ValueError as e:
+            logger.error('Error in step 2.3 of acquisition process: Data Source(ID=%s), Point(ID=%s) %s',
+                         data_source_id, row_point[0], str(e))
+            # invalid point is found
+            # go to next point
+            continue
+
+    return point_list
+
+
+########################################################################################################################
+# Get checksum of the point list of the data source
+# It is cheap to poll and it changes if any point of the data source is added, removed or modified
+########################################################################################################################
+def get_point_list_checksum(data_source_id, cursor_system_db):
+    query = (" SELECT COUNT(*), BIT_XOR(CRC32(CONCAT_WS('#', id, name, object_type, is_trend, ratio, address))) "
+             " FROM tbl_points "
+             " WHERE data_source_id = %s AND is_virtual = 0 ")
+    cursor_system_db.execute(query, (data_source_id,))
+    row = cursor_system_db.fetchone()
+    if row is None:
+        return None
+    return row[0], row[1]
+
+
+########################################################################################################################
+# Append the point value to the value list of its object type
+# The ratio of the point is applied and the bounds are checked by ReadBlock.decode for all points of the block
+########################################################################################################################
+def append_point_value(logger, point, value, analog_value_list, energy_value_list, digital_value_list,
+                       deadband_filter=None):
+    if value is None:
+        logger.error(" Error in step 3.4 of acquisition process:\n"
+                     " invalid result: not a number or out of the bounds of the column "
+                     " for point_id: " + str(point.id))
+        # invalid result
+        return
+
+    if point.object_type == 'ANALOG_VALUE':
+        # the latest value is always updated, only the trend value is suppressed by the deadband
+        analog_value_list.append({'point_id': point.id,
+                                  'is_trend': point.is_trend and
+                                  (deadband_filter is None or deadband_filter.is_written(point, value)),
+                                  'value': value})
+    elif point.object_type == 'ENERGY_VALUE':
+        energy_value_list.append({'point_id': point.id,
+                                  'is_trend': point.is_trend,
+                                  'value': value})
+    elif point.object_type == 'DIGITAL_VALUE':
+        digital_value_list.append({'point_id': point.id,
+                                   'is_trend': point.is_trend and
+                                   (deadband_filter is None or deadband_filter.is_written(point, value)),
+                                   'value': value})
+
+
+########################################################################################################################
+# Check if an error is caused by a lost or failed connection to the database,
+# only point values failed by such errors are spooled, the other errors fail again if the point values are replayed
+########################################################################################################################
+def is_connection_error(e):
+    return isinstance(e, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError))
+
+
+########################################################################################################################
+# Bulk insert point values and update latest values in historical database
+# All point values of one cycle are written in a single transaction,
+# trend values are inserted with multi-row inserts,
+# and latest values are upserted by the unique key on point_id of the latest tables.
+########################################################################################################################
+def write_point_values(logger, cnx_historical_db, cursor_historical_db, current_datetime_utc,
+                       analog_value_list, energy_value_list, digital_value_list):
+    """
+    :return: False if point values were not written because the connection to the historical database failed,
+             then they should be spooled, else True
+    """
+    try:
+        for table_name, point_value_list in (('tbl_analog_value', analog_value_list),
+                                             ('tbl_energy_value', energy_value_list),
+                                             ('tbl_digital_value', digital_value_list)):
+            if len(point_value_list) == 0:
+                continue
+
+            trend_values = [(point_value['point_id'], current_datetime_utc, point_value['value'])
+                            for point_value in point_value_list if point_value['is_trend']]
+            if len(trend_values) > 0:
+                add_values = (" INSERT INTO " + table_name + " (point_id, utc_date_time, actual_value) "
+                              " VALUES (%s, %s, %s) ")
+                cursor_historical_db.executemany(add_values, trend_values)
+
+            latest_values = [(point_value['point_id'], current_datetime_utc, point_value['value'])
+                             for point_value in point_value_list]
+            upsert_values = (" INSERT INTO " + table_name + "_latest (point_id, utc_date_time, actual_value) "
+                             " VALUES (%s, %s, %s) "
+                             " ON DUPLICATE KEY UPDATE "
+                             " utc_date_time = VALUES(utc_date_time), actual_value = VALUES(actual_value) ")
+            cursor_historical_db.executemany(upsert_values, latest_values)
+
+        cnx_historical_db.commit()
+    except Exception as e:
+        try:
+            cnx_historical_db.rollback()
+        except Exception:
+            pass
+        if is_connection_error(e):
+            logger.error("Error in step 4.3 of acquisition process " + str(e))
+            return False
+        # the point values would fail again if they were spooled and replayed
+        logger.error("Error in step 4.3 of acquisition process, point values of the cycle are discarded " + str(e))
+
+    return True
+
+
+########################################################################################################################
+# Replay spooled point values in bulk in timestamp order
+# At most spool_replay_max_batches batches are replayed in each cycle, so that a long backlog does not delay polling.
+# Latest values are only updated by newer values, because point values of later cycles may be written
+# before the backlog is replayed.
+# A batch failed for reasons other than a lost connection is quarantined, so that it does not block the others.
+########################################################################################################################
+def replay_spool(logger, cnx_historical_db, cursor_historical_db, spool):
+    """
+    :return: False if the connection to the historical database failed, else True
+    """
+    for _ in range(config.spool_replay_max_batches):
+        if spool.pending_records <= 0:
+            break
+        rows = spool.read(config.spool_replay_batch_size)
+        if len(rows) == 0:
+            break
+
+        # table name -> (trend values, point id -> latest value)
+        value_dict = dict()
+        for row_id, table_name, point_id, utc_date_time, actual_value, is_trend in rows:
+            if table_name not in value_dict:
+                value_dict[table_name] = (list(), dict())
+            if is_trend:
+                value_dict[table_name][0].append((point_id, utc_date_time, actual_value))
+            value_dict[table_name][1][point_id] = (point_id, utc_date_time, actual_value)
+
+        try:
+            for table_name, (trend_values, latest_value_dict) in value_dict.items():
+                if len(trend_values) > 0:
+                    add_values = (" INSERT INTO " + table_name + " (point_id, utc_date_time, actual_value) "
+                                  " VALUES (%s, %s, %s) ")
+                    cursor_historical_db.executemany(add_values, trend_values)
+                # NOTE: actual_value is assigned before utc_date_time, so that it is compared with the old date time
+                upsert_values = (" INSERT INTO " + table_name + "_latest (point_id, utc_date_time, actual_value) "
+                                 " VALUES (%s, %s, %s) "
+                                 " ON DUPLICATE KEY UPDATE "
+                                 " actual_value = IF(VALUES(utc_date_time) >= utc_date_time, "
+                                 "                   VALUES(actual_value), actual_value), "
+                                 " utc_date_time = GREATEST(utc_date_time, VALUES(utc_date_time)) ")
+                cursor_historical_db.executemany(upsert_values, list(latest_value_dict.values()))
+            cnx_historical_db.commit()
+        except Exception as e:
+            try:
+                cnx_historical_db.rollback()
+            except Exception:
+                pass
+            if is_connection_error(e):
+                logger.error("Error in step 4.4 of acquisition process " + str(e))
+                return False
+            quarantined = spool.quarantine(rows[-1][0])
+            logger.error("Error in step 4.4 of acquisition process, quarantined %s spooled records %s",
+                         quarantined, str(e))
+            continue
+
+        spool.remove(rows[-1][0])
+        logger.info("Replayed %s spooled records, %s records pending ", len(rows), spool.pending_records)
+
+    return True
+
+
+########################################################################################################################
+# Quarantine slaves timed out and release slaves responded
+########################################################################################################################
+def update_slave_health(logger, host, port, slave_health, telemetry, timed_out_slave_set, responded_slave_set):
+    if slave_health is None:
+        return
+    now = time.monotonic()
+    for slave_id in responded_slave_set - timed_out_slave_set:
+        slave_health.record_success(slave_id)
+    for slave_id in timed_out_slave_set:
+        quarantine_in_seconds = slave_health.record_timeout(slave_id, now)
+        telemetry.increase('slave_quarantines_total')
+        logger.error("Slave quarantined for " + str(quarantine_in_seconds) + " seconds" +
+                     " host:" + host + " port:" + str(port) + " slave_id:" + str(slave_id))
+    telemetry.gauges['quarantined_slaves'] = slave_health.get_quarantined_slaves(now)
+
+
+########################################################################################################################
+# Read point values of blocks from Modbus slaves
+# Points in a block are read with one request, and they are read one by one if the block read failed.
+# A slave timed out is skipped for the rest of the cycle and quarantined, while the other slaves are still read.
+########################################################################################################################
+def read_point_values(logger, master, host, port, block_list, telemetry, deadband_filter, slave_health=None):
+    """
+    :return: tuple of is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list
+    """
+    energy_value_list = list()
+    analog_value_list = list()
+    digital_value_list = list()
+    now = time.monotonic()
+    # slaves timed out in this cycle, the rest of their blocks are skipped while the other slaves are still read
+    timed_out_slave_set = set()
+    # slaves responded in this cycle
+    responded_slave_set = set()
+
+    # foreach block loop
+    for block in block_list:
+        # begin of foreach block loop
+        if block.slave_id in timed_out_slave_set:
+            continue
+        if slave_health is not None:
+            if not slave_health.is_available(block.slave_id, now):
+                # the slave is quarantined
+                continue
+            master.set_timeout(slave_health.get_timeout(block.slave_id))
+
+        # read registers of all points in the block with one request, and decode all point values at once
+        block_value_list = None
+        execute_start_time = time.monotonic()
+        try:
+            block_value_list = block.decode(master.execute(slave=block.slave_id,
+                                                           function_code=block.function_code,
+                                                           starting_address=block.offset,
+                                                           quantity_of_x=block.number_of_registers))
+            telemetry.observe('execute_seconds', time.monotonic() - execute_start_time, block.slave_id)
+            responded_slave_set.add(block.slave_id)
+        except Exception as e:
+            telemetry.increase('read_errors_total')
+            logger.error(str(e) +
+                         " host:" + host + " port:" + str(port) +
+                         " slave_id:" + str(block.slave_id) +
+                         " function_code:" + str(block.function_code) +
+                         " starting_address:" + str(block.offset) +
+                         " quantity_of_x:" + str(block.number_of_registers))
+
+            if 'timed out' in str(e):
+                telemetry.increase('timeouts_total')
+                timed_out_slave_set.add(block.slave_id)
+                # timeout error
+                # close the connection to discard the late response, it is reopened by the next request,
+                # and go to begin of foreach block loop to read blocks of the other slaves
+                master.close()
+                continue
+            # exception occurred when read the block, for example some registers in the gap are illegal,
+            # fall back to read point values one by one in this block
+
+        # foreach point loop
+        for index, point in enumerate(block.points):
+            # begin of foreach point loop
+            # read point value
+            try:
+                if block_value_list is not None:
+                    value = block_value_list[index]
+                else:
+                    point_block = point_read_block(point)
+                    execute_start_time = time.monotonic()
+                    point_result = master.execute(slave=point_block.slave_id,
+                                                  function_code=point_block.function_code,
+                                                  starting_address=point_block.offset,
+                                                  quantity_of_x=point_block.number_of_registers)
+                    telemetry.observe('execute_seconds', time.monotonic() - execute_start_time,
+                                      point.slave_id)
+                    responded_slave_set.add(point.slave_id)
+                    value = point_block.decode(point_result)[0]
+            except Exception as e:
+                telemetry.increase('read_errors_total')
+                logger.error(str(e) +
+                             " host:" + host + " port:" + str(port) +
+                             " slave_id:" + str(point.slave_id) +
+                             " function_code:" + str(point.function_code) +
+                             " starting_address:" + str(point.offset) +
+                             " quantity_of_x:" + str(point.number_of_registers) +
+                             " data_format:" + str(point.format) +
+                             " byte_swap:" + str(point.byte_swap))
+
+                if 'timed out' in str(e):
+                    telemetry.increase('timeouts_total')
+                    timed_out_slave_set.add(point.slave_id)
+                    # timeout error
+                    # close the connection to discard the late response, and break the foreach point loop
+                    master.close()
+                    break
+                else:
+                    # exception occurred when read register value,
+                    # go to begin of foreach point loop to process next point
+                    continue
+
+            telemetry.increase('points_read_total')
+            append_point_value(logger, point, value,
+                               analog_value_list, energy_value_list, digital_value_list, deadband_filter)
+
+        # end of foreach point loop
+
+    # end of foreach block loop
+
+    update_slave_health(logger, host, port, slave_health, telemetry, timed_out_slave_set, responded_slave_set)
+
+    # the connection is timed out if no slave responded while some slaves timed out
+    is_modbus_tcp_timed_out = len(timed_out_slave_set) > 0 and len(responded_slave_set) == 0
+    return is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list
+
+
 ########################################################################################################################
 # Acquisition Procedures
 # Step 1: Check connectivity to the host and port
 # Step 2: Get point list
-# Step 3: Read point values from Modbus slaves
-# Step 4: Bulk insert point values and update latest values in historical database
+# Step 3: Read point values from Modbus slaves in blocks
+# Step 4: Bulk insert point values and update latest values in historical database,
+#         or spool point values if the historical database is unavailable
+# Step 5: Reload point list if points of the data source were changed
 ########################################################################################################################
 
 
-def process(logger, data_source_id, host, port, interval_in_seconds):
+def process(logger, data_source_id, host, port, interval_in_seconds, telemetry_queue=None):
+    # point values are spooled to the local file when the historical database is unavailable
+    spool = Spool(os.path.join(config.spool_path, 'data_source_' + str(data_source_id) + '.sqlite3'),
+                  config.spool_max_records)
+    # trend values are reported by exception if deadbands are configured in point addresses
+    deadband_filter = DeadbandFilter(config.heartbeat_in_seconds)
+    # slaves timed out are quarantined while the other slaves of the data source are still read
+    slave_health = SlaveHealth(config.slave_timeout_in_seconds, config.slave_probe_timeout_in_seconds,
+                               config.slave_quarantine_in_seconds, config.slave_quarantine_max_in_seconds)
+    # counters and latency histograms are published to the main process after every cycle
+    telemetry = Telemetry(data_source_id, telemetry_queue)
+
     while True:
         # begin of the outermost while loop
 
@@ -63,12 +404,8 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
             continue
 
         try:
-            query = (" SELECT id, name, object_type, is_trend, ratio, address "
-                     " FROM tbl_points "
-                     " WHERE data_source_id = %s AND is_virtual = 0 "
-                     " ORDER BY id ")
-            cursor_system_db.execute(query, (data_source_id,))
-            rows_point = cursor_system_db.fetchall()
+            point_list_checksum = get_point_list_checksum(data_source_id, cursor_system_db)
+            point_list = get_point_list(logger, data_source_id, cursor_system_db)
         except Exception as e:
             logger.error("Error in step 2.2 of acquisition process: " + str(e))
             if cursor_system_db:
@@ -79,7 +416,7 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
             time.sleep(60)
             continue
 
-        if rows_point is None or len(rows_point) == 0:
+        if len(point_list) == 0:
             # there is no points for this data source
             logger.error("Point Not Found in Data Source (ID = %s), acquisition process terminated ", data_source_id)
             if cursor_system_db:
@@ -90,15 +427,9 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
             time.sleep(60)
             continue
 
-        # There are points for this data source
-        point_list = list()
-        for row_point in rows_point:
-            point_list.append({"id": row_point[0],
-                               "name": row_point[1],
-                               "object_type": row_point[2],
-                               "is_trend": row_point[3],
-                               "ratio": row_point[4],
-                               "address": row_point[5]})
+        # group points into rate classes by poll interval and plan block reads of each rate class once
+        rate_class_list = build_schedule(point_list, interval_in_seconds, config.block_read_max_gap, time.monotonic())
+        reload_checked_time = time.monotonic()
 
         ################################################################################################################
         # Step 3: Read point values from Modbus slaves
@@ -115,134 +446,35 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
                 cursor_historical_db.close()
             if cnx_historical_db:
                 cnx_historical_db.close()
-
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # go to begin of the outermost while loop
-            time.sleep(60)
-            continue
+            # keep reading point values, and point values will be spooled until the historical database recovers
+            cnx_historical_db = None
+            cursor_historical_db = None
 
         # connect to the Modbus data source
-        master = modbus_tcp.TcpMaster(host=host, port=port, timeout_in_sec=5.0)
-        master.set_timeout(5.0)
+        master = modbus_tcp.TcpMaster(host=host, port=port, timeout_in_sec=config.slave_timeout_in_seconds)
+        master.set_timeout(config.slave_timeout_in_seconds)
         print("Ready to connect to %s:%s ", host, port)
 
         # inner while loop to read all point values periodically
         while True:
             # begin of the inner while loop
-            is_modbus_tcp_timed_out = False
-            energy_value_list = list()
-            analog_value_list = list()
-            digital_value_list = list()
-
-            # TODO: update point list in another thread
-            # foreach point loop
-            for point in point_list:
-                # begin of foreach point loop
-                try:
-                    address = json.loads(point['address'])
-                except Exception as e:
-                    logger.error("Error in step 3.2 of acquisition process: Invalid point address in JSON " + str(e))
-                    continue
-
-                if 'slave_id' not in address.keys() \
-                        or 'function_code' not in address.keys() \
-                        or 'offset' not in address.keys() \
-                        or 'number_of_registers' not in address.keys() \
-                        or 'format' not in address.keys() \
-                        or 'byte_swap' not in address.keys() \
-                        or address['slave_id'] < 1 \
-                        or address['function_code'] not in (1, 2, 3, 4) \
-                        or address['offset'] < 0 \
-                        or address['number_of_registers'] < 0 \
-                        or len(address['format']) < 1 \
-                        or not isinstance(address['byte_swap'], bool):
-                    logger.error('Data Source(ID=%s), Point(ID=%s) Invalid address data.',
-                                 data_source_id, point['id'])
-                    # invalid point is found
-                    # go to begin of foreach point loop to process next point
-                    continue
-
-                # read point value
-                try:
-                    result = master.execute(slave=address['slave_id'],
-                                            function_code=address['function_code'],
-                                            starting_address=address['offset'],
-                                            quantity_of_x=address['number_of_registers'],
-                                            data_format=address['format'])
-                except Exception as e:
-                    logger.error(str(e) +
-                                 " host:" + host + " port:" + str(port) +
-                                 " slave_id:" + str(address['slave_id']) +
-                                 " function_code:" + str(address['function_code']) +
-                                 " starting_address:" + str(address['offset']) +
-                                 " quantity_of_x:" + str(address['number_of_registers']) +
-                                 " data_format:" + str(address['format']) +
-                                 " byte_swap:" + str(address['byte_swap']))
-
-                    if 'timed out' in str(e):
-                        is_modbus_tcp_timed_out = True
-                        # timeout error
-                        # break the foreach point loop
-                        break
-                    else:
-                        # exception occurred when read register value,
-                        # go to begin of foreach point loop to process next point
-                        continue
-
-                if result is None or not isinstance(result, tuple) or len(result) == 0:
-                    logger.error("Error in step 3.3 of acquisition process: \n"
-                                 " invalid result: None "
-                                 " for point_id: " + str(point['id']))
-                    # invalid result
-                    # go to begin of foreach point loop to process next point
-                    continue
-
-                if not isinstance(result[0], float) and not isinstance(result[0], int) or math.isnan(result[0]):
-                    logger.error(" Error in step 3.4 of acquisition process:\n"
-                                 " invalid result: not float and not int or not a number "
-                                 " for point_id: " + str(point['id']))
-                    # invalid result
-                    # go to begin of foreach point loop to process next point
-                    continue
-
-                if address['byte_swap']:
-                    if address['number_of_registers'] == 2:
-                        value = byte_swap_32_bit(result[0])
-                    elif address['number_of_registers'] == 4:
-                        value = byte_swap_64_bit(result[0])
-                    else:
-                        value = result[0]
-                else:
-                    value = result[0]
-
-                if point['object_type'] == 'ANALOG_VALUE':
-                    # Standard SQL requires that DECIMAL(18, 3) be able to store any value with 18 digits and
-                    # 3 decimals, so values that can be stored in the salary column range
-                    # from -999999999999999.999 to 999999999999999.999.
-                    if Decimal(-999999999999999.999) <= Decimal(value) <= Decimal(999999999999999.999):
-                        analog_value_list.append({'point_id': point['id'],
-                                                  'is_trend': point['is_trend'],
-                                                  'value': Decimal(value) * point['ratio']})
-                elif point['object_type'] == 'ENERGY_VALUE':
-                    # Standard SQL requires that DECIMAL(18, 3) be able to store any value with 18 digits and
-                    # 3 decimals, so values that can be stored in the salary column range
-                    # from -999999999999999.999 to 999999999999999.999.
-                    if Decimal(-999999999999999.999) <= Decimal(value) <= Decimal(999999999999999.999):
-                        energy_value_list.append({'point_id': point['id'],
-                                                  'is_trend': point['is_trend'],
-                                                  'value': Decimal(value) * point['ratio']})
-                elif point['object_type'] == 'DIGITAL_VALUE':
-                    digital_value_list.append({'point_id': point['id'],
-                                               'is_trend': point['is_trend'],
-                                               'value': int(value) * int(point['ratio'])})
-
-            # end of foreach point loop
+            cycle_start_time = time.monotonic()
+            # only read points of the rate classes due in this tick
+            due_rate_class_list = get_due_rate_classes(rate_class_list, cycle_start_time)
+            if len(due_rate_class_list) == 0:
+                time.sleep(max(0.0, get_next_due_time(rate_class_list, cycle_start_time, interval_in_seconds)
+                               - cycle_start_time))
+                continue
+            for rate_class in due_rate_class_list:
+                telemetry.observe('schedule_drift_seconds', cycle_start_time - rate_class.next_due_time)
+            block_list = [block for rate_class in due_rate_class_list for block in rate_class.block_list]
+            is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list = \
+                read_point_values(logger, master, host, port, block_list, telemetry, deadband_filter, slave_health)
 
             if is_modbus_tcp_timed_out:
                 # Modbus TCP connection timeout
+                telemetry.end_cycle(time.monotonic() - cycle_start_time, due_rate_class_list[0].interval_in_seconds,
+                                    spool, deadband_filter)
 
                 # destroy the Modbus master
                 del master
@@ -265,8 +497,11 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
             ############################################################################################################
             # Step 4: Bulk insert point values and update latest values in historical database
             ############################################################################################################
+            current_datetime_utc = datetime.utcnow()
+            db_write_start_time = time.monotonic()
             # check the connection to the Historical Database
-            if not cnx_historical_db.is_connected():
+            is_historical_db_connected = True
+            if cnx_historical_db is None or not cnx_historical_db.is_connected():
                 try:
                     cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
                     cursor_historical_db = cnx_historical_db.cursor()
@@ -276,9 +511,31 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
                         cursor_historical_db.close()
                     if cnx_historical_db:
                         cnx_historical_db.close()
-                    # go to begin of the inner while loop
-                    time.sleep(60)
-                    continue
+                    cnx_historical_db = None
+                    cursor_historical_db = None
+                    is_historical_db_connected = False
+
+            # replay spooled point values in timestamp order before writing point values of this cycle
+            is_spool_needed = True
+            if is_historical_db_connected and replay_spool(logger, cnx_historical_db, cursor_historical_db, spool):
+                # bulk insert values into historical database within a period
+                # and then update latest values
+                is_spool_needed = not write_point_values(logger, cnx_historical_db, cursor_historical_db,
+                                                         current_datetime_utc,
+                                                         analog_value_list, energy_value_list, digital_value_list)
+            if is_spool_needed:
+                # spool point values until the connection to the historical database recovers
+                dropped = spool.append(current_datetime_utc, analog_value_list, energy_value_list, digital_value_list)
+                if dropped > 0:
+                    logger.error("Spool of Data Source (ID = %s) is full, dropped %s oldest records ",
+                                 data_source_id, dropped)
+            telemetry.observe('db_write_seconds', time.monotonic() - db_write_start_time)
+            telemetry.end_cycle(time.monotonic() - cycle_start_time, due_rate_class_list[0].interval_in_seconds,
+                                spool, deadband_filter)
+
+            # schedule the next ticks of the rate classes polled, and skip the ticks missed because of overruns
+            for rate_class in due_rate_class_list:
+                telemetry.increase('missed_ticks_total', advance(rate_class, time.monotonic()))
 
             # check the connection to the System Database
             if not cnx_system_db.is_connected():
@@ -295,171 +552,6 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
                     time.sleep(60)
                     continue
 
-            current_datetime_utc = datetime.utcnow()
-            # bulk insert values into historical database within a period
-            # and then update latest values
-            while len(analog_value_list) > 0:
-                analog_value_list_100 = analog_value_list[:100]
-                analog_value_list = analog_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_analog_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in analog_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.1 of acquisition process " + str(e))
-                        # ignore this exception
-
-                # update tbl_analog_value_latest
-                delete_values = " DELETE FROM tbl_analog_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_analog_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-
-                for point_value in analog_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.3.3 of acquisition process " + str(e))
-                        # ignore this exception
-
-            while len(energy_value_list) > 0:
-                energy_value_list_100 = energy_value_list[:100]
-                energy_value_list = energy_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_energy_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in energy_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.4.1 of acquisition process: " + str(e))
-                        # ignore this exception
-
-                # update tbl_energy_value_latest
-                delete_values = " DELETE FROM tbl_energy_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_energy_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-                for point_value in energy_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-
-                    except Exception as e:
-                        logger.error("Error in step 4.4.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-
-                    except Exception as e:
-                        logger.error("Error in step 4.4.3 of acquisition process " + str(e))
-                        # ignore this exception
-
-            while len(digital_value_list) > 0:
-                digital_value_list_100 = digital_value_list[:100]
-                digital_value_list = digital_value_list[100:]
-
-                add_values = (" INSERT INTO tbl_digital_value (point_id, utc_date_time, actual_value) "
-                              " VALUES  ")
-                trend_value_count = 0
-
-                for point_value in digital_value_list_100:
-                    if point_value['is_trend']:
-                        add_values += " (" + str(point_value['point_id']) + ","
-                        add_values += "'" + current_datetime_utc.isoformat() + "',"
-                        add_values += str(point_value['value']) + "), "
-                        trend_value_count += 1
-
-                if trend_value_count > 0:
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(add_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.1 of acquisition process: " + str(e))
-                        # ignore this exception
-
-                # update tbl_digital_value_latest
-                delete_values = " DELETE FROM tbl_digital_value_latest WHERE point_id IN ( "
-                latest_values = (" INSERT INTO tbl_digital_value_latest (point_id, utc_date_time, actual_value) "
-                                 " VALUES  ")
-                latest_value_count = 0
-                for point_value in digital_value_list_100:
-                    delete_values += str(point_value['point_id']) + ","
-                    latest_values += " (" + str(point_value['point_id']) + ","
-                    latest_values += "'" + current_datetime_utc.isoformat() + "',"
-                    latest_values += str(point_value['value']) + "), "
-                    latest_value_count += 1
-
-                if latest_value_count > 0:
-                    try:
-                        # replace "," at the end of string with ")"
-                        cursor_historical_db.execute(delete_values[:-1] + ")")
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.2 of acquisition process " + str(e))
-                        # ignore this exception
-
-                    try:
-                        # trim ", " at the end of string and then execute
-                        cursor_historical_db.execute(latest_values[:-2])
-                        cnx_historical_db.commit()
-                    except Exception as e:
-                        logger.error("Error in step 4.5.3 of acquisition process " + str(e))
-                        # ignore this exception
-
             # update data source last seen datetime
             update_row = (" UPDATE tbl_data_sources "
                           " SET last_seen_datetime_utc = '" + current_datetime_utc.isoformat() + "' "
@@ -477,9 +569,42 @@ def process(logger, data_source_id, host, port, interval_in_seconds):
                 time.sleep(60)
                 continue
 
-            # Sleep interval in seconds and continue the inner while loop
+            # reload the point list and rebuild the read plan in place if points of the data source were changed
+            if time.monotonic() - reload_checked_time >= config.reload_interval_in_seconds:
+                reload_checked_time = time.monotonic()
+                try:
+                    checksum = get_point_list_checksum(data_source_id, cursor_system_db)
+                    if checksum != point_list_checksum:
+                        point_list = get_point_list(logger, data_source_id, cursor_system_db)
+                        rate_class_list = build_schedule(point_list, interval_in_seconds, config.block_read_max_gap,
+                                                         time.monotonic())
+                        point_list_checksum = checksum
+                        print("Reloaded %s points of Data Source (ID = %s) " % (len(point_list), data_source_id))
+                except Exception as e:
+                    logger.error("Error in step 4.7 of acquisition process " + str(e))
+
+                if len(point_list) == 0:
+                    # all points of the data source were removed
+                    logger.error("Point Not Found in Data Source (ID = %s) ", data_source_id)
+                    # destroy the Modbus master
+                    del master
+                    if cursor_historical_db:
+                        cursor_historical_db.close()
+                    if cnx_historical_db:
+                        cnx_historical_db.close()
+                    if cursor_system_db:
+                        cursor_system_db.close()
+                    if cnx_system_db:
+                        cnx_system_db.close()
+                    # break the inner while loop
+                    # go to begin of the outermost while loop
+                    time.sleep(interval_in_seconds)
+                    break
+
+            # Sleep until the next tick and continue the inner while loop
             # this argument may be a floating point number for subsecond precision
-            time.sleep(interval_in_seconds)
+            now = time.monotonic()
+            time.sleep(max(0.0, get_next_due_time(rate_class_list, now, interval_in_seconds) - now))
 
         # end of the inner while loop
 
@@ -0,0 +1,401 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import mysql.connector
+import acquisition
+import config
+from async_modbus_tcp import AsyncTcpMaster
+from data_source import get_data_source_dict
+from deadband import DeadbandFilter
+from read_plan import point_read_block
+from slave_health import SlaveHealth
+from poll_schedule import advance, build_schedule, get_due_rate_classes, get_next_due_time
+from spool import Spool
+from telemetry import Telemetry
+
+
+########################################################################################################################
+# Shared database writers
+# Each thread in the pool of database writers keeps its own connections to system database and historical database,
+# and the connections are reused by all data sources in the worker process.
+########################################################################################################################
+db_writer_local = threading.local()
+
+
+def get_db_writer_connection(name, db_config):
+    cnx = getattr(db_writer_local, name, None)
+    if cnx is None or not cnx.is_connected():
+        if cnx is not None:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+            setattr(db_writer_local, name, None)
+        cnx = mysql.connector.connect(**db_config)
+        setattr(db_writer_local, name, cnx)
+    return cnx
+
+
+def load_point_list(logger, data_source_id):
+    cnx_system_db = get_db_writer_connection('cnx_system_db', config.myems_system_db)
+    cursor_system_db = cnx_system_db.cursor()
+    try:
+        checksum = acquisition.get_point_list_checksum(data_source_id, cursor_system_db)
+        return checksum, acquisition.get_point_list(logger, data_source_id, cursor_system_db)
+    finally:
+        cursor_system_db.close()
+
+
+def reload_point_list(logger, data_source_id, point_list_checksum):
+    """Return the checksum and the reloaded point list, or None if points of the data source were not changed"""
+    cnx_system_db = get_db_writer_connection('cnx_system_db', config.myems_system_db)
+    cursor_system_db = cnx_system_db.cursor()
+    try:
+        checksum = acquisition.get_point_list_checksum(data_source_id, cursor_system_db)
+        if checksum == point_list_checksum:
+            return None
+        return checksum, acquisition.get_point_list(logger, data_source_id, cursor_system_db)
+    finally:
+        cursor_system_db.close()
+
+
+def write_job(logger, data_source_id, spool, current_datetime_utc,
+              analog_value_list, energy_value_list, digital_value_list):
+    is_spool_needed = True
+    try:
+        cnx_historical_db = get_db_writer_connection('cnx_historical_db', config.myems_historical_db)
+        cursor_historical_db = cnx_historical_db.cursor()
+        try:
+            # replay spooled point values in timestamp order before writing point values of this cycle
+            if acquisition.replay_spool(logger, cnx_historical_db, cursor_historical_db, spool):
+                is_spool_needed = not acquisition.write_point_values(logger, cnx_historical_db, cursor_historical_db,
+                                                                     current_datetime_utc, analog_value_list,
+                                                                     energy_value_list, digital_value_list)
+        finally:
+            cursor_historical_db.close()
+    except Exception as e:
+        logger.error("Error in step 4.1 of asyncio acquisition process: " + str(e))
+
+    if is_spool_needed:
+        # spool point values until the connection to the historical database recovers
+        dropped = spool.append(current_datetime_utc, analog_value_list, energy_value_list, digital_value_list)
+        if dropped > 0:
+            logger.error("Spool of Data Source (ID = %s) is full, dropped %s oldest records ", data_source_id, dropped)
+
+    # update data source last seen datetime
+    cnx_system_db = get_db_writer_connection('cnx_system_db', config.myems_system_db)
+    cursor_system_db = cnx_system_db.cursor()
+    try:
+        update_row = (" UPDATE tbl_data_sources "
+                      " SET last_seen_datetime_utc = %s "
+                      " WHERE id = %s ")
+        cursor_system_db.execute(update_row, (current_datetime_utc.isoformat(), data_source_id,))
+        cnx_system_db.commit()
+    finally:
+        cursor_system_db.close()
+
+
+async def read_point_values(logger, master, host, port, block_list, telemetry, deadband_filter, slave_health=None,
+                            max_in_flight_requests=1):
+    """
+    Read point values of blocks, slaves are read concurrently with at most max_in_flight_requests requests in flight
+    :return: tuple of is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list
+    """
+    loop = asyncio.get_running_loop()
+    energy_value_list = list()
+    analog_value_list = list()
+    digital_value_list = list()
+    now = loop.time()
+    # slaves timed out in this cycle, the rest of their blocks are skipped while the other slaves are still read
+    timed_out_slave_set = set()
+    # slaves responded in this cycle
+    responded_slave_set = set()
+    semaphore = asyncio.Semaphore(max(1, max_in_flight_requests))
+
+    # slave id -> blocks of the slave
+    slave_block_dict = dict()
+    for block in block_list:
+        if slave_health is not None and not slave_health.is_available(block.slave_id, now):
+            # the slave is quarantined
+            continue
+        if block.slave_id not in slave_block_dict:
+            slave_block_dict[block.slave_id] = list()
+        slave_block_dict[block.slave_id].append(block)
+
+    async def execute(read_block):
+        timeout_in_sec = slave_health.get_timeout(read_block.slave_id) if slave_health is not None else None
+        async with semaphore:
+            execute_start_time = loop.time()
+            result = await master.execute(slave=read_block.slave_id,
+                                          function_code=read_block.function_code,
+                                          starting_address=read_block.offset,
+                                          quantity_of_x=read_block.number_of_registers,
+                                          timeout_in_sec=timeout_in_sec)
+            telemetry.observe('execute_seconds', loop.time() - execute_start_time, read_block.slave_id)
+        responded_slave_set.add(read_block.slave_id)
+        return read_block.decode(result)
+
+    async def read_slave(slave_id, slave_block_list):
+        # blocks of one slave are read one after another
+        for block in slave_block_list:
+            block_value_list = None
+            try:
+                block_value_list = await execute(block)
+            except Exception as e:
+                telemetry.increase('read_errors_total')
+                logger.error(str(e) +
+                             " host:" + host + " port:" + str(port) +
+                             " slave_id:" + str(block.slave_id) +
+                             " function_code:" + str(block.function_code) +
+                             " starting_address:" + str(block.offset) +
+                             " quantity_of_x:" + str(block.number_of_registers))
+                if 'timed out' in str(e):
+                    telemetry.increase('timeouts_total')
+                    timed_out_slave_set.add(slave_id)
+                    return
+                # fall back to read point values one by one in this block
+
+            for index, point in enumerate(block.points):
+                try:
+                    if block_value_list is not None:
+                        value = block_value_list[index]
+                    else:
+                        value = (await execute(point_read_block(point)))[0]
+                except Exception as e:
+                    telemetry.increase('read_errors_total')
+                    logger.error(str(e) +
+                                 " host:" + host + " port:" + str(port) +
+                                 " slave_id:" + str(point.slave_id) +
+                                 " function_code:" + str(point.function_code) +
+                                 " starting_address:" + str(point.offset) +
+                                 " quantity_of_x:" + str(point.number_of_registers) +
+                                 " data_format:" + str(point.format) +
+                                 " byte_swap:" + str(point.byte_swap))
+                    if 'timed out' in str(e):
+                        telemetry.increase('timeouts_total')
+                        timed_out_slave_set.add(slave_id)
+                        return
+                    continue
+
+                telemetry.increase('points_read_total')
+                acquisition.append_point_value(logger, point, value,
+                                               analog_value_list, energy_value_list, digital_value_list,
+                                               deadband_filter)
+
+    await asyncio.gather(*[read_slave(slave_id, slave_block_list)
+                           for slave_id, slave_block_list in slave_block_dict.items()])
+
+    acquisition.update_slave_health(logger, host, port, slave_health, telemetry,
+                                    timed_out_slave_set, responded_slave_set)
+
+    # the connection is timed out if no slave responded while some slaves timed out
+    is_modbus_tcp_timed_out = len(timed_out_slave_set) > 0 and len(responded_slave_set) == 0
+    return is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list
+
+
+########################################################################################################################
+# Asyncio Acquisition Procedures
+# Step 1: Connect to the host and port
+# Step 2: Get point list
+# Step 3: Read point values from Modbus slaves in blocks
+# Step 4: Hand off point values to the shared database writers
+# Step 5: Reload point list if points of the data source were changed
+########################################################################################################################
+
+
+async def poll(logger, executor, data_source_id, host, port, interval_in_seconds, telemetry_queue):
+    loop = asyncio.get_running_loop()
+    # point values are spooled to the local file when the historical database is unavailable
+    spool = Spool(os.path.join(config.spool_path, 'data_source_' + str(data_source_id) + '.sqlite3'),
+                  config.spool_max_records)
+    # trend values are reported by exception if deadbands are configured in point addresses
+    deadband_filter = DeadbandFilter(config.heartbeat_in_seconds)
+    # slaves timed out are quarantined while the other slaves of the data source are still read
+    slave_health = SlaveHealth(config.slave_timeout_in_seconds, config.slave_probe_timeout_in_seconds,
+                               config.slave_quarantine_in_seconds, config.slave_quarantine_max_in_seconds)
+    # counters and latency histograms are published to the main process after every cycle
+    telemetry = Telemetry(data_source_id, telemetry_queue)
+    master = None
+    try:
+        while True:
+            # begin of the outermost while loop
+
+            ############################################################################################################
+            # Step 1: Connect to the host and port
+            ############################################################################################################
+            master = AsyncTcpMaster(host=host, port=port, timeout_in_sec=config.slave_timeout_in_seconds)
+            try:
+                await master.open()
+            except Exception as e:
+                logger.error("Failed to connect %s:%s in asyncio acquisition process: %s  ", host, port, str(e))
+                # go to begin of the outermost while loop
+                await asyncio.sleep(300)
+                continue
+
+            ############################################################################################################
+            # Step 2: Get point list
+            ############################################################################################################
+            try:
+                point_list_checksum, point_list = await loop.run_in_executor(executor, load_point_list,
+                                                                             logger, data_source_id)
+            except Exception as e:
+                logger.error("Error in step 2 of asyncio acquisition process: " + str(e))
+                await master.close()
+                # go to begin of the outermost while loop
+                await asyncio.sleep(60)
+                continue
+
+            if len(point_list) == 0:
+                logger.error("Point Not Found in Data Source (ID = %s) ", data_source_id)
+                await master.close()
+                # go to begin of the outermost while loop
+                await asyncio.sleep(60)
+                continue
+
+            # group points into rate classes by poll interval and plan block reads of each rate class once
+            rate_class_list = build_schedule(point_list, interval_in_seconds, config.block_read_max_gap, loop.time())
+            reload_checked_time = loop.time()
+
+            # inner while loop to read all point values periodically
+            while True:
+                # begin of the inner while loop
+                ########################################################################################################
+                # Step 3: Read point values from Modbus slaves in blocks
+                ########################################################################################################
+                cycle_start_time = loop.time()
+                # only read points of the rate classes due in this tick
+                due_rate_class_list = get_due_rate_classes(rate_class_list, cycle_start_time)
+                if len(due_rate_class_list) == 0:
+                    next_due_time = get_next_due_time(rate_class_list, cycle_start_time, interval_in_seconds)
+                    await asyncio.sleep(max(0.0, next_due_time - cycle_start_time))
+                    continue
+                for rate_class in due_rate_class_list:
+                    telemetry.observe('schedule_drift_seconds', cycle_start_time - rate_class.next_due_time)
+                block_list = [block for rate_class in due_rate_class_list for block in rate_class.block_list]
+                is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list = \
+                    await read_point_values(logger, master, host, port, block_list, telemetry, deadband_filter,
+                                            slave_health, config.async_max_in_flight_requests)
+
+                if is_modbus_tcp_timed_out:
+                    # Modbus TCP connection timeout
+                    telemetry.end_cycle(loop.time() - cycle_start_time, due_rate_class_list[0].interval_in_seconds,
+                                        spool, deadband_filter)
+                    await master.close()
+                    # break the inner while loop
+                    # go to begin of the outermost while loop
+                    await asyncio.sleep(60)
+                    break
+
+                ########################################################################################################
+                # Step 4: Hand off point values to the shared database writers
+                ########################################################################################################
+                current_datetime_utc = datetime.utcnow()
+                db_write_start_time = loop.time()
+                try:
+                    await loop.run_in_executor(executor, write_job, logger, data_source_id, spool, current_datetime_utc,
+                                               analog_value_list, energy_value_list, digital_value_list)
+                except Exception as e:
+                    logger.error("Error in step 4 of asyncio acquisition process: " + str(e))
+                # the latency of the shared database writers includes the time waiting for a free writer
+                telemetry.observe('db_write_seconds', loop.time() - db_write_start_time)
+                telemetry.end_cycle(loop.time() - cycle_start_time, due_rate_class_list[0].interval_in_seconds,
+                                    spool, deadband_filter)
+
+                # schedule the next ticks of the rate classes polled, and skip the ticks missed because of overruns
+                for rate_class in due_rate_class_list:
+                    telemetry.increase('missed_ticks_total', advance(rate_class, loop.time()))
+
+                ########################################################################################################
+                # Step 5: Reload point list if points of the data source were changed
+                ########################################################################################################
+                if loop.time() - reload_checked_time >= config.reload_interval_in_seconds:
+                    reload_checked_time = loop.time()
+                    try:
+                        reloaded = await loop.run_in_executor(executor, reload_point_list,
+                                                              logger, data_source_id, point_list_checksum)
+                        if reloaded is not None:
+                            point_list_checksum, point_list = reloaded
+                            rate_class_list = build_schedule(point_list, interval_in_seconds, config.block_read_max_gap,
+                                                             loop.time())
+                            print("Reloaded %s points of Data Source (ID = %s) " % (len(point_list), data_source_id))
+                    except Exception as e:
+                        logger.error("Error in step 5 of asyncio acquisition process: " + str(e))
+
+                    if len(point_list) == 0:
+                        # all points of the data source were removed
+                        logger.error("Point Not Found in Data Source (ID = %s) ", data_source_id)
+                        await master.close()
+                        # break the inner while loop
+                        # go to begin of the outermost while loop
+                        await asyncio.sleep(interval_in_seconds)
+                        break
+
+                # Sleep until the next tick and continue the inner while loop
+                now = loop.time()
+                await asyncio.sleep(max(0.0, get_next_due_time(rate_class_list, now, interval_in_seconds) - now))
+
+            # end of the inner while loop
+
+        # end of the outermost while loop
+    finally:
+        # the poll task is cancelled when the data source is removed or modified
+        if master is not None:
+            await master.close()
+
+
+async def run(logger, worker_index, worker_count, telemetry_queue):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=config.async_db_writers)
+    # data source id -> (arguments, poll task) of the data sources assigned to this worker process
+    poll_task_dict = dict()
+    while True:
+        ################################################################################################################
+        # Reload the data sources assigned to this worker process,
+        # and start or cancel the poll tasks of added, removed or modified data sources in place
+        ################################################################################################################
+        try:
+            data_source_dict = await loop.run_in_executor(executor, get_data_source_dict, logger)
+        except Exception as e:
+            logger.error("Error in reloading data sources of asyncio acquisition process: " + str(e))
+            data_source_dict = None
+
+        if data_source_dict is not None:
+            arguments_dict = {data_source_id: (data_source_id, ) + server
+                              for data_source_id, server in data_source_dict.items()
+                              if data_source_id % worker_count == worker_index}
+
+            # cancel the poll tasks of removed or modified data sources,
+            # and restart the poll tasks terminated unexpectedly
+            for data_source_id in list(poll_task_dict.keys()):
+                arguments, poll_task = poll_task_dict[data_source_id]
+                if poll_task.done() and not poll_task.cancelled() and poll_task.exception() is not None:
+                    logger.error("Poll task of Data Source (ID = %s) terminated unexpectedly: %s",
+                                 data_source_id, str(poll_task.exception()))
+                if arguments_dict.get(data_source_id) != arguments or poll_task.done():
+                    print("Stop polling Data Source " + str(arguments))
+                    poll_task.cancel()
+                    await asyncio.gather(poll_task, return_exceptions=True)
+                    del poll_task_dict[data_source_id]
+
+            for data_source_id, arguments in arguments_dict.items():
+                if data_source_id in poll_task_dict:
+                    continue
+                print("Start polling Data Source " + str(arguments))
+                poll_task = asyncio.ensure_future(poll(logger, executor, *arguments, telemetry_queue))
+                poll_task_dict[data_source_id] = (arguments, poll_task)
+
+        await asyncio.sleep(config.reload_interval_in_seconds)
+
+
+def process(logger, worker_index, worker_count, telemetry_queue=None):
+    """
+    Poll the data sources assigned to this worker process from one event loop
+    A data source is assigned to the worker process of index data_source_id % worker_count.
+    :param logger: the logger
+    :param worker_index: the index of this worker process
+    :param worker_count: the number of worker processes
+    :param telemetry_queue: the queue to publish telemetry snapshots to the main process
+    """
+    asyncio.run(run(logger, worker_index, worker_count, telemetry_queue))
@@ -0,0 +1,168 @@
+import asyncio
+import struct
+
+########################################################################################################################
+# Non-blocking Modbus TCP Master
+# Read coils, discrete inputs, holding registers and input registers over asyncio streams,
+# so that many data sources can be polled from one event loop.
+# The result of reading coils or discrete inputs is a tuple of bits,
+# and the result of reading registers is a tuple of unsigned 16 bits integers, the same as modbus_tk without data_format
+########################################################################################################################
+
+
+class ModbusError(Exception):
+    """Exception raised when the slave replies with an exception response"""
+
+    def __init__(self, exception_code):
+        super().__init__("Modbus Error: Exception code = " + str(exception_code))
+        self.exception_code = exception_code
+
+
+class ModbusInvalidResponseError(Exception):
+    """Exception raised when the response does not match the request"""
+    pass
+
+
+def unpack_response_pdu(function_code, quantity_of_x, pdu):
+    # the shortest PDU is an exception response of function code and exception code
+    if len(pdu) < 2:
+        raise ModbusInvalidResponseError("Response PDU of " + str(len(pdu)) + " bytes is too short")
+    if pdu[0] == function_code | 0x80:
+        raise ModbusError(pdu[1])
+    if pdu[0] != function_code:
+        raise ModbusInvalidResponseError("Response function code " + str(pdu[0]) +
+                                         " does not match request function code " + str(function_code))
+
+    byte_count = pdu[1]
+    data = pdu[2:]
+    if byte_count != len(data):
+        raise ModbusInvalidResponseError("Byte count is " + str(byte_count) +
+                                         " while actual number of bytes is " + str(len(data)))
+
+    if function_code in (1, 2):
+        digits = list()
+        for byte_value in data:
+            for i in range(8):
+                if len(digits) >= quantity_of_x:
+                    break
+                digits.append(byte_value % 2)
+                byte_value = byte_value >> 1
+        return tuple(digits)
+
+    return struct.unpack('>' + str(len(data) // 2) + 'H', data)
+
+
+class AsyncTcpMaster:
+    """
+    Modbus TCP master on asyncio streams
+    Requests are matched with responses by transaction id, so that many requests may be in flight on one connection.
+    A reader task resolves the future of each request, and the late response of a timed out request is discarded.
+    A response with a protocol id other than 0 or a unit id other than the slave of the request fails the request.
+    """
+
+    def __init__(self, host, port, timeout_in_sec=5.0):
+        self.host = host
+        self.port = port
+        self.timeout_in_sec = timeout_in_sec
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._transaction_id = 0
+        # transaction id -> tuple of unit id of the request and future of the response PDU
+        self._pending_dict = dict()
+        self._open_lock = asyncio.Lock()
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            try:
+                self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                                    self.timeout_in_sec)
+            except asyncio.TimeoutError:
+                raise TimeoutError('timed out')
+            self._reader_task = asyncio.ensure_future(self._read_responses(self._reader))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._fail_pending(ConnectionError('connection closed'))
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def execute(self, slave, function_code, starting_address, quantity_of_x, timeout_in_sec=None):
+        await self.open()
+        # skip transaction ids of requests in flight
+        while True:
+            self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+            if self._transaction_id not in self._pending_dict:
+                break
+        transaction_id = self._transaction_id
+        # MBAP header: transaction id, protocol id, length, unit id
+        # PDU: function code, starting address, quantity of x
+        request = struct.pack('>HHHBBHH', transaction_id, 0, 6, slave, function_code,
+                              starting_address, quantity_of_x)
+        future = asyncio.get_running_loop().create_future()
+        self._pending_dict[transaction_id] = (slave, future)
+        try:
+            self._writer.write(request)
+            await self._writer.drain()
+            pdu = await asyncio.wait_for(future, timeout_in_sec if timeout_in_sec is not None else self.timeout_in_sec)
+        except asyncio.TimeoutError:
+            # the connection is kept for the other requests, and the late response will be discarded
+            raise TimeoutError('timed out')
+        except ModbusInvalidResponseError:
+            # the response is framed by its length, the connection is kept for the other requests
+            raise
+        except Exception:
+            await self.close()
+            raise
+        finally:
+            self._pending_dict.pop(transaction_id, None)
+
+        return unpack_response_pdu(function_code, quantity_of_x, pdu)
+
+    async def _read_responses(self, reader):
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                response_transaction_id, protocol_id, length, unit_id = struct.unpack('>HHHB', header)
+                # the length counts the unit id and the PDU
+                pdu = await reader.readexactly(max(0, length - 1))
+                pending = self._pending_dict.get(response_transaction_id)
+                if pending is None or pending[1].done():
+                    # discard the late response of a timed out request
+                    continue
+                slave, future = pending
+                if protocol_id != 0:
+                    future.set_exception(ModbusInvalidResponseError("Response protocol id " + str(protocol_id) +
+                                                                    " is not Modbus protocol id 0"))
+                elif unit_id != slave:
+                    future.set_exception(ModbusInvalidResponseError("Response unit id " + str(unit_id) +
+                                                                    " does not match request unit id " +
+                                                                    str(slave)))
+                else:
+                    future.set_result(pdu)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # the connection is lost, fail the requests in flight and reopen the connection by the next request
+            if self._reader is reader:
+                self._writer.close()
+                self._reader = None
+                self._writer = None
+                self._reader_task = None
+            self._fail_pending(ConnectionError('connection lost ' + str(e)))
+
+    def _fail_pending(self, exception):
+        for _, future in self._pending_dict.values():
+            if not future.done():
+                future.set_exception(exception)
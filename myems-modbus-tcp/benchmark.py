@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from multiprocessing import Process, Queue
+import acquisition
+import async_acquisition
+import config
+import simulator
+from async_modbus_tcp import AsyncTcpMaster
+from read_plan import build_read_plan, compile_point
+from telemetry import Telemetry
+
+########################################################################################################################
+# Acquisition Throughput Benchmark
+# Step 1: Start Modbus TCP slave simulators, one for each data source
+# Step 2: Compile points of each data source and plan block reads
+# Step 3: Read point values and write them to the sink back to back for cycles with the acquisition engine
+# Step 4: Report points per second, cycle duration and database write time
+#
+# The cycles run the same read and write procedures as the acquisition processes,
+# point values are written to a stand-in SQLite database by default,
+# or to the historical database in .env with --sink mysql (use a scratch database).
+########################################################################################################################
+
+# point ids of the benchmark do not collide with points in a real system database
+POINT_ID_BASE = 900000000
+
+
+class SqliteSinkCursor:
+    """Cursor of the stand-in historical database, which translates MySQL statements to SQLite statements"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @staticmethod
+    def translate(statement):
+        statement = statement.replace('%s', '?')
+        if 'ON DUPLICATE KEY UPDATE' in statement:
+            statement = statement.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT(point_id) DO UPDATE SET')
+            statement = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', statement)
+        return statement
+
+    def execute(self, statement, params=()):
+        self._cursor.execute(self.translate(statement), params)
+
+    def executemany(self, statement, rows):
+        self._cursor.executemany(self.translate(statement), rows)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteSink:
+    """Stand-in of the connection to the historical database"""
+
+    def __init__(self, path):
+        self._cnx = sqlite3.connect(path, check_same_thread=False)
+        self._cnx.execute(" PRAGMA journal_mode=WAL ")
+        for table_name in ('tbl_analog_value', 'tbl_energy_value', 'tbl_digital_value'):
+            self._cnx.execute(" CREATE TABLE IF NOT EXISTS " + table_name + " ( "
+                              " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              " point_id INTEGER NOT NULL, "
+                              " utc_date_time TEXT NOT NULL, "
+                              " actual_value TEXT NOT NULL) ")
+            self._cnx.execute(" CREATE TABLE IF NOT EXISTS " + table_name + "_latest ( "
+                              " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              " point_id INTEGER NOT NULL UNIQUE, "
+                              " utc_date_time TEXT NOT NULL, "
+                              " actual_value TEXT NOT NULL) ")
+        self._cnx.commit()
+
+    def cursor(self):
+        return SqliteSinkCursor(self._cnx.cursor())
+
+    def commit(self):
+        self._cnx.commit()
+
+    def rollback(self):
+        self._cnx.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._cnx.close()
+
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda x: x.isoformat())
+
+
+def connect_sink(sink, data_source_id, sink_directory):
+    if sink == 'mysql':
+        import mysql.connector
+        return mysql.connector.connect(**config.myems_historical_db)
+    return SqliteSink(os.path.join(sink_directory, 'data_source_' + str(data_source_id) + '.sqlite3'))
+
+
+def get_point_list(data_source_id, slaves, points):
+    """Compile points of a data source, the points are spread across the slaves"""
+    points_per_slave = (points + slaves - 1) // slaves
+    point_list = list()
+    for i in range(points):
+        address = {'slave_id': i // points_per_slave + 1,
+                   'function_code': 3,
+                   'offset': 2 * (i % points_per_slave),
+                   'number_of_registers': 2,
+                   'format': '>f',
+                   'byte_swap': False}
+        point_id = POINT_ID_BASE + data_source_id * points + i
+        point_list.append(compile_point((point_id, 'benchmark point ' + str(point_id), 'ANALOG_VALUE', True,
+                                         Decimal(1), json.dumps(address))))
+    return point_list
+
+
+def run_data_source(logger, data_source_id, port, arguments, result_queue):
+    """Run cycles of one data source with the process acquisition engine"""
+    from modbus_tk import modbus_tcp
+    block_list = build_read_plan(get_point_list(data_source_id, arguments.slaves, arguments.points),
+                                 config.block_read_max_gap)
+    cnx = connect_sink(arguments.sink, data_source_id, arguments.sink_directory)
+    cursor = cnx.cursor()
+    master = modbus_tcp.TcpMaster(host='127.0.0.1', port=port, timeout_in_sec=5.0)
+    master.set_timeout(5.0)
+    telemetry = Telemetry(data_source_id, None)
+    result_list = list()
+    for _ in range(arguments.cycles):
+        start_time = time.perf_counter()
+        is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list = \
+            acquisition.read_point_values(logger, master, '127.0.0.1', port, block_list, telemetry, None)
+        read_time = time.perf_counter()
+        acquisition.write_point_values(logger, cnx, cursor, datetime.utcnow(),
+                                       analog_value_list, energy_value_list, digital_value_list)
+        write_time = time.perf_counter()
+        result_list.append((len(analog_value_list) + len(energy_value_list) + len(digital_value_list),
+                            read_time - start_time, write_time - read_time, write_time - start_time))
+    cursor.close()
+    cnx.close()
+    result_queue.put(result_list)
+
+
+async def poll_data_source(logger, executor, data_source_id, port, arguments):
+    """Run cycles of one data source with the asyncio acquisition engine"""
+    loop = asyncio.get_running_loop()
+    block_list = build_read_plan(get_point_list(data_source_id, arguments.slaves, arguments.points),
+                                 config.block_read_max_gap)
+    cnx = connect_sink(arguments.sink, data_source_id, arguments.sink_directory)
+    master = AsyncTcpMaster(host='127.0.0.1', port=port, timeout_in_sec=5.0)
+    telemetry = Telemetry(data_source_id, None)
+
+    def write(analog_value_list, energy_value_list, digital_value_list):
+        cursor = cnx.cursor()
+        try:
+            acquisition.write_point_values(logger, cnx, cursor, datetime.utcnow(),
+                                           analog_value_list, energy_value_list, digital_value_list)
+        finally:
+            cursor.close()
+
+    result_list = list()
+    for _ in range(arguments.cycles):
+        start_time = time.perf_counter()
+        is_modbus_tcp_timed_out, analog_value_list, energy_value_list, digital_value_list = \
+            await async_acquisition.read_point_values(logger, master, '127.0.0.1', port, block_list, telemetry, None,
+                                                      None, arguments.max_in_flight_requests)
+        read_time = time.perf_counter()
+        await loop.run_in_executor(executor, write, analog_value_list, energy_value_list, digital_value_list)
+        write_time = time.perf_counter()
+        result_list.append((len(analog_value_list) + len(energy_value_list) + len(digital_value_list),
+                            read_time - start_time, write_time - read_time, write_time - start_time))
+    await master.close()
+    cnx.close()
+    return result_list
+
+
+def run_worker(logger, port_list, arguments, result_queue):
+    """Run cycles of all data sources from one event loop with the asyncio acquisition engine"""
+    async def run():
+        executor = ThreadPoolExecutor(max_workers=config.async_db_writers)
+        return await asyncio.gather(*[poll_data_source(logger, executor, data_source_id, port, arguments)
+                                      for data_source_id, port in enumerate(port_list)])
+    for result_list in asyncio.run(run()):
+        result_queue.put(result_list)
+
+
+def percentile(sorted_values, p):
+    """Return the nearest-rank percentile of sorted values"""
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))]
+
+
+########################################################################################################################
+# main procedure
+########################################################################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark acquisition throughput with Modbus TCP slave simulators')
+    parser.add_argument('--engine', choices=('process', 'asyncio'), default='process')
+    parser.add_argument('--data-sources', type=int, default=1, help='number of data sources (simulators)')
+    parser.add_argument('--slaves', type=int, default=1, help='number of slaves of each data source')
+    parser.add_argument('--points', type=int, default=1000, help='number of points of each data source')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='latency of each request of simulators')
+    parser.add_argument('--cycles', type=int, default=20, help='number of cycles of each data source')
+    parser.add_argument('--port', type=int, default=15020, help='port of the first simulator')
+    parser.add_argument('--sink', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--max-in-flight-requests', type=int, default=config.async_max_in_flight_requests,
+                        help='maximum number of requests in flight on one connection of the asyncio engine')
+    arguments = parser.parse_args()
+
+    logger = logging.getLogger('myems-modbus-tcp-benchmark')
+    logger.setLevel(logging.ERROR)
+    logger.addHandler(logging.StreamHandler())
+
+    ####################################################################################################################
+    # Step 1: Start Modbus TCP slave simulators, one for each data source
+    ####################################################################################################################
+    registers = 2 * ((arguments.points + arguments.slaves - 1) // arguments.slaves)
+    port_list = [arguments.port + i for i in range(arguments.data_sources)]
+    simulator_list = [Process(target=simulator.serve,
+                              args=('127.0.0.1', port, arguments.slaves, registers, arguments.latency_ms / 1000.0))
+                      for port in port_list]
+    for process in simulator_list:
+        process.start()
+    # wait for simulators to listen
+    time.sleep(1)
+
+    with tempfile.TemporaryDirectory() as sink_directory:
+        arguments.sink_directory = sink_directory
+
+        ################################################################################################################
+        # Step 2 and Step 3: Run cycles of all data sources with the acquisition engine
+        ################################################################################################################
+        result_queue = Queue()
+        if arguments.engine == 'asyncio':
+            worker_list = [Process(target=run_worker, args=(logger, port_list, arguments, result_queue))]
+        else:
+            worker_list = [Process(target=run_data_source, args=(logger, data_source_id, port, arguments, result_queue))
+                           for data_source_id, port in enumerate(port_list)]
+        start_time = time.perf_counter()
+        for process in worker_list:
+            process.start()
+        result_list = list()
+        for _ in range(arguments.data_sources):
+            result_list.extend(result_queue.get())
+        elapsed_time = time.perf_counter() - start_time
+        for process in worker_list:
+            process.join()
+
+    for process in simulator_list:
+        process.terminate()
+        process.join()
+
+    ####################################################################################################################
+    # Step 4: Report points per second, cycle duration and database write time
+    ####################################################################################################################
+    points = sum(result[0] for result in result_list)
+    read_list = sorted(result[1] for result in result_list)
+    write_list = sorted(result[2] for result in result_list)
+    cycle_list = sorted(result[3] for result in result_list)
+    print("engine: {0}, data sources: {1}, slaves: {2}, points: {3}, latency: {4} ms, cycles: {5}, sink: {6}".format(
+        arguments.engine, arguments.data_sources, arguments.slaves, arguments.points, arguments.latency_ms,
+        arguments.cycles, arguments.sink))
+    print("points read: {0}, elapsed: {1:.3f} s, throughput: {2:.1f} points/s".format(
+        points, elapsed_time, points / elapsed_time if elapsed_time > 0 else 0.0))
+    for name, value_list in (('cycle', cycle_list), ('read', read_list), ('db write', write_list)):
+        print("{0}: p50 {1:.2f} ms, p99 {2:.2f} ms, mean {3:.2f} ms".format(
+            name, 1000 * percentile(value_list, 50), 1000 * percentile(value_list, 99),
+            1000 * sum(value_list) / len(value_list) if len(value_list) > 0 else 0.0))
+
+
+if __name__ == "__main__":
+    main()
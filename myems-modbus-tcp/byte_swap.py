@@ -1,4 +1,5 @@
 import struct
+from array import array
 ########################################################################################################################
 # Swap adjacent bytes
 # This is not big-endian and little-endian swapping.
@@ -43,3 +44,11 @@ def byte_swap_64_bit(x):
         return struct.unpack('>d', struct.pack('>Q', b | a | d | c | f | e | h | g))[0]
     else:
         return b | a | d | c | f | e | h | g
+
+
+# swap adjacent bytes of all 16bits registers in data at once,
+# abcdefgh... => badcfehg...
+def byte_swap_16_bit_words(data):
+    words = array('H', data)
+    words.byteswap()
+    return words.tobytes()
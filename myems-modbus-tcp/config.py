@@ -27,3 +27,74 @@ gateway = {
     'id': config('GATEWAY_ID', default=1, cast=int),
     'token': config('GATEWAY_TOKEN', default='983427af-1c35-42ba-8b4d-288675550225')
 }
+
+# Indicates the maximum number of unused registers (or coils) between two points to merge them into one block read
+# Set it to 0 to merge adjacent points only
+block_read_max_gap = config('BLOCK_READ_MAX_GAP', default=10, cast=int)
+
+# Indicates the acquisition engine
+# 'process' forks one worker process for each data source
+# 'asyncio' polls all data sources from event loops in a few worker processes
+acquisition_engine = config('ACQUISITION_ENGINE', default='process')
+
+# Indicates the number of worker processes of the asyncio acquisition engine
+async_worker_processes = config('ASYNC_WORKER_PROCESSES', default=1, cast=int)
+
+# Indicates the number of database writers shared by data sources in each worker process of the asyncio engine
+async_db_writers = config('ASYNC_DB_WRITERS', default=2, cast=int)
+
+# Indicates how often to check changes of data sources and points,
+# the acquisition processes of changed data sources and the read plans of changed points are rebuilt in place
+reload_interval_in_seconds = config('RELOAD_INTERVAL_IN_SECONDS', default=60, cast=int)
+
+# Indicates the directory of local spool files
+# Point values are spooled to local files when the historical database is unavailable,
+# and they are replayed in timestamp order when the historical database recovers
+spool_path = config('SPOOL_PATH', default='spool')
+
+# Indicates the maximum number of point values in the spool file of each data source,
+# the oldest point values are dropped when the spool is full
+spool_max_records = config('SPOOL_MAX_RECORDS', default=1000000, cast=int)
+
+# Indicates the number of spooled point values replayed in each transaction
+spool_replay_batch_size = config('SPOOL_REPLAY_BATCH_SIZE', default=10000, cast=int)
+
+# Indicates the maximum number of transactions of spooled point values replayed in each cycle,
+# the rest of spooled point values are replayed in the next cycles
+spool_replay_max_batches = config('SPOOL_REPLAY_MAX_BATCHES', default=10, cast=int)
+
+# Indicates the maximum silence in seconds of trend values of points with deadbands,
+# a trend value is written at least once in the heartbeat even if it is within the deadband
+heartbeat_in_seconds = config('HEARTBEAT_IN_SECONDS', default=900, cast=int)
+
+# Indicates the local HTTP endpoint of telemetry in Prometheus text format, http://host:port/metrics
+# Set TELEMETRY_PORT to 0 to disable the endpoint
+telemetry = {
+    'host': config('TELEMETRY_HOST', default='127.0.0.1'),
+    'port': config('TELEMETRY_PORT', default=9500, cast=int),
+}
+
+# indicates how the supervisor starts and restarts worker processes
+# worker processes are started one after another in start interval to spread the start-up storm,
+# and a worker process terminated unexpectedly is restarted with exponential backoff from initial to max,
+# the backoff is reset if the restarted process has run longer than stable time
+supervisor = {
+    'start_interval_in_seconds': config('SUPERVISOR_START_INTERVAL_IN_SECONDS', default=1.0, cast=float),
+    'backoff_initial_in_seconds': config('SUPERVISOR_BACKOFF_INITIAL_IN_SECONDS', default=5.0, cast=float),
+    'backoff_max_in_seconds': config('SUPERVISOR_BACKOFF_MAX_IN_SECONDS', default=600.0, cast=float),
+    'stable_in_seconds': config('SUPERVISOR_STABLE_IN_SECONDS', default=600.0, cast=float),
+}
+
+# Indicates the timeout of requests to a slave in seconds
+# A slave timed out is quarantined and its points are not read until the quarantine expires,
+# while the other slaves of the data source are still read.
+# The quarantine doubles on consecutive timeouts up to the maximum,
+# and a slave released from quarantine is probed with the probe timeout until it responds again.
+slave_timeout_in_seconds = config('SLAVE_TIMEOUT_IN_SECONDS', default=5.0, cast=float)
+slave_probe_timeout_in_seconds = config('SLAVE_PROBE_TIMEOUT_IN_SECONDS', default=1.0, cast=float)
+slave_quarantine_in_seconds = config('SLAVE_QUARANTINE_IN_SECONDS', default=60.0, cast=float)
+slave_quarantine_max_in_seconds = config('SLAVE_QUARANTINE_MAX_IN_SECONDS', default=600.0, cast=float)
+
+# Indicates the maximum number of requests in flight on one connection of the asyncio acquisition engine
+# Slaves are read concurrently with transaction ids if the gateway supports it, 1 for one request at a time
+async_max_in_flight_requests = config('ASYNC_MAX_IN_FLIGHT_REQUESTS', default=1, cast=int)
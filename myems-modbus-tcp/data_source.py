@@ -0,0 +1,87 @@
+import json
+
+import mysql.connector
+
+import config
+
+
+########################################################################################################################
+# Data Sources
+# The data sources of this gateway are loaded by the main process to start acquisition processes,
+# and by each worker process of the asyncio acquisition engine to start or cancel its poll tasks in place.
+########################################################################################################################
+
+
+def get_data_source_dict(logger):
+    """
+    Get data sources of this gateway
+    :param logger: the logger
+    :return: dictionary of data source id to (host, port, interval_in_seconds), or None if failed to get data sources
+    """
+    cnx_system_db = None
+    cursor_system_db = None
+    try:
+        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
+        cursor_system_db = cnx_system_db.cursor()
+    except Exception as e:
+        logger.error("Error in main process " + str(e))
+        if cursor_system_db:
+            cursor_system_db.close()
+        if cnx_system_db:
+            cnx_system_db.close()
+        return None
+
+    # Get data sources by gateway and protocol
+    try:
+        query = (" SELECT ds.id, ds.name, ds.connection "
+                 " FROM tbl_data_sources ds, tbl_gateways g "
+                 " WHERE ds.protocol = 'modbus-tcp' AND ds.gateway_id = g.id AND g.id = %s AND g.token = %s "
+                 " ORDER BY ds.id ")
+        cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token'],))
+        rows_data_source = cursor_system_db.fetchall()
+    except Exception as e:
+        logger.error("Error in main process " + str(e))
+        return None
+    finally:
+        if cursor_system_db:
+            cursor_system_db.close()
+        if cnx_system_db:
+            cnx_system_db.close()
+
+    data_source_dict = dict()
+    if rows_data_source is None:
+        return data_source_dict
+
+    for data_source in rows_data_source:
+        if data_source[2] is None or len(data_source[2]) == 0:
+            logger.error("Data Source Connection Not Found.")
+            continue
+
+        try:
+            server = json.loads(data_source[2])
+        except Exception as e:
+            logger.error("Data Source Connection JSON error " + str(e))
+            continue
+
+        if 'host' not in server.keys() \
+                or 'port' not in server.keys() \
+                or server['host'] is None \
+                or server['port'] is None \
+                or len(server['host']) == 0 \
+                or not isinstance(server['port'], int) \
+                or server['port'] < 1 \
+                or server['port'] > 65535:
+            logger.error("Data Source Connection Invalid.")
+            continue
+        if 'interval_in_seconds' not in server.keys() \
+            or (not isinstance(server['interval_in_seconds'], int)
+                and not isinstance(server['interval_in_seconds'], float)) \
+            or server['interval_in_seconds'] < 0 \
+                or server['interval_in_seconds'] > 3600:
+            interval_in_seconds = config.interval_in_seconds
+        else:
+            interval_in_seconds = server['interval_in_seconds']
+
+        data_source_dict[data_source[0]] = (server['host'], server['port'], interval_in_seconds)
+
+    return data_source_dict
@@ -0,0 +1,54 @@
+import time
+
+########################################################################################################################
+# Deadband Filter
+# Report trend values by exception, a trend value is written only if it changed more than the deadband
+# since the last written value, or if the point has been silent longer than the heartbeat.
+# Latest values are always updated.
+# Deadbands are configured in point address:
+#   deadband: the absolute deadband
+#   deadband_percentage: the deadband in percentage of the last written value
+#   heartbeat_in_seconds: the maximum silence in seconds, the default value is HEARTBEAT_IN_SECONDS
+# Energy values are never filtered because cleaning and normalization require continuous energy values.
+########################################################################################################################
+
+
+class DeadbandFilter:
+    """Deadband filter for trend values of the points in one data source"""
+
+    def __init__(self, heartbeat_in_seconds):
+        self.heartbeat_in_seconds = heartbeat_in_seconds
+        # point id -> (last written value, monotonic time of last written value)
+        self.last_written_dict = dict()
+        # the number of suppressed trend writes
+        self.suppressed_writes = 0
+
+    def is_written(self, point, value):
+        """
+        Check if the trend value of the point should be written
+        :param point: the read point
+        :param value: the point value with ratio applied
+        :return: True if the trend value should be written, else False
+        """
+        if (point.deadband is None and point.deadband_percentage is None) or point.object_type == 'ENERGY_VALUE':
+            return True
+
+        now = time.monotonic()
+        last_written = self.last_written_dict.get(point.id)
+        if last_written is not None:
+            last_value, last_time = last_written
+            heartbeat_in_seconds = point.heartbeat_in_seconds \
+                if point.heartbeat_in_seconds is not None else self.heartbeat_in_seconds
+            change = abs(value - last_value)
+            if now - last_time < heartbeat_in_seconds \
+                    and (point.deadband is None or change <= point.deadband) \
+                    and (point.deadband_percentage is None or
+                         change <= abs(last_value) * point.deadband_percentage / 100):
+                self.suppressed_writes += 1
+                return False
+
+        self.last_written_dict[point.id] = (value, now)
+        return True
+
+    def metrics(self):
+        return {'suppressed_writes': self.suppressed_writes}
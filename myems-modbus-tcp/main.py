@@ -1,12 +1,13 @@
-import json
 import logging
-import time
 from logging.handlers import RotatingFileHandler
-from multiprocessing import Process
-import mysql.connector
+from multiprocessing import Queue
 import acquisition
+import async_acquisition
 import config
+from data_source import get_data_source_dict
 import gateway
+import telemetry
+from supervisor import Supervisor
 
 
 def main():
@@ -28,97 +29,78 @@ def main():
     # send logging output to sys.stderr
     logger.addHandler(logging.StreamHandler())
 
+    # worker processes terminated unexpectedly are restarted with exponential backoff
+    supervisor = Supervisor(logger,
+                            config.supervisor['start_interval_in_seconds'],
+                            config.supervisor['backoff_initial_in_seconds'],
+                            config.supervisor['backoff_max_in_seconds'],
+                            config.supervisor['stable_in_seconds'])
+
     ####################################################################################################################
     # Create Gateway Process
     ####################################################################################################################
-    Process(target=gateway.process, args=(logger,)).start()
+    supervisor.add('gateway', gateway.process, (logger,))
 
-    # Get Data Sources
-    data_source_list = list()
-    while True:
-        # TODO: This service has to RESTART to reload latest data sources and this should be fixed
-        cnx_system_db = None
-        cursor_system_db = None
-        try:
-            cnx_system_db = mysql.connector.connect(**config.myems_system_db)
-            cursor_system_db = cnx_system_db.cursor()
-        except Exception as e:
-            logger.error("Error in main process " + str(e))
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
-            # sleep several minutes and continue the outer loop to reload points
-            time.sleep(60)
-            continue
+    ####################################################################################################################
+    # Create Telemetry Endpoint
+    ####################################################################################################################
+    # acquisition processes publish counters and latency histograms to the queue after every cycle
+    telemetry_queue = Queue(maxsize=10000) if config.telemetry['port'] > 0 else None
+    telemetry_server = telemetry.TelemetryServer(config.telemetry['host'], config.telemetry['port'], telemetry_queue)
+    if telemetry_queue is not None:
+        telemetry_server.start()
 
-        # Get data sources by gateway and protocol
-        rows_data_source = None
-        try:
-            query = (" SELECT ds.id, ds.name, ds.connection "
-                     " FROM tbl_data_sources ds, tbl_gateways g "
-                     " WHERE ds.protocol = 'modbus-tcp' AND ds.gateway_id = g.id AND g.id = %s AND g.token = %s "
-                     " ORDER BY ds.id ")
-            cursor_system_db.execute(query, (config.gateway['id'], config.gateway['token'],))
-            rows_data_source = cursor_system_db.fetchall()
-        except Exception as e:
-            logger.error("Error in main process " + str(e))
-            # sleep several minutes and continue the outer loop to reload points
-            time.sleep(60)
-            continue
-        finally:
-            if cursor_system_db:
-                cursor_system_db.close()
-            if cnx_system_db:
-                cnx_system_db.close()
+    ####################################################################################################################
+    # Create Acquisition Processes
+    ####################################################################################################################
+    if config.acquisition_engine == 'asyncio':
+        # each worker process polls the data sources assigned to it by data source id from one event loop,
+        # and reloads its data sources to start or cancel the poll tasks of changed data sources in place,
+        # so that changing a data source does not interrupt polling the other data sources of the worker process
+        worker_count = max(1, config.async_worker_processes)
+        for worker_index in range(worker_count):
+            supervisor.add('acquisition_' + str(worker_index), async_acquisition.process,
+                           (logger, worker_index, worker_count, telemetry_queue))
 
-        if rows_data_source is None or len(rows_data_source) == 0:
-            logger.error("Data Source Not Found, Wait for minutes to retry.")
-            # wait for a while and retry
-            time.sleep(60)
-            continue
-        else:
-            # Stop to connect these data sources
-            data_source_list = rows_data_source
-            break
+    # data source id -> arguments of the acquisition process of the data source
+    acquisition_arguments_dict = dict()
+    while True:
+        data_source_dict = get_data_source_dict(logger)
+        if data_source_dict is not None:
+            if len(data_source_dict) == 0:
+                logger.error("Data Source Not Found, Wait for minutes to retry.")
 
-    for data_source in data_source_list:
-        print("Data Source: ID=%s, Name=%s, Connection=%s " %
-              (data_source[0], data_source[1], data_source[2]))
+            # the arguments of acquisition processes for the latest data sources
+            arguments_dict = dict()
+            for data_source_id, server in data_source_dict.items():
+                arguments_dict[data_source_id] = (data_source_id, ) + server
 
-        if data_source[2] is None or len(data_source[2]) == 0:
-            logger.error("Data Source Connection Not Found.")
-            continue
+            # stop the acquisition processes of removed or modified data sources
+            for data_source_id in list(acquisition_arguments_dict.keys()):
+                arguments = acquisition_arguments_dict[data_source_id]
+                if arguments_dict.get(data_source_id) != arguments:
+                    print("Stop acquisition of Data Source " + str(arguments))
+                    if config.acquisition_engine != 'asyncio':
+                        supervisor.remove('acquisition_' + str(data_source_id))
+                    del acquisition_arguments_dict[data_source_id]
+                    telemetry_server.remove(data_source_id)
 
-        try:
-            server = json.loads(data_source[2])
-        except Exception as e:
-            logger.error("Data Source Connection JSON error " + str(e))
-            continue
+            # start the acquisition processes of added or modified data sources
+            # acquisition processes are started in staggered delays by the supervisor
+            for data_source_id, arguments in arguments_dict.items():
+                if data_source_id in acquisition_arguments_dict:
+                    continue
+                print("Start acquisition of Data Source " + str(arguments))
+                if config.acquisition_engine != 'asyncio':
+                    # fork worker process for each data source
+                    supervisor.add('acquisition_' + str(data_source_id), acquisition.process,
+                                   (logger, ) + arguments + (telemetry_queue, ))
+                acquisition_arguments_dict[data_source_id] = arguments
 
-        if 'host' not in server.keys() \
-                or 'port' not in server.keys() \
-                or server['host'] is None \
-                or server['port'] is None \
-                or len(server['host']) == 0 \
-                or not isinstance(server['port'], int) \
-                or server['port'] < 1 \
-                or server['port'] > 65535:
-            logger.error("Data Source Connection Invalid.")
-            continue
-        if 'interval_in_seconds' not in server.keys() \
-            or (not isinstance(server['interval_in_seconds'], int)
-                and not isinstance(server['interval_in_seconds'], float)) \
-            or server['interval_in_seconds'] < 0 \
-                or server['interval_in_seconds'] > 3600:
-            interval_in_seconds = config.interval_in_seconds
-        else:
-            interval_in_seconds = server['interval_in_seconds']
+        telemetry_server.set_restart_counts(supervisor.restart_counts())
 
-        # fork worker process for each data source
-        # todo: how to restart the process if the process terminated unexpectedly
-        Process(target=acquisition.process,
-                args=(logger, data_source[0], server['host'], server['port'], interval_in_seconds)).start()
+        # watch worker processes and check changes of data sources periodically
+        supervisor.wait(config.reload_interval_in_seconds)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+from read_plan import build_read_plan
+
+########################################################################################################################
+# Multi-rate Polling Schedule
+# Points are grouped into rate classes by their poll interval,
+# the interval_in_seconds in point address or the interval of the data source by default.
+# Block reads are planned within each rate class, and only the rate classes due are read in each tick,
+# so that fast points get fresh values without polling slow points of the same device as often.
+########################################################################################################################
+
+
+class RateClass:
+    """Points polled at the same interval and their block reads"""
+    __slots__ = ('interval_in_seconds', 'point_list', 'block_list', 'next_due_time')
+
+    def __init__(self, interval_in_seconds, point_list, block_list, next_due_time):
+        self.interval_in_seconds = interval_in_seconds
+        self.point_list = point_list
+        self.block_list = block_list
+        self.next_due_time = next_due_time
+
+
+def build_schedule(point_list, default_interval_in_seconds, max_gap, now):
+    """
+    Group read points into rate classes and plan block reads of each rate class
+    :param point_list: list of read points
+    :param default_interval_in_seconds: the interval of the data source for points without interval_in_seconds
+    :param max_gap: the maximum gap between two points to merge them into one block
+    :param now: the monotonic time when all rate classes are due at first
+    :return: list of rate classes sorted by interval
+    """
+    group_dict = dict()
+    for point in point_list:
+        interval_in_seconds = point.interval_in_seconds \
+            if point.interval_in_seconds is not None else default_interval_in_seconds
+        if interval_in_seconds not in group_dict:
+            group_dict[interval_in_seconds] = list()
+        group_dict[interval_in_seconds].append(point)
+
+    return [RateClass(interval_in_seconds, group_point_list, build_read_plan(group_point_list, max_gap), now)
+            for interval_in_seconds, group_point_list in sorted(group_dict.items())]
+
+
+def get_due_rate_classes(rate_class_list, now):
+    """Return the rate classes due at now"""
+    return [rate_class for rate_class in rate_class_list if rate_class.next_due_time <= now]
+
+
+def advance(rate_class, now):
+    """
+    Schedule the next tick of a rate class after it was polled
+    If the tick overran, the missed ticks are skipped instead of being polled in a burst.
+    :param rate_class: the rate class polled
+    :param now: the monotonic time after the rate class was polled
+    :return: the number of missed ticks
+    """
+    if rate_class.interval_in_seconds <= 0:
+        # poll continuously
+        rate_class.next_due_time = now
+        return 0
+    rate_class.next_due_time += rate_class.interval_in_seconds
+    missed_ticks = 0
+    if rate_class.next_due_time <= now:
+        missed_ticks = int((now - rate_class.next_due_time) // rate_class.interval_in_seconds) + 1
+        rate_class.next_due_time += missed_ticks * rate_class.interval_in_seconds
+    return missed_ticks
+
+
+def get_next_due_time(rate_class_list, now, default_interval_in_seconds):
+    """
+    Return the monotonic time of the next tick of the schedule
+    :param rate_class_list: list of rate classes, empty if the data source has no points
+    :param now: the current monotonic time
+    :param default_interval_in_seconds: the interval of the data source to wait if the schedule is empty
+    """
+    return min((rate_class.next_due_time for rate_class in rate_class_list),
+               default=now + default_interval_in_seconds)
@@ -0,0 +1,342 @@
+import json
+import math
+import re
+import struct
+from decimal import Decimal
+from byte_swap import byte_swap_16_bit_words, byte_swap_32_bit, byte_swap_64_bit
+
+########################################################################################################################
+# Read Plan Procedures
+# Step 1: Compile each point into a read point with parsed address and prebuilt decoder once at load time
+# Step 2: Group read points by slave_id and function_code
+# Step 3: Merge adjacent or nearby offset ranges into block reads
+# Step 4: Compile a decoder of each block read, which decodes the values of all points in the block at once
+# Step 5: Decode the point values from the registers returned by the block read,
+#         and apply the ratios of the points and check the bounds of the columns of the point values
+########################################################################################################################
+
+# The maximum quantity of coils, discrete inputs or registers in one request
+# Refer to Modbus Application Protocol Specification V1.1b3
+MAX_QUANTITY_OF_X = {1: 2000,
+                     2: 2000,
+                     3: 125,
+                     4: 125}
+
+# Formats of a single number with standard size and without alignment, they are decoded in bulk.
+# The other formats (native alignment, several items, strings) are decoded point by point.
+BULK_FORMAT_PATTERN = re.compile(r'^([<>!=])([bBhHiIlLqQefd])$')
+
+# Swapping adjacent bytes of a signed integer yields the unsigned integer of the swapped bytes
+UNSIGNED_FORMAT_CHAR = {'b': 'B', 'h': 'H', 'i': 'I', 'l': 'L', 'q': 'Q'}
+
+# Standard SQL requires that DECIMAL(18, 3) be able to store any value with 18 digits and
+# 3 decimals, so values that can be stored in the salary column range
+# from -999999999999999.999 to 999999999999999.999.
+DECIMAL_18_3_MIN = Decimal(-999999999999999.999)
+DECIMAL_18_3_MAX = Decimal(999999999999999.999)
+# Digital values are stored in INT columns
+INT_MIN = -2147483648
+INT_MAX = 2147483647
+
+
+class ReadPoint:
+    """A point with parsed address and prebuilt decoder"""
+    __slots__ = ('id', 'name', 'object_type', 'is_trend', 'ratio',
+                 'slave_id', 'function_code', 'offset', 'number_of_registers', 'format', 'byte_swap',
+                 'value_struct', 'swap', 'deadband', 'deadband_percentage', 'heartbeat_in_seconds',
+                 'interval_in_seconds')
+
+    def __init__(self, point_id, name, object_type, is_trend, ratio, address):
+        self.id = point_id
+        self.name = name
+        self.object_type = object_type
+        self.is_trend = is_trend
+        self.ratio = ratio
+        self.slave_id = address['slave_id']
+        self.function_code = address['function_code']
+        self.offset = address['offset']
+        self.number_of_registers = address['number_of_registers']
+        self.format = address['format']
+        self.byte_swap = address['byte_swap']
+        # the value of coils or discrete inputs is a bit, there is no need to unpack it
+        self.value_struct = struct.Struct(self.format) if self.function_code in (3, 4) else None
+        # optional report by exception settings of trend values
+        # the absolute deadband, the percentage deadband, and the maximum silence in seconds
+        self.deadband = Decimal(str(address['deadband'])) if 'deadband' in address else None
+        self.deadband_percentage = Decimal(str(address['deadband_percentage'])) \
+            if 'deadband_percentage' in address else None
+        self.heartbeat_in_seconds = address.get('heartbeat_in_seconds')
+        # optional poll interval of the point, the interval of the data source by default
+        self.interval_in_seconds = address.get('interval_in_seconds')
+        self.swap = None
+        if self.byte_swap:
+            if self.number_of_registers == 2:
+                self.swap = byte_swap_32_bit
+            elif self.number_of_registers == 4:
+                self.swap = byte_swap_64_bit
+
+    def decode(self, block_offset, data):
+        """
+        Decode the point value from the data of a block read
+        :param block_offset: the starting address of the block read
+        :param data: tuple of bits for coils or discrete inputs, or bytes of registers in big-endian for registers
+        :return: the decoded point value
+        """
+        if self.value_struct is None:
+            return data[self.offset - block_offset]
+        value = self.value_struct.unpack_from(data, 2 * (self.offset - block_offset))[0]
+        if self.swap is not None:
+            value = self.swap(value)
+        return value
+
+    def __repr__(self):
+        return 'ReadPoint(id=' + str(self.id) + ', slave_id=' + str(self.slave_id) + \
+            ', function_code=' + str(self.function_code) + ', offset=' + str(self.offset) + \
+            ', number_of_registers=' + str(self.number_of_registers) + ')'
+
+
+class ReadBlock:
+    """A block read of points with the same slave_id and function_code"""
+    __slots__ = ('slave_id', 'function_code', 'offset', 'number_of_registers', 'points',
+                 'bit_index_list', 'layer_list', 'point_index_list', 'decimal_ratio_list', 'int_ratio_list')
+
+    def __init__(self, slave_id, function_code, offset, number_of_registers, points):
+        self.slave_id = slave_id
+        self.function_code = function_code
+        self.offset = offset
+        self.number_of_registers = number_of_registers
+        self.points = points
+        # the decoder is compiled by compile_block after all points are added to the block
+        self.bit_index_list = None
+        self.layer_list = None
+        self.point_index_list = None
+        self.decimal_ratio_list = None
+        self.int_ratio_list = None
+
+    def unpack(self, result):
+        """
+        Convert the result returned by the Modbus master to the data for decoding point values
+        :param result: tuple of bits for coils or discrete inputs, or tuple of unsigned 16 bits integers for registers
+        :return: tuple of bits, or bytes of registers in big-endian
+        """
+        if self.function_code in (1, 2):
+            return result
+        return struct.pack('>' + str(len(result)) + 'H', *result)
+
+    def decode(self, result):
+        """
+        Decode the values of all points in the block, and apply the ratios of points
+        :param result: tuple of bits for coils or discrete inputs, or tuple of unsigned 16 bits integers for registers
+        :return: list of point values in the order of points, see scale
+        """
+        if self.function_code in (1, 2):
+            return self.scale([result[index] for index in self.bit_index_list])
+
+        data = self.unpack(result)
+        # adjacent bytes of all registers are swapped at once for the points with byte_swap
+        swapped_data = None
+        value_list = [None] * len(self.points)
+        for layer_struct, is_swapped, index_list in self.layer_list:
+            if is_swapped:
+                if swapped_data is None:
+                    swapped_data = byte_swap_16_bit_words(data)
+                layer_value_tuple = layer_struct.unpack_from(swapped_data)
+            else:
+                layer_value_tuple = layer_struct.unpack_from(data)
+            for index, value in zip(index_list, layer_value_tuple):
+                value_list[index] = value
+        for index in self.point_index_list:
+            value_list[index] = self.points[index].decode(self.offset, data)
+        return self.scale(value_list)
+
+    def scale(self, value_list):
+        """
+        Apply the ratios of all points to the decoded values, and check the bounds of the columns of the values,
+        because a value out of the bounds fails the transaction of all point values of the cycle.
+        :param value_list: list of decoded point values in the order of points
+        :return: list of point values in the order of points, Decimal for analog values and energy values,
+                 int for digital values, and None for values which are not numbers or are out of the bounds
+        """
+        for index, ratio in self.decimal_ratio_list:
+            value = value_list[index]
+            # NaN is the only value not equal to itself, and infinities are out of the bounds whatever the ratio is
+            if not isinstance(value, (float, int)) or value != value or math.isinf(value):
+                value_list[index] = None
+                continue
+            value = Decimal(value) * ratio
+            value_list[index] = value if DECIMAL_18_3_MIN <= value <= DECIMAL_18_3_MAX else None
+        for index, ratio in self.int_ratio_list:
+            value = value_list[index]
+            if not isinstance(value, (float, int)) or value != value or math.isinf(value):
+                value_list[index] = None
+                continue
+            value = int(value) * ratio
+            value_list[index] = value if INT_MIN <= value <= INT_MAX else None
+        return value_list
+
+
+def compile_block(block):
+    """
+    Compile the decoder of a block read.
+    Points of bulk formats are packed into layers, one struct of each layer unpacks all of its points at once
+    with pad bytes in the gaps, overlapping points and points of other byte orders are put into other layers.
+    Points with byte_swap are unpacked from the data with adjacent bytes of all registers swapped,
+    which is the same as swapping adjacent bytes of each value.
+    :param block: the block read
+    """
+    block.bit_index_list = [point.offset - block.offset for point in block.points]
+    block.layer_list = list()
+    block.point_index_list = list()
+    # ratios of analog values and energy values, and ratios of digital values
+    block.decimal_ratio_list = [(index, point.ratio)
+                                for index, point in enumerate(block.points)
+                                if point.object_type in ('ANALOG_VALUE', 'ENERGY_VALUE')]
+    block.int_ratio_list = [(index, int(point.ratio))
+                            for index, point in enumerate(block.points) if point.object_type == 'DIGITAL_VALUE']
+    if block.function_code in (1, 2):
+        return
+
+    # (byte order, is swapped) -> list of layers of [format, end in bytes, index list]
+    layer_dict = dict()
+    for index, point in enumerate(block.points):
+        match = BULK_FORMAT_PATTERN.match(point.format)
+        if match is None:
+            block.point_index_list.append(index)
+            continue
+        byte_order, format_char = match.groups()
+        is_swapped = point.swap is not None
+        if is_swapped:
+            format_char = UNSIGNED_FORMAT_CHAR.get(format_char, format_char)
+        start = 2 * (point.offset - block.offset)
+        key = (byte_order, is_swapped)
+        if key not in layer_dict:
+            layer_dict[key] = list()
+        for layer in layer_dict[key]:
+            if layer[1] <= start:
+                break
+        else:
+            layer = [byte_order, 0, list()]
+            layer_dict[key].append(layer)
+        if start > layer[1]:
+            layer[0] += str(start - layer[1]) + 'x'
+        layer[0] += format_char
+        layer[1] = start + point.value_struct.size
+        layer[2].append(index)
+
+    for (byte_order, is_swapped), layer_list in layer_dict.items():
+        for layer_format, _, index_list in layer_list:
+            block.layer_list.append((struct.Struct(layer_format), is_swapped, index_list))
+
+
+def compile_point(row_point):
+    """
+    Compile a point row into a read point, the address is parsed and validated once.
+    :param row_point: tuple of id, name, object_type, is_trend, ratio and address in JSON
+    :return: the read point
+    :raise ValueError: if the address is invalid
+    """
+    try:
+        address = json.loads(row_point[5])
+    except Exception as e:
+        raise ValueError("Invalid point address in JSON " + str(e))
+
+    if not isinstance(address, dict) \
+            or 'slave_id' not in address.keys() \
+            or 'function_code' not in address.keys() \
+            or 'offset' not in address.keys() \
+            or 'number_of_registers' not in address.keys() \
+            or 'format' not in address.keys() \
+            or 'byte_swap' not in address.keys() \
+            or not isinstance(address['slave_id'], int) \
+            or not isinstance(address['offset'], int) \
+            or not isinstance(address['number_of_registers'], int) \
+            or not isinstance(address['format'], str) \
+            or address['slave_id'] < 1 \
+            or address['function_code'] not in (1, 2, 3, 4) \
+            or address['offset'] < 0 \
+            or address['number_of_registers'] < 1 \
+            or address['number_of_registers'] > MAX_QUANTITY_OF_X[address['function_code']] \
+            or len(address['format']) < 1 \
+            or not isinstance(address['byte_swap'], bool):
+        raise ValueError("Invalid address data.")
+
+    for key in ('deadband', 'deadband_percentage', 'heartbeat_in_seconds'):
+        if key in address.keys() \
+                and (isinstance(address[key], bool)
+                     or not isinstance(address[key], (int, float))
+                     or address[key] < 0):
+            raise ValueError("Invalid " + key + " in address data.")
+
+    if 'interval_in_seconds' in address.keys() \
+            and (isinstance(address['interval_in_seconds'], bool)
+                 or not isinstance(address['interval_in_seconds'], (int, float))
+                 or address['interval_in_seconds'] <= 0
+                 or address['interval_in_seconds'] > 3600):
+        raise ValueError("Invalid interval_in_seconds in address data.")
+
+    try:
+        read_point = ReadPoint(row_point[0], row_point[1], row_point[2], row_point[3], row_point[4], address)
+    except struct.error as e:
+        raise ValueError("Invalid format " + str(e))
+
+    if read_point.value_struct is not None and read_point.value_struct.size != 2 * read_point.number_of_registers:
+        raise ValueError("Size of format " + read_point.format +
+                         " does not match number_of_registers " + str(read_point.number_of_registers))
+
+    if read_point.swap is not None:
+        # only numbers can be byte swapped
+        try:
+            read_point.decode(read_point.offset, bytes(read_point.value_struct.size))
+        except TypeError:
+            raise ValueError("Bytes of format " + read_point.format + " can not be swapped")
+
+    return read_point
+
+
+def build_read_plan(point_list, max_gap):
+    """
+    Build a list of block reads from a list of read points.
+    :param point_list: list of read points
+    :param max_gap: the maximum number of unused registers (or bits) between two points to merge them into one block
+    :return: list of block reads
+    """
+    # Group read points by slave_id and function_code
+    group_dict = dict()
+    for point in point_list:
+        key = (point.slave_id, point.function_code)
+        if key not in group_dict:
+            group_dict[key] = list()
+        group_dict[key].append(point)
+
+    # Merge adjacent or nearby offset ranges into block reads
+    block_list = list()
+    for (slave_id, function_code), group_point_list in sorted(group_dict.items()):
+        max_quantity_of_x = MAX_QUANTITY_OF_X[function_code]
+        group_point_list.sort(key=lambda x: (x.offset, x.number_of_registers))
+        block = None
+        for point in group_point_list:
+            end = point.offset + point.number_of_registers
+            if block is not None:
+                block_end = block.offset + block.number_of_registers
+                if point.offset - block_end <= max_gap and max(end, block_end) - block.offset <= max_quantity_of_x:
+                    block.number_of_registers = max(end, block_end) - block.offset
+                    block.points.append(point)
+                    continue
+            block = ReadBlock(slave_id, function_code, point.offset, point.number_of_registers, [point, ])
+            block_list.append(block)
+
+    for block in block_list:
+        compile_block(block)
+
+    return block_list
+
+
+def point_read_block(point):
+    """
+    Build a block read of a single point, it is used to read point values one by one if the block read failed.
+    :param point: the read point
+    :return: the block read
+    """
+    block = ReadBlock(point.slave_id, point.function_code, point.offset, point.number_of_registers, [point, ])
+    compile_block(block)
+    return block
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import struct
+import sys
+
+########################################################################################################################
+# Modbus TCP Slave Simulator
+# Serve coils, discrete inputs, holding registers and input registers of simulated slaves with configurable latency,
+# so that the acquisition path can be measured without real hardware.
+# Registers hold big-endian 32 bits floats ('>f' in point address), and the values walk randomly every second.
+# Coils and discrete inputs are the lowest bits of the registers at the same addresses.
+########################################################################################################################
+
+
+class Simulator:
+    """Simulated Modbus TCP slaves"""
+
+    def __init__(self, slaves, registers, latency_in_seconds):
+        self.slaves = slaves
+        self.registers = registers
+        self.latency_in_seconds = latency_in_seconds
+        # slave id -> registers in big-endian bytes
+        self.register_dict = dict()
+        for slave_id in range(1, slaves + 1):
+            data = bytearray(2 * registers)
+            for offset in range(0, registers - 1, 2):
+                struct.pack_into('>f', data, 2 * offset, random.uniform(0.0, 1000.0))
+            self.register_dict[slave_id] = data
+
+    def walk(self):
+        """Change the values of all registers randomly"""
+        for data in self.register_dict.values():
+            for offset in range(0, self.registers - 1, 2):
+                value = struct.unpack_from('>f', data, 2 * offset)[0]
+                struct.pack_into('>f', data, 2 * offset, value + random.uniform(-1.0, 1.0))
+
+    def respond(self, slave_id, pdu):
+        """Return the response PDU of the request PDU"""
+        function_code = pdu[0]
+        if function_code not in (1, 2, 3, 4) or len(pdu) != 5:
+            # illegal function
+            return bytes((function_code | 0x80, 1))
+        starting_address, quantity_of_x = struct.unpack('>HH', pdu[1:5])
+        data = self.register_dict.get(slave_id)
+        if data is None:
+            # gateway target device failed to respond
+            return bytes((function_code | 0x80, 0x0B))
+        if quantity_of_x < 1 or starting_address + quantity_of_x > self.registers \
+                or quantity_of_x > (2000 if function_code in (1, 2) else 125):
+            # illegal data address
+            return bytes((function_code | 0x80, 2))
+
+        if function_code in (3, 4):
+            return bytes((function_code, 2 * quantity_of_x)) + data[2 * starting_address:
+                                                                    2 * (starting_address + quantity_of_x)]
+
+        bits = bytearray((quantity_of_x + 7) // 8)
+        for i in range(quantity_of_x):
+            if data[2 * (starting_address + i) + 1] & 1:
+                bits[i // 8] |= 1 << (i % 8)
+        return bytes((function_code, len(bits))) + bytes(bits)
+
+    async def reply(self, writer, transaction_id, unit_id, pdu):
+        if self.latency_in_seconds > 0:
+            await asyncio.sleep(self.latency_in_seconds)
+        response_pdu = self.respond(unit_id, pdu)
+        writer.write(struct.pack('>HHHB', transaction_id, 0, len(response_pdu) + 1, unit_id) + response_pdu)
+
+    async def handle(self, reader, writer):
+        # requests in flight on one connection are served concurrently like a gateway with multiple serial lines
+        task_set = set()
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, protocol_id, length, unit_id = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                task = asyncio.ensure_future(self.reply(writer, transaction_id, unit_id, pdu))
+                task_set.add(task)
+                task.add_done_callback(task_set.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in task_set:
+                task.cancel()
+            writer.close()
+
+    async def run(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            while True:
+                await asyncio.sleep(1)
+                self.walk()
+
+
+def serve(host, port, slaves, registers, latency_in_seconds):
+    """Serve simulated slaves until the process is terminated"""
+    asyncio.run(Simulator(slaves, registers, latency_in_seconds).run(host, port))
+
+
+########################################################################################################################
+# main procedure
+########################################################################################################################
+def main():
+    if len(sys.argv) > 4:
+        port = int(sys.argv[1])
+        slaves = int(sys.argv[2])
+        registers = int(sys.argv[3])
+        latency_in_seconds = float(sys.argv[4]) / 1000.0
+    else:
+        print('Missing arguments')
+        print('Usage: python3 simulator.py PORT SLAVES REGISTERS LATENCY_IN_MILLISECONDS')
+        return
+
+    print("Serving {0} slaves with {1} registers on port {2}".format(slaves, registers, port))
+    serve('0.0.0.0', port, slaves, registers, latency_in_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+########################################################################################################################
+# Slave Health Tracking
+# A slave timed out is quarantined, and its points are not read until the quarantine expires,
+# so that one slow or dead slave does not stall the other slaves on the same gateway connection.
+# The quarantine doubles on consecutive timeouts up to the maximum,
+# and a slave released from quarantine is probed with a shorter timeout until it responds again.
+########################################################################################################################
+
+
+class SlaveHealth:
+    """Health of the slaves of one data source"""
+
+    def __init__(self, timeout_in_seconds, probe_timeout_in_seconds, quarantine_in_seconds, quarantine_max_in_seconds):
+        self.timeout_in_seconds = timeout_in_seconds
+        self.probe_timeout_in_seconds = probe_timeout_in_seconds
+        self.quarantine_in_seconds = quarantine_in_seconds
+        self.quarantine_max_in_seconds = quarantine_max_in_seconds
+        # slave id -> number of consecutive timeouts
+        self.failures_dict = dict()
+        # slave id -> monotonic time when the quarantine expires
+        self.quarantined_until_dict = dict()
+
+    def is_available(self, slave_id, now):
+        """Return True if the slave is not quarantined at now"""
+        return self.quarantined_until_dict.get(slave_id, 0.0) <= now
+
+    def get_timeout(self, slave_id):
+        """Return the timeout of requests to the slave in seconds"""
+        if self.failures_dict.get(slave_id, 0) > 0:
+            return min(self.timeout_in_seconds, self.probe_timeout_in_seconds)
+        return self.timeout_in_seconds
+
+    def record_success(self, slave_id):
+        self.failures_dict.pop(slave_id, None)
+        self.quarantined_until_dict.pop(slave_id, None)
+
+    def record_timeout(self, slave_id, now):
+        """
+        Quarantine the slave timed out
+        :return: the quarantine in seconds
+        """
+        failures = self.failures_dict.get(slave_id, 0)
+        quarantine_in_seconds = min(self.quarantine_max_in_seconds, self.quarantine_in_seconds * 2 ** min(failures, 30))
+        self.failures_dict[slave_id] = failures + 1
+        self.quarantined_until_dict[slave_id] = now + quarantine_in_seconds
+        return quarantine_in_seconds
+
+    def get_quarantined_slaves(self, now):
+        """Return the number of slaves quarantined at now"""
+        return sum(1 for quarantined_until in self.quarantined_until_dict.values() if quarantined_until > now)
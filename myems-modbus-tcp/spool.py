@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+########################################################################################################################
+# Durable Local Spool
+# Point values are appended to a local SQLite file when they can not be written to the historical database,
+# and they are replayed in bulk in timestamp order when the connection recovers.
+# The spool is capped by the number of records, and the oldest records are dropped when the cap is exceeded.
+# Records which fail to be replayed for reasons other than a lost connection are moved to a quarantine table
+# in the same file, so that they do not block the replay of the records after them.
+########################################################################################################################
+
+
+class Spool:
+    """Append-only spool of point values in a local SQLite file"""
+
+    def __init__(self, path, max_records):
+        directory = os.path.dirname(path)
+        if len(directory) > 0:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_records = max_records
+        # the spool may be shared by database writer threads of the asyncio acquisition engine
+        self._lock = threading.Lock()
+        self._cnx = sqlite3.connect(path, check_same_thread=False)
+        self._cnx.execute(" PRAGMA journal_mode=WAL ")
+        self._cnx.execute(" CREATE TABLE IF NOT EXISTS tbl_spool ( "
+                          " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          " table_name TEXT NOT NULL, "
+                          " point_id INTEGER NOT NULL, "
+                          " utc_date_time TEXT NOT NULL, "
+                          " actual_value TEXT NOT NULL, "
+                          " is_trend INTEGER NOT NULL) ")
+        self._cnx.execute(" CREATE TABLE IF NOT EXISTS tbl_spool_quarantine ( "
+                          " id INTEGER PRIMARY KEY, "
+                          " table_name TEXT NOT NULL, "
+                          " point_id INTEGER NOT NULL, "
+                          " utc_date_time TEXT NOT NULL, "
+                          " actual_value TEXT NOT NULL, "
+                          " is_trend INTEGER NOT NULL) ")
+        self._cnx.commit()
+        # metrics of the spool
+        self.pending_records = self._cnx.execute(" SELECT COUNT(*) FROM tbl_spool ").fetchone()[0]
+        self.spooled_records = 0
+        self.replayed_records = 0
+        self.dropped_records = 0
+        self.quarantined_records = 0
+
+    def append(self, current_datetime_utc, analog_value_list, energy_value_list, digital_value_list):
+        """
+        Append point values of one cycle to the spool
+        :return: the number of the oldest records dropped because the spool is full
+        """
+        utc_date_time = current_datetime_utc.isoformat()
+        rows = list()
+        for table_name, point_value_list in (('tbl_analog_value', analog_value_list),
+                                             ('tbl_energy_value', energy_value_list),
+                                             ('tbl_digital_value', digital_value_list)):
+            for point_value in point_value_list:
+                rows.append((table_name, point_value['point_id'], utc_date_time,
+                             str(point_value['value']), 1 if point_value['is_trend'] else 0))
+        if len(rows) == 0:
+            return 0
+
+        with self._lock:
+            self._cnx.executemany(" INSERT INTO tbl_spool "
+                                  " (table_name, point_id, utc_date_time, actual_value, is_trend) "
+                                  " VALUES (?, ?, ?, ?, ?) ", rows)
+            dropped = max(0, self.pending_records + len(rows) - self.max_records)
+            if dropped > 0:
+                self._cnx.execute(" DELETE FROM tbl_spool "
+                                  " WHERE id IN (SELECT id FROM tbl_spool ORDER BY id LIMIT ?) ", (dropped,))
+            self._cnx.commit()
+            self.pending_records += len(rows) - dropped
+            self.spooled_records += len(rows)
+            self.dropped_records += dropped
+        return dropped
+
+    def read(self, limit):
+        """
+        Read the oldest records in the spool, records are appended in timestamp order
+        :return: list of tuples (id, table_name, point_id, utc_date_time, actual_value, is_trend)
+        """
+        with self._lock:
+            rows = self._cnx.execute(" SELECT id, table_name, point_id, utc_date_time, actual_value, is_trend "
+                                     " FROM tbl_spool "
+                                     " ORDER BY id "
+                                     " LIMIT ? ", (limit,)).fetchall()
+        return [(row[0], row[1], row[2], datetime.fromisoformat(row[3]),
+                 int(row[4]) if row[1] == 'tbl_digital_value' else Decimal(row[4]), bool(row[5]))
+                for row in rows]
+
+    def remove(self, last_id):
+        """
+        Remove the replayed records up to last_id
+        """
+        with self._lock:
+            removed = self._cnx.execute(" DELETE FROM tbl_spool WHERE id <= ? ", (last_id,)).rowcount
+            self._cnx.commit()
+            self.pending_records = max(0, self.pending_records - removed)
+            self.replayed_records += removed
+
+    def quarantine(self, last_id):
+        """
+        Move the records up to last_id to the quarantine table, the oldest quarantined records are dropped
+        when the quarantine table is full
+        :return: the number of records quarantined
+        """
+        with self._lock:
+            self._cnx.execute(" INSERT INTO tbl_spool_quarantine "
+                              " SELECT * FROM tbl_spool WHERE id <= ? ", (last_id,))
+            quarantined = self._cnx.execute(" DELETE FROM tbl_spool WHERE id <= ? ", (last_id,)).rowcount
+            self._cnx.execute(" DELETE FROM tbl_spool_quarantine "
+                              " WHERE id NOT IN (SELECT id FROM tbl_spool_quarantine ORDER BY id DESC LIMIT ?) ",
+                              (self.max_records,))
+            self._cnx.commit()
+            self.pending_records = max(0, self.pending_records - quarantined)
+            self.quarantined_records += quarantined
+        return quarantined
+
+    def metrics(self):
+        return {'pending_records': self.pending_records,
+                'spooled_records': self.spooled_records,
+                'replayed_records': self.replayed_records,
+                'dropped_records': self.dropped_records,
+                'quarantined_records': self.quarantined_records}
@@ -0,0 +1,220 @@
+import bisect
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+########################################################################################################################
+# Acquisition Telemetry
+# Each acquisition worker records counters and latency histograms of its data sources,
+# and publishes a snapshot of them to the main process through a queue after every cycle.
+# The main process serves the latest snapshots of all data sources in Prometheus text format on a local HTTP endpoint.
+########################################################################################################################
+
+# The upper bounds in seconds of the buckets of latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+COUNTERS = (('points_read_total', 'Number of point values read'),
+            ('read_errors_total', 'Number of failed Modbus requests'),
+            ('timeouts_total', 'Number of Modbus TCP timeouts'),
+            ('cycles_total', 'Number of acquisition cycles'),
+            ('cycle_overruns_total', 'Number of acquisition cycles longer than the interval'),
+            ('missed_ticks_total', 'Number of ticks of rate classes skipped because of overruns'),
+            ('slave_quarantines_total', 'Number of quarantines of slaves timed out'),
+            ('spooled_records_total', 'Number of point values appended to the local spool'),
+            ('replayed_records_total', 'Number of spooled point values replayed to the historical database'),
+            ('dropped_records_total', 'Number of spooled point values dropped because the spool is full'),
+            ('quarantined_records_total', 'Number of spooled point values quarantined because their replay failed'),
+            ('suppressed_writes_total', 'Number of trend values suppressed by deadbands'))
+
+GAUGES = (('pending_records', 'Number of point values pending in the local spool'),
+          ('last_cycle_seconds', 'Duration of the last acquisition cycle in seconds'),
+          ('quarantined_slaves', 'Number of slaves quarantined'))
+
+HISTOGRAMS = (('execute_seconds', 'Latency of Modbus requests in seconds by slave'),
+              ('db_write_seconds', 'Latency of writing point values of a cycle to the historical database in seconds'),
+              ('cycle_seconds', 'Duration of acquisition cycles in seconds'),
+              ('schedule_drift_seconds', 'Delay of ticks of rate classes behind their due time in seconds'))
+
+METRIC_PREFIX = 'myems_modbus_tcp_'
+
+
+class Histogram:
+    """Latency histogram with fixed buckets"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        # the last count is for the +Inf bucket
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """Counters and latency histograms of one data source"""
+
+    def __init__(self, data_source_id, telemetry_queue):
+        self.data_source_id = data_source_id
+        self.telemetry_queue = telemetry_queue
+        self.counters = {name: 0 for name, _ in COUNTERS}
+        self.gauges = {name: 0 for name, _ in GAUGES}
+        # (histogram name, slave id or None) -> histogram
+        self.histograms = dict()
+
+    def increase(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, value, slave_id=None):
+        key = (name, slave_id)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[key] = histogram
+        histogram.observe(value)
+
+    def end_cycle(self, cycle_seconds, interval_in_seconds, spool=None, deadband_filter=None):
+        """
+        Record the duration of a cycle and publish the snapshot to the main process
+        :param cycle_seconds: the duration of reading and writing point values of the cycle
+        :param interval_in_seconds: the interval of the data source
+        :param spool: the spool of the data source
+        :param deadband_filter: the deadband filter of the data source
+        """
+        self.counters['cycles_total'] += 1
+        if cycle_seconds > interval_in_seconds:
+            self.counters['cycle_overruns_total'] += 1
+        self.gauges['last_cycle_seconds'] = cycle_seconds
+        self.observe('cycle_seconds', cycle_seconds)
+        if spool is not None:
+            spool_metrics = spool.metrics()
+            self.counters['spooled_records_total'] = spool_metrics['spooled_records']
+            self.counters['replayed_records_total'] = spool_metrics['replayed_records']
+            self.counters['dropped_records_total'] = spool_metrics['dropped_records']
+            self.counters['quarantined_records_total'] = spool_metrics['quarantined_records']
+            self.gauges['pending_records'] = spool_metrics['pending_records']
+        if deadband_filter is not None:
+            self.counters['suppressed_writes_total'] = deadband_filter.metrics()['suppressed_writes']
+        self.publish()
+
+    def publish(self):
+        if self.telemetry_queue is None:
+            return
+        snapshot = {'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'histograms': {key: (list(histogram.counts), histogram.sum, histogram.count)
+                                   for key, histogram in self.histograms.items()}}
+        try:
+            self.telemetry_queue.put_nowait((self.data_source_id, snapshot))
+        except queue.Full:
+            # the main process is busy, the next snapshot supersedes this one
+            pass
+
+
+def render(snapshot_dict, restart_count_dict=None):
+    """
+    Render the snapshots of data sources in Prometheus text format
+    :param snapshot_dict: dictionary of data source id to snapshot
+    :param restart_count_dict: dictionary of process name to the number of restarts by the supervisor
+    :return: the text of metrics
+    """
+    lines = list()
+    if restart_count_dict is not None:
+        lines.append('# HELP ' + METRIC_PREFIX + 'process_restarts_total Number of restarts of worker processes')
+        lines.append('# TYPE ' + METRIC_PREFIX + 'process_restarts_total counter')
+        for name, restarts in sorted(restart_count_dict.items(), key=lambda x: str(x[0])):
+            lines.append(METRIC_PREFIX + 'process_restarts_total{process="' + str(name) + '"} ' + str(restarts))
+
+    for name, description in COUNTERS:
+        lines.append('# HELP ' + METRIC_PREFIX + name + ' ' + description)
+        lines.append('# TYPE ' + METRIC_PREFIX + name + ' counter')
+        for data_source_id, snapshot in sorted(snapshot_dict.items()):
+            lines.append(METRIC_PREFIX + name + '{data_source_id="' + str(data_source_id) + '"} ' +
+                         str(snapshot['counters'][name]))
+
+    for name, description in GAUGES:
+        lines.append('# HELP ' + METRIC_PREFIX + name + ' ' + description)
+        lines.append('# TYPE ' + METRIC_PREFIX + name + ' gauge')
+        for data_source_id, snapshot in sorted(snapshot_dict.items()):
+            lines.append(METRIC_PREFIX + name + '{data_source_id="' + str(data_source_id) + '"} ' +
+                         str(snapshot['gauges'][name]))
+
+    for name, description in HISTOGRAMS:
+        lines.append('# HELP ' + METRIC_PREFIX + name + ' ' + description)
+        lines.append('# TYPE ' + METRIC_PREFIX + name + ' histogram')
+        for data_source_id, snapshot in sorted(snapshot_dict.items()):
+            for (histogram_name, slave_id), (counts, total, count) in \
+                    sorted(snapshot['histograms'].items(), key=lambda x: str(x[0][1])):
+                if histogram_name != name:
+                    continue
+                labels = 'data_source_id="' + str(data_source_id) + '"'
+                if slave_id is not None:
+                    labels += ',slave_id="' + str(slave_id) + '"'
+                cumulative_count = 0
+                for upper_bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf', ), counts):
+                    cumulative_count += bucket_count
+                    lines.append(METRIC_PREFIX + name + '_bucket{' + labels + ',le="' + str(upper_bound) + '"} ' +
+                                 str(cumulative_count))
+                lines.append(METRIC_PREFIX + name + '_sum{' + labels + '} ' + str(total))
+                lines.append(METRIC_PREFIX + name + '_count{' + labels + '} ' + str(count))
+
+    return '\n'.join(lines) + '\n'
+
+
+class TelemetryServer:
+    """Collect snapshots from acquisition workers and serve them on a local HTTP endpoint"""
+
+    def __init__(self, host, port, telemetry_queue):
+        self.host = host
+        self.port = port
+        self.telemetry_queue = telemetry_queue
+        self._lock = threading.Lock()
+        self._snapshot_dict = dict()
+        self._restart_count_dict = None
+
+    def start(self):
+        threading.Thread(target=self._collect, daemon=True).start()
+
+        telemetry_server = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = telemetry_server.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # do not log every scrape
+                pass
+
+        http_server = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+    def remove(self, data_source_id):
+        """Remove the snapshot of a stopped data source"""
+        with self._lock:
+            self._snapshot_dict.pop(data_source_id, None)
+
+    def set_restart_counts(self, restart_count_dict):
+        """Update the restart counts of worker processes reported by the supervisor"""
+        with self._lock:
+            self._restart_count_dict = dict(restart_count_dict)
+
+    def render(self):
+        with self._lock:
+            return render(self._snapshot_dict, self._restart_count_dict)
+
+    def _collect(self):
+        while True:
+            data_source_id, snapshot = self.telemetry_queue.get()
+            with self._lock:
+                self._snapshot_dict[data_source_id] = snapshot
@@ -0,0 +1,51 @@
+import json
+import unittest
+
+from poll_schedule import advance, build_schedule, get_due_rate_classes, get_next_due_time
+from read_plan import compile_point
+
+
+########################################################################################################################
+# Unit tests of the multi-rate polling schedule
+#
+# Usage: python3 -m unittest test_poll_schedule
+########################################################################################################################
+
+
+def point(point_id, offset, interval_in_seconds=None):
+    address = {'slave_id': 1, 'function_code': 3, 'offset': offset, 'number_of_registers': 2, 'format': '>f',
+               'byte_swap': False}
+    if interval_in_seconds is not None:
+        address['interval_in_seconds'] = interval_in_seconds
+    return compile_point((point_id, 'point' + str(point_id), 'ANALOG_VALUE', True, 1, json.dumps(address)))
+
+
+class PollScheduleTest(unittest.TestCase):
+
+    def test_empty_schedule(self):
+        # all points of the data source were removed by a reload
+        rate_class_list = build_schedule(list(), 60, 10, 100.0)
+        self.assertEqual(rate_class_list, list())
+        self.assertEqual(get_due_rate_classes(rate_class_list, 100.0), list())
+        self.assertEqual(get_next_due_time(rate_class_list, 100.0, 60), 160.0)
+
+    def test_rate_classes(self):
+        rate_class_list = build_schedule([point(1, 0, 5), point(2, 2), point(3, 4, 5)], 60, 10, 100.0)
+        self.assertEqual([rate_class.interval_in_seconds for rate_class in rate_class_list], [5, 60])
+        self.assertEqual([[p.id for p in rate_class.point_list] for rate_class in rate_class_list], [[1, 3], [2]])
+        self.assertEqual(len(get_due_rate_classes(rate_class_list, 100.0)), 2)
+
+        self.assertEqual(advance(rate_class_list[0], 101.0), 0)
+        self.assertEqual(advance(rate_class_list[1], 101.0), 0)
+        self.assertEqual(get_due_rate_classes(rate_class_list, 101.0), list())
+        self.assertEqual(get_next_due_time(rate_class_list, 101.0, 60), 105.0)
+
+    def test_missed_ticks(self):
+        rate_class_list = build_schedule([point(1, 0, 5)], 60, 10, 100.0)
+        # the tick overran by more than two intervals
+        self.assertEqual(advance(rate_class_list[0], 112.0), 2)
+        self.assertEqual(get_next_due_time(rate_class_list, 112.0, 60), 115.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -44,3 +44,21 @@ utc_offset = config('UTC_OFFSET', default='+08:00')
 # the pool size depends on the computing performance of the database server and the analysis server
 pool_size = config('POOL_SIZE', default=5, cast=int)
 
+# the number of meters normalized together by a worker in one batch
+# each batch reads the last normalized time slots, the raw data and inserts the normalized values of its meters
+# with a few queries on one connection to each database
+meter_batch_size = config('METER_BATCH_SIZE', default=100, cast=int)
+
+# indicates how many rows are fetched at a time when streaming large scans of historical values
+fetch_size = config('FETCH_SIZE', default=10000, cast=int)
+
+# indicates how the supervisor starts and restarts worker processes
+# worker processes are started one after another in start interval to spread the start-up storm,
+# and a worker process terminated unexpectedly is restarted with exponential backoff from initial to max,
+# the backoff is reset if the restarted process has run longer than stable time
+supervisor = {
+    'start_interval_in_seconds': config('SUPERVISOR_START_INTERVAL_IN_SECONDS', default=1.0, cast=float),
+    'backoff_initial_in_seconds': config('SUPERVISOR_BACKOFF_INITIAL_IN_SECONDS', default=5.0, cast=float),
+    'backoff_max_in_seconds': config('SUPERVISOR_BACKOFF_MAX_IN_SECONDS', default=600.0, cast=float),
+    'stable_in_seconds': config('SUPERVISOR_STABLE_IN_SECONDS', default=600.0, cast=float),
+}
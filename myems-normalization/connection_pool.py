@@ -0,0 +1,88 @@
+import mysql.connector
+
+########################################################################################################################
+# Per-process Connection Pool
+# Each process of a multiprocessing pool keeps its connections to databases and reuses them in all tasks,
+# so that the cost of connecting and handshaking is paid once per process instead of once per task.
+# The pool is created by initialize in the initializer of the multiprocessing pool.
+# Workers get connections with connect instead of mysql.connector.connect,
+# and return them to the pool with close as before.
+# An idle connection is checked with ping before it is reused and is replaced by a new connection if it is broken.
+########################################################################################################################
+
+# (database config items) -> list of idle connections of this process
+_idle_connection_dict = dict()
+
+
+def _get_key(database_config):
+    return tuple(sorted(database_config.items()))
+
+
+def _close_quietly(cnx):
+    try:
+        cnx.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """A connection borrowed from the pool of the process, it is returned to the pool on close"""
+
+    def __init__(self, key, cnx):
+        self._key = key
+        self._cnx = cnx
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def close(self):
+        """Return the connection to the pool, the connection is closed if it is broken"""
+        if self._cnx is None:
+            return
+        cnx = self._cnx
+        self._cnx = None
+        try:
+            # end the transaction left by the task, so that the next task reads the latest committed data
+            cnx.rollback()
+        except Exception:
+            _close_quietly(cnx)
+            return
+        _idle_connection_dict.setdefault(self._key, list()).append(cnx)
+
+
+def initialize(logger, database_config_list):
+    """
+    Create the pool of the process with one connection to each database, used as initializer of multiprocessing pool
+    The connections which cannot be established now are established by connect later.
+    :param logger: the logger of the service
+    :param database_config_list: list of database configs in config.py
+    """
+    # NOTE: the connections inherited from the parent process must not be used by the child process
+    _idle_connection_dict.clear()
+    for database_config in database_config_list:
+        try:
+            cnx = mysql.connector.connect(**database_config)
+        except Exception as e:
+            logger.error("Error in connection_pool.initialize " + str(e))
+            continue
+        _idle_connection_dict.setdefault(_get_key(database_config), list()).append(cnx)
+
+
+def connect(database_config):
+    """
+    Get a healthy connection to the database from the pool of the process, or a new connection if there is none
+    :param database_config: database config in config.py
+    :return: the pooled connection, which is returned to the pool by close
+    """
+    key = _get_key(database_config)
+    idle_connection_list = _idle_connection_dict.get(key, list())
+    while len(idle_connection_list) > 0:
+        cnx = idle_connection_list.pop()
+        try:
+            # the server closes connections idle longer than wait_timeout, reconnect once if it is closed
+            cnx.ping(reconnect=True, attempts=1, delay=0)
+        except Exception:
+            _close_quietly(cnx)
+            continue
+        return PooledConnection(key, cnx)
+    return PooledConnection(key, mysql.connector.connect(**database_config))
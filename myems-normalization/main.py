@@ -1,11 +1,12 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from multiprocessing import Process
+import config
 import datarepair
 import meter
 import offlinemeter
 import virtualmeter
 import virtualpoint
+from supervisor import Supervisor
 
 
 def main():
@@ -27,14 +28,24 @@ def main():
     # send logging output to sys.stderr
     logger.addHandler(logging.StreamHandler())
 
+    # worker processes terminated unexpectedly are restarted with exponential backoff
+    supervisor = Supervisor(logger,
+                            config.supervisor['start_interval_in_seconds'],
+                            config.supervisor['backoff_initial_in_seconds'],
+                            config.supervisor['backoff_max_in_seconds'],
+                            config.supervisor['stable_in_seconds'])
+
     # calculate energy consumption in hourly period
-    Process(target=meter.calculate_hourly, args=(logger,)).start()
-    Process(target=offlinemeter.calculate_hourly, args=(logger,)).start()
-    Process(target=virtualmeter.calculate_hourly, args=(logger,)).start()
+    supervisor.add('meter', meter.calculate_hourly, (logger,))
+    supervisor.add('offlinemeter', offlinemeter.calculate_hourly, (logger,))
+    supervisor.add('virtualmeter', virtualmeter.calculate_hourly, (logger,))
     # calculate virtual point value
-    Process(target=virtualpoint.calculate, args=(logger,)).start()
+    supervisor.add('virtualpoint', virtualpoint.calculate, (logger,))
     # repair historical energy value
-    Process(target=datarepair.do, args=(logger,)).start()
+    supervisor.add('datarepair', datarepair.do, (logger,))
+
+    # watch worker processes forever
+    supervisor.run_forever()
 
 
 if __name__ == '__main__':
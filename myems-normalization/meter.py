@@ -2,20 +2,31 @@ import random
 import time
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from itertools import groupby
 from multiprocessing import Pool
 import mysql.connector
 import config
+import connection_pool
 
 
 ########################################################################################################################
 # PROCEDURES:
 # Step 1: Query all meters and associated energy value points
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 2: Call worker in parallel with the multiprocessing pool with batches of meters
 ########################################################################################################################
 
+# the number of normalized values inserted in one statement
+INSERT_BATCH_SIZE = 1000
+
 
 def calculate_hourly(logger):
 
+    # the multiprocessing pool lives as long as this process, so that its worker processes reuse their
+    # connections to databases in all cycles, see connection_pool.py
+    p = Pool(processes=config.pool_size,
+             initializer=connection_pool.initialize,
+             initargs=(logger, [config.myems_energy_db, config.myems_historical_db],))
+
     while True:
         ################################################################################################################
         # Step 1: Query all meters and associated energy value points
@@ -79,16 +90,16 @@ def calculate_hourly(logger):
         print("Got all meters in MyEMS System Database")
 
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Call worker in parallel with the multiprocessing pool with batches of meters
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
-        error_list = p.map(worker, meter_list)
-        p.close()
-        p.join()
+        batch_list = [meter_list[i:i + config.meter_batch_size]
+                      for i in range(0, len(meter_list), config.meter_batch_size)]
+        error_lists = p.map(worker, batch_list)
 
-        for error in error_list:
-            if error is not None and len(error) > 0:
-                logger.error(error)
+        for error_list in error_lists:
+            for error in error_list:
+                if error is not None and len(error) > 0:
+                    logger.error(error)
 
         print("go to sleep ...")
         time.sleep(60)
@@ -96,100 +107,272 @@ def calculate_hourly(logger):
     # end of outer while
 
 
+def fetch_in_chunks(cursor, size):
+    """Yield the rows of the executed query, fetching at most size rows from the server at a time"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if rows is None or len(rows) == 0:
+            return
+        for row in rows:
+            yield row
+
+
+def normalize_energy_values(row_iterator, start_datetime_utc, end_datetime_utc, minutes_to_count,
+                            previous_value, low_limit, high_limit):
+    """
+    Normalize energy values into time slots of minutes_to_count in a single pass
+    Each value is bucketed into its time slot by the integer division of its offset from start_datetime_utc,
+    and the increment of a time slot is the sum of positive differences between consecutive values.
+    :param row_iterator: iterator of (utc_date_time, actual_value) in time order, within start and end datetime
+    :param start_datetime_utc: start datetime of the first time slot
+    :param end_datetime_utc: end datetime of the last time slot
+    :param minutes_to_count: length of time slots in minutes
+    :param previous_value: the latest value before start_datetime_utc, or None
+    :param low_limit: increments less than low limit are omitted
+    :param high_limit: increments greater than high limit are omitted
+    :return: list of {'start_datetime_utc', 'actual_value'} of all time slots
+    """
+    ####################################################################################################################
+    # special test case 1 (disconnected)
+    # id       point_id  utc_date_time        actual_value
+    # '878152', '3315', '2016-12-05 23:58:46', '38312088'
+    # '878183', '3315', '2016-12-05 23:59:48', '38312088'
+    # '878205', '3315', '2016-12-06 06:14:49', '38315900'
+    # '878281', '3315', '2016-12-06 06:15:50', '38315928'
+    # '878357', '3315', '2016-12-06 06:16:52', '38315928'
+    ####################################################################################################################
+
+    ####################################################################################################################
+    # special test case 2 (a new added used meter)
+    # id,         point_id,  utc_date_time,      actual_value
+    # '19070111', '1734', '2017-03-27 02:36:07', '56842220.77297248'
+    # '19069943', '1734', '2017-03-27 02:35:04', '56842208.420127675'
+    # '19069775', '1734', '2017-03-27 02:34:01', '56842195.95270827'
+    # '19069608', '1734', '2017-03-27 02:32:58', '56842183.48610827'
+    # '19069439', '1734', '2017-03-27 02:31:53', '56842170.812365524'
+    # '19069270', '1734', '2017-03-27 02:30:48', '56842157.90797222'
+    # null,       null,   null,                , null
+
+    ####################################################################################################################
+
+    ####################################################################################################################
+    # special test case 3 (hi_limit exceeded)
+    # id       point_id  utc_date_time        actual_value
+    # '3230282', '3336', '2016-12-24 08:26:14', '999984.0625'
+    # '3230401', '3336', '2016-12-24 08:27:15', '999984.0625'
+    # '3230519', '3336', '2016-12-24 08:28:17', '999984.0625'
+    # '3230638', '3336', '2016-12-24 08:29:18', '20'
+    # '3230758', '3336', '2016-12-24 08:30:20', '20'
+    # '3230878', '3336', '2016-12-24 08:31:21', '20'
+    ####################################################################################################################
+
+    ####################################################################################################################
+    # test case 4 (recovered from bad zeroes)
+    # id      point_id  utc_date_time       actual_value is_bad
+    # 300366736	1003344	2019-03-14 02:03:20	1103860.625
+    # 300366195	1003344	2019-03-14 02:02:19	1103845
+    # 300365654	1003344	2019-03-14 02:01:19	1103825.5
+    # 300365106	1003344	2019-03-14 02:00:18	1103804.25
+    # 300364562	1003344	2019-03-14 01:59:17	1103785.625
+    # 300364021	1003344	2019-03-14 01:58:17	1103770.875
+    # 300363478	1003344	2019-03-14 01:57:16	1103755.125
+    # 300362936	1003344	2019-03-14 01:56:16	1103739.375
+    # 300362393	1003344	2019-03-14 01:55:15	1103720.625
+    # 300361851	1003344	2019-03-14 01:54:15	1103698.125
+    # 300361305	1003344	2019-03-14 01:53:14	1103674.75
+    # 300360764	1003344	2019-03-14 01:52:14	1103649
+    # 300360221	1003344	2019-03-14 01:51:13	1103628.25
+    # 300359676	1003344	2019-03-14 01:50:13	1103608.625
+    # 300359133	1003344	2019-03-14 01:49:12	1103586.75
+    # 300358592	1003344	2019-03-14 01:48:12	1103564
+    # 300358050	1003344	2019-03-14 01:47:11	1103542
+    # 300357509	1003344	2019-03-14 01:46:11	1103520.625
+    # 300356966	1003344	2019-03-14 01:45:10	1103499.375
+    # 300356509	1003344	2019-03-14 01:44:10	1103478.25
+    # 300355964	1003344	2019-03-14 01:43:09	1103456.25
+    # 300355419	1003344	2019-03-14 01:42:09	1103435.5
+    # 300354878	1003344	2019-03-14 01:41:08	1103414.625
+    # 300354335	1003344	2019-03-14 01:40:08	1103391.875
+    # 300353793	1003344	2019-03-14 01:39:07	1103373
+    # 300353248	1003344	2019-03-14 01:38:07	1103349
+    # 300352705	1003344	2019-03-14 01:37:06	1103325.75
+    # 300352163	1003344	2019-03-14 01:36:06	0	            1
+    # 300351621	1003344	2019-03-14 01:35:05	0	            1
+    # 300351080	1003344	2019-03-14 01:34:05	0	            1
+    # 300350532	1003344	2019-03-14 01:33:04	0	            1
+    # 300349988	1003344	2019-03-14 01:32:04	0	            1
+    # 300349446	1003344	2019-03-14 01:31:03	0	            1
+    # 300348903	1003344	2019-03-14 01:30:02	0	            1
+    # 300348359	1003344	2019-03-14 01:29:02	0	            1
+    # 300347819	1003344	2019-03-14 01:28:01	0	            1
+    # 300347277	1003344	2019-03-14 01:27:01	0	            1
+    # 300346733	1003344	2019-03-14 01:26:00	0	            1
+    # 300346191	1003344	2019-03-14 01:25:00	0	            1
+    ####################################################################################################################
+
+    slot_length = timedelta(minutes=minutes_to_count)
+    # NOTE: utc_date_time of rows from the historical database is naive
+    naive_start_datetime_utc = start_datetime_utc.replace(tzinfo=None)
+    number_of_slots = (end_datetime_utc - start_datetime_utc) // slot_length
+
+    def check_increment(initial_maximum, increment):
+        # omit huge initial value for a new meter
+        # or omit huge value for a recovered meter with zero values during failure
+        # NOTE: this method may cause the lose of energy consumption in this time slot
+        if initial_maximum <= Decimal(0.1):
+            return Decimal(0.0)
+        # check with hourly low limit
+        if increment < low_limit:
+            return Decimal(0.0)
+        # check with hourly high limit
+        # NOTE: this method may cause the lose of energy consumption in this time slot
+        if increment > high_limit:
+            return Decimal(0.0)
+        return increment
+
+    # time slots without values have no increment
+    increment_list = [Decimal(0.0)] * number_of_slots
+    maximum = Decimal(0.0)
+    if previous_value is not None and previous_value > Decimal(0.0):
+        maximum = previous_value
+    slot_index = None
+    initial_maximum = maximum
+    increment = Decimal(0.0)
+    for utc_date_time, actual_value in row_iterator:
+        index = (utc_date_time.replace(tzinfo=None) - naive_start_datetime_utc) // slot_length
+        if index >= number_of_slots:
+            break
+        if index != slot_index:
+            if slot_index is not None:
+                increment_list[slot_index] = check_increment(initial_maximum, increment)
+            slot_index = index
+            # maximum should be equal to the maximum value of last time here
+            initial_maximum = maximum
+            increment = Decimal(0.0)
+        # get the energy increment one by one in current time slot
+        if maximum < actual_value:
+            increment += actual_value - maximum
+        maximum = actual_value
+    if slot_index is not None:
+        increment_list[slot_index] = check_increment(initial_maximum, increment)
+
+    return [{'start_datetime_utc': start_datetime_utc + index * slot_length, 'actual_value': increment}
+            for index, increment in enumerate(increment_list)]
+
+
 ########################################################################################################################
 # PROCEDURES:
-# Step 1: Determine the start datetime and end datetime
-# Step 2: Get raw data from historical database between start_datetime_utc and end datetime
+# Step 1: Determine the start datetime and end datetime of each meter in the batch
+# Step 2: Get raw data of all meters in the batch from historical database in one range scan
 # Step 3: Normalize energy values by minutes_to_count
 # Step 4: Insert into energy database
 #
-# NOTE: returns None or the error string because that the logger object cannot be passed in as parameter
+# Meters are normalized in batches of METER_BATCH_SIZE, so that each batch takes one connection to each database
+# and a few queries in total instead of a few queries for each meter.
+# NOTE: returns the list of error strings because that the logger object cannot be passed in as parameter
 ########################################################################################################################
 
-def worker(meter):
-    print("Start to process meter: " + "'" + meter['name'] + "'")
+def worker(meter_list):
+    print("Start to process " + str(len(meter_list)) + " meters")
+    error_list = list()
     ####################################################################################################################
-    # Step 1: Determine the start datetime and end datetime
+    # Step 1: Determine the start datetime and end datetime of each meter in the batch
     ####################################################################################################################
     cnx_energy_db = None
     cursor_energy_db = None
     try:
-        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+        cnx_energy_db = connection_pool.connect(config.myems_energy_db)
         cursor_energy_db = cnx_energy_db.cursor()
     except Exception as e:
-        error_string = "Error in step 1.1 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
+        error_string = "Error in step 1.1 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
         if cursor_energy_db:
             cursor_energy_db.close()
         if cnx_energy_db:
             cnx_energy_db.close()
         print(error_string)
-        return error_string
-
-    # get the initial start datetime from config file in case there is no energy data
-    start_datetime_utc = datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S')
-    start_datetime_utc = start_datetime_utc.replace(tzinfo=timezone.utc)
-    start_datetime_utc = start_datetime_utc.replace(minute=0, second=0, microsecond=0)
+        error_list.append(error_string)
+        return error_list
 
+    # get the last normalized time slot of all meters in the batch with one GROUP BY
+    last_datetime_dict = dict()
     try:
-        query = (" SELECT MAX(start_datetime_utc) "
+        meter_id_set = set(meter['id'] for meter in meter_list)
+        query = (" SELECT meter_id, MAX(start_datetime_utc) "
                  " FROM tbl_meter_hourly "
-                 " WHERE meter_id = %s ")
-        cursor_energy_db.execute(query, (meter['id'],))
-        row_datetime = cursor_energy_db.fetchone()
+                 " WHERE meter_id IN (" + ', '.join(['%s'] * len(meter_id_set)) + ") "
+                 " GROUP BY meter_id ")
+        cursor_energy_db.execute(query, tuple(meter_id_set))
+        rows_datetime = cursor_energy_db.fetchall()
+        if rows_datetime is not None and len(rows_datetime) > 0:
+            for row in rows_datetime:
+                if isinstance(row[1], datetime):
+                    last_datetime_dict[row[0]] = row[1]
     except Exception as e:
-        error_string = "Error in step 1.3 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
+        error_string = "Error in step 1.3 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
         if cursor_energy_db:
             cursor_energy_db.close()
         if cnx_energy_db:
             cnx_energy_db.close()
         print(error_string)
-        return error_string
+        error_list.append(error_string)
+        return error_list
 
-    if row_datetime is not None and len(row_datetime) > 0 and isinstance(row_datetime[0], datetime):
-        start_datetime_utc = row_datetime[0].replace(tzinfo=timezone.utc)
-        # replace second and microsecond with 0
-        # NOTE: DO NOT replace minute in case of calculating in half hourly
-        start_datetime_utc = start_datetime_utc.replace(second=0, microsecond=0)
-        # start from the next time slot
-        start_datetime_utc += timedelta(minutes=config.minutes_to_count)
+    # get the initial start datetime from config file in case there is no energy data
+    initial_start_datetime_utc = datetime.strptime(config.start_datetime_utc, '%Y-%m-%d %H:%M:%S')
+    initial_start_datetime_utc = initial_start_datetime_utc.replace(tzinfo=timezone.utc)
+    initial_start_datetime_utc = initial_start_datetime_utc.replace(minute=0, second=0, microsecond=0)
 
-    end_datetime_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
     # we should allow myems-cleaning service to take at most [minutes_to_clean] minutes to clean the data
-    end_datetime_utc -= timedelta(minutes=config.minutes_to_clean)
-
-    time_difference = end_datetime_utc - start_datetime_utc
-    time_difference_in_minutes = time_difference / timedelta(minutes=1)
-    if time_difference_in_minutes < config.minutes_to_count:
-        error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
-        print(error_string)
-        return error_string
-
-    # trim end_datetime_utc
-    trimmed_end_datetime_utc = start_datetime_utc + timedelta(minutes=config.minutes_to_count)
-    while trimmed_end_datetime_utc <= end_datetime_utc:
-        trimmed_end_datetime_utc += timedelta(minutes=config.minutes_to_count)
+    now_end_datetime_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now_end_datetime_utc -= timedelta(minutes=config.minutes_to_clean)
+
+    # list of (meter index, meter, start datetime, end datetime) of meters to be normalized
+    slot_list = list()
+    for index, meter in enumerate(meter_list):
+        start_datetime_utc = initial_start_datetime_utc
+        if meter['id'] in last_datetime_dict:
+            start_datetime_utc = last_datetime_dict[meter['id']].replace(tzinfo=timezone.utc)
+            # replace second and microsecond with 0
+            # NOTE: DO NOT replace minute in case of calculating in half hourly
+            start_datetime_utc = start_datetime_utc.replace(second=0, microsecond=0)
+            # start from the next time slot
+            start_datetime_utc += timedelta(minutes=config.minutes_to_count)
+
+        time_difference = now_end_datetime_utc - start_datetime_utc
+        time_difference_in_minutes = time_difference / timedelta(minutes=1)
+        if time_difference_in_minutes < config.minutes_to_count:
+            error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
+            print(error_string)
+            error_list.append(error_string)
+            continue
 
-    end_datetime_utc = trimmed_end_datetime_utc - timedelta(minutes=config.minutes_to_count)
+        # trim end_datetime_utc to the end of the last whole time slot
+        end_datetime_utc = start_datetime_utc + \
+            (now_end_datetime_utc - start_datetime_utc) // timedelta(minutes=config.minutes_to_count) * \
+            timedelta(minutes=config.minutes_to_count)
 
-    if end_datetime_utc <= start_datetime_utc:
-        error_string = "it's too early to calculate" + " for '" + meter['name'] + "'"
-        print(error_string)
-        return error_string
+        print("start_datetime_utc: " + start_datetime_utc.isoformat()[0:19]
+              + "end_datetime_utc: " + end_datetime_utc.isoformat()[0:19] + " for '" + meter['name'] + "'")
+        slot_list.append((index, meter, start_datetime_utc, end_datetime_utc))
 
-    print("start_datetime_utc: " + start_datetime_utc.isoformat()[0:19]
-          + "end_datetime_utc: " + end_datetime_utc.isoformat()[0:19])
+    if len(slot_list) == 0:
+        if cursor_energy_db:
+            cursor_energy_db.close()
+        if cnx_energy_db:
+            cnx_energy_db.close()
+        return error_list
 
     ####################################################################################################################
-    # Step 2: Get raw data from historical database between start_datetime_utc and end_datetime_utc
+    # Step 2: Get raw data of all meters in the batch from historical database in one range scan
     ####################################################################################################################
 
     cnx_historical_db = None
     cursor_historical_db = None
     try:
-        cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
+        cnx_historical_db = connection_pool.connect(config.myems_historical_db)
         cursor_historical_db = cnx_historical_db.cursor()
     except Exception as e:
-        error_string = "Error in step 1.2 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
+        error_string = "Error in step 1.2 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
         if cursor_historical_db:
             cursor_historical_db.close()
         if cnx_historical_db:
@@ -201,24 +384,40 @@ def worker(meter):
             cnx_energy_db.close()
 
         print(error_string)
-        return error_string
+        error_list.append(error_string)
+        return error_list
 
-    # query latest record before start_datetime_utc
-    energy_value_just_before_start = dict()
+    # query latest record before start_datetime_utc of each meter
+    # NOTE: the time slots of meters are bulk inserted into a temporary table to join with energy values
+    previous_value_dict = dict()
     try:
-        query = (" SELECT utc_date_time, actual_value "
-                 " FROM tbl_energy_value "
-                 " WHERE point_id = %s AND utc_date_time < %s AND is_bad = 0 "
-                 " ORDER BY utc_date_time DESC "
-                 " LIMIT 1 ")
-        cursor_historical_db.execute(query, (meter['point_id'], start_datetime_utc,))
-        row_energy_value_before_start = cursor_historical_db.fetchone()
-
-        if row_energy_value_before_start is not None and len(row_energy_value_before_start) > 0:
-            energy_value_just_before_start = {"utc_date_time": row_energy_value_before_start[0],
-                                              "actual_value": row_energy_value_before_start[1]}
+        cursor_historical_db.execute(" CREATE TEMPORARY TABLE IF NOT EXISTS tmp_meter_slots ( "
+                                     " meter_index INT NOT NULL, "
+                                     " point_id BIGINT NOT NULL, "
+                                     " start_datetime_utc DATETIME NOT NULL, "
+                                     " end_datetime_utc DATETIME NOT NULL, "
+                                     " PRIMARY KEY (meter_index)) ")
+        cursor_historical_db.execute(" DELETE FROM tmp_meter_slots ")
+        cursor_historical_db.executemany(" INSERT INTO tmp_meter_slots "
+                                         " (meter_index, point_id, start_datetime_utc, end_datetime_utc) "
+                                         " VALUES (%s, %s, %s, %s) ",
+                                         [(index, meter['point_id'], start_datetime_utc, end_datetime_utc)
+                                          for index, meter, start_datetime_utc, end_datetime_utc in slot_list])
+
+        query = (" SELECT s.meter_index, "
+                 "        (SELECT v.actual_value "
+                 "         FROM tbl_energy_value v "
+                 "         WHERE v.point_id = s.point_id AND v.utc_date_time < s.start_datetime_utc AND v.is_bad = 0 "
+                 "         ORDER BY v.utc_date_time DESC "
+                 "         LIMIT 1) "
+                 " FROM tmp_meter_slots s ")
+        cursor_historical_db.execute(query)
+        rows_energy_value_before_start = cursor_historical_db.fetchall()
+        if rows_energy_value_before_start is not None and len(rows_energy_value_before_start) > 0:
+            for row in rows_energy_value_before_start:
+                previous_value_dict[row[0]] = row[1]
     except Exception as e:
-        error_string = "Error in step 2.2 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
+        error_string = "Error in step 2.2 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
         if cursor_historical_db:
             cursor_historical_db.close()
         if cnx_historical_db:
@@ -230,18 +429,28 @@ def worker(meter):
             cnx_energy_db.close()
 
         print(error_string)
-        return error_string
+        error_list.append(error_string)
+        return error_list
 
-    # query energy values to be normalized
+    # query energy values of all meters in the batch to be normalized
+    # NOTE: the rows are streamed in chunks and normalized in step 3 before the next chunk is fetched,
+    # so that memory stays flat no matter how large the backlog is
     try:
-        query = (" SELECT utc_date_time, actual_value "
-                 " FROM tbl_energy_value "
-                 " WHERE point_id = %s AND utc_date_time >= %s AND utc_date_time < %s AND is_bad = 0 "
-                 " ORDER BY utc_date_time ")
-        cursor_historical_db.execute(query, (meter['point_id'], start_datetime_utc, end_datetime_utc))
-        rows_energy_values = cursor_historical_db.fetchall()
+        query = (" SELECT s.meter_index, v.utc_date_time, v.actual_value "
+                 " FROM tmp_meter_slots s "
+                 " INNER JOIN tbl_energy_value v ON v.point_id = s.point_id "
+                 " WHERE v.utc_date_time >= s.start_datetime_utc AND v.utc_date_time < s.end_datetime_utc "
+                 "       AND v.is_bad = 0 "
+                 " ORDER BY s.meter_index, v.utc_date_time ")
+        cursor_historical_db.execute(query)
+        group_iterator = groupby(fetch_in_chunks(cursor_historical_db, config.fetch_size), key=lambda row: row[0])
+        next_group = next(group_iterator, None)
     except Exception as e:
-        error_string = "Error in step 2.3 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
+        error_string = "Error in step 2.3 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
+        if cursor_historical_db:
+            cursor_historical_db.close()
+        if cnx_historical_db:
+            cnx_historical_db.close()
 
         if cursor_energy_db:
             cursor_energy_db.close()
@@ -249,185 +458,72 @@ def worker(meter):
             cnx_energy_db.close()
 
         print(error_string)
-        return error_string
-    finally:
-        if cursor_historical_db:
-            cursor_historical_db.close()
-        if cnx_historical_db:
-            cnx_historical_db.close()
+        error_list.append(error_string)
+        return error_list
 
     ####################################################################################################################
     # Step 3: Normalize energy values by minutes_to_count
     ####################################################################################################################
-
-    ####################################################################################################################
-    # special test case 1 (disconnected)
-    # id       point_id  utc_date_time        actual_value
-    # '878152', '3315', '2016-12-05 23:58:46', '38312088'
-    # '878183', '3315', '2016-12-05 23:59:48', '38312088'
-    # '878205', '3315', '2016-12-06 06:14:49', '38315900'
-    # '878281', '3315', '2016-12-06 06:15:50', '38315928'
-    # '878357', '3315', '2016-12-06 06:16:52', '38315928'
-    ####################################################################################################################
-
-    ####################################################################################################################
-    # special test case 2 (a new added used meter)
-    # id,         point_id,  utc_date_time,      actual_value
-    # '19070111', '1734', '2017-03-27 02:36:07', '56842220.77297248'
-    # '19069943', '1734', '2017-03-27 02:35:04', '56842208.420127675'
-    # '19069775', '1734', '2017-03-27 02:34:01', '56842195.95270827'
-    # '19069608', '1734', '2017-03-27 02:32:58', '56842183.48610827'
-    # '19069439', '1734', '2017-03-27 02:31:53', '56842170.812365524'
-    # '19069270', '1734', '2017-03-27 02:30:48', '56842157.90797222'
-    # null,       null,   null,                , null
-
-    ####################################################################################################################
-
-    ####################################################################################################################
-    # special test case 3 (hi_limit exceeded)
-    # id       point_id  utc_date_time        actual_value
-    # '3230282', '3336', '2016-12-24 08:26:14', '999984.0625'
-    # '3230401', '3336', '2016-12-24 08:27:15', '999984.0625'
-    # '3230519', '3336', '2016-12-24 08:28:17', '999984.0625'
-    # '3230638', '3336', '2016-12-24 08:29:18', '20'
-    # '3230758', '3336', '2016-12-24 08:30:20', '20'
-    # '3230878', '3336', '2016-12-24 08:31:21', '20'
-    ####################################################################################################################
-
-    ####################################################################################################################
-    # test case 4 (recovered from bad zeroes)
-    # id      point_id  utc_date_time       actual_value is_bad
-    # 300366736	1003344	2019-03-14 02:03:20	1103860.625
-    # 300366195	1003344	2019-03-14 02:02:19	1103845
-    # 300365654	1003344	2019-03-14 02:01:19	1103825.5
-    # 300365106	1003344	2019-03-14 02:00:18	1103804.25
-    # 300364562	1003344	2019-03-14 01:59:17	1103785.625
-    # 300364021	1003344	2019-03-14 01:58:17	1103770.875
-    # 300363478	1003344	2019-03-14 01:57:16	1103755.125
-    # 300362936	1003344	2019-03-14 01:56:16	1103739.375
-    # 300362393	1003344	2019-03-14 01:55:15	1103720.625
-    # 300361851	1003344	2019-03-14 01:54:15	1103698.125
-    # 300361305	1003344	2019-03-14 01:53:14	1103674.75
-    # 300360764	1003344	2019-03-14 01:52:14	1103649
-    # 300360221	1003344	2019-03-14 01:51:13	1103628.25
-    # 300359676	1003344	2019-03-14 01:50:13	1103608.625
-    # 300359133	1003344	2019-03-14 01:49:12	1103586.75
-    # 300358592	1003344	2019-03-14 01:48:12	1103564
-    # 300358050	1003344	2019-03-14 01:47:11	1103542
-    # 300357509	1003344	2019-03-14 01:46:11	1103520.625
-    # 300356966	1003344	2019-03-14 01:45:10	1103499.375
-    # 300356509	1003344	2019-03-14 01:44:10	1103478.25
-    # 300355964	1003344	2019-03-14 01:43:09	1103456.25
-    # 300355419	1003344	2019-03-14 01:42:09	1103435.5
-    # 300354878	1003344	2019-03-14 01:41:08	1103414.625
-    # 300354335	1003344	2019-03-14 01:40:08	1103391.875
-    # 300353793	1003344	2019-03-14 01:39:07	1103373
-    # 300353248	1003344	2019-03-14 01:38:07	1103349
-    # 300352705	1003344	2019-03-14 01:37:06	1103325.75
-    # 300352163	1003344	2019-03-14 01:36:06	0	            1
-    # 300351621	1003344	2019-03-14 01:35:05	0	            1
-    # 300351080	1003344	2019-03-14 01:34:05	0	            1
-    # 300350532	1003344	2019-03-14 01:33:04	0	            1
-    # 300349988	1003344	2019-03-14 01:32:04	0	            1
-    # 300349446	1003344	2019-03-14 01:31:03	0	            1
-    # 300348903	1003344	2019-03-14 01:30:02	0	            1
-    # 300348359	1003344	2019-03-14 01:29:02	0	            1
-    # 300347819	1003344	2019-03-14 01:28:01	0	            1
-    # 300347277	1003344	2019-03-14 01:27:01	0	            1
-    # 300346733	1003344	2019-03-14 01:26:00	0	            1
-    # 300346191	1003344	2019-03-14 01:25:00	0	            1
-    ####################################################################################################################
-
+    # list of (meter_id, start_datetime_utc, actual_value) of all meters in the batch
     normalized_values = list()
-    if rows_energy_values is None or len(rows_energy_values) == 0:
-        # NOTE: there isn't any value to be normalized
-        # that means the meter is offline or all values are bad
-        current_datetime_utc = start_datetime_utc
-        while current_datetime_utc < end_datetime_utc:
-            normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': Decimal(0.0)})
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
-    else:
-        maximum = Decimal(0.0)
-        if energy_value_just_before_start is not None and \
-                len(energy_value_just_before_start) > 0 and \
-                energy_value_just_before_start['actual_value'] > Decimal(0.0):
-            maximum = energy_value_just_before_start['actual_value']
-
-        current_datetime_utc = start_datetime_utc
-        while current_datetime_utc < end_datetime_utc:
-            initial_maximum = maximum
-            # get all energy values in current time slot
-            current_energy_values = list()
-            while len(rows_energy_values) > 0:
-                row_energy_value = rows_energy_values.pop(0)
-                energy_value_datetime = row_energy_value[0].replace(tzinfo=timezone.utc)
-                if energy_value_datetime < current_datetime_utc + timedelta(minutes=config.minutes_to_count):
-                    current_energy_values.append(row_energy_value)
-                else:
-                    rows_energy_values.insert(0, row_energy_value)
-                    break
-
-            # get the energy increment one by one in current time slot
-            increment = Decimal(0.0)
-            # maximum should be equal to the maximum value of last time here
-            for index in range(len(current_energy_values)):
-                current_energy_value = current_energy_values[index]
-                if maximum < current_energy_value[1]:
-                    increment += current_energy_value[1] - maximum
-                maximum = current_energy_value[1]
-
-            # omit huge initial value for a new meter
-            # or omit huge value for a recovered meter with zero values during failure
-            # NOTE: this method may cause the lose of energy consumption in this time slot
-            if initial_maximum <= Decimal(0.1):
-                increment = Decimal(0.0)
-
-            # check with hourly low limit
-            if increment < meter['hourly_low_limit']:
-                increment = Decimal(0.0)
-
-            # check with hourly high limit
-            # NOTE: this method may cause the lose of energy consumption in this time slot
-            if increment > meter['hourly_high_limit']:
-                increment = Decimal(0.0)
-
-            meta_data = {'start_datetime_utc': current_datetime_utc,
-                         'actual_value': increment}
-            # append mete_data
-            normalized_values.append(meta_data)
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+    try:
+        for index, meter, start_datetime_utc, end_datetime_utc in slot_list:
+            # meters without any value to be normalized are offline or all of their values are bad
+            row_iterator = iter(())
+            if next_group is not None and next_group[0] == index:
+                row_iterator = ((row[1], row[2]) for row in next_group[1])
+            for meta_data in normalize_energy_values(row_iterator,
+                                                     start_datetime_utc,
+                                                     end_datetime_utc,
+                                                     config.minutes_to_count,
+                                                     previous_value_dict.get(index),
+                                                     meter['hourly_low_limit'],
+                                                     meter['hourly_high_limit']):
+                normalized_values.append((meter['id'], meta_data['start_datetime_utc'].isoformat()[0:19],
+                                          meta_data['actual_value']))
+            if next_group is not None and next_group[0] == index:
+                next_group = next(group_iterator, None)
+    except Exception as e:
+        error_string = "Error in step 3.1 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
+        if cursor_energy_db:
+            cursor_energy_db.close()
+        if cnx_energy_db:
+            cnx_energy_db.close()
+
+        print(error_string)
+        error_list.append(error_string)
+        return error_list
+    finally:
+        if cursor_historical_db:
+            cursor_historical_db.close()
+        if cnx_historical_db:
+            cnx_historical_db.close()
 
     ####################################################################################################################
     # Step 4: Insert into energy database
+    # NOTE: rows of all meters in the batch are inserted with multi-row inserts and committed in one transaction
     ####################################################################################################################
-    while len(normalized_values) > 0:
-        insert_100 = normalized_values[:100]
-        normalized_values = normalized_values[100:]
-        try:
-            add_values = (" INSERT INTO tbl_meter_hourly (meter_id, start_datetime_utc, actual_value) "
-                          " VALUES  ")
-
-            for meta_data in insert_100:
-                add_values += " (" + str(meter['id']) + ","
-                add_values += "'" + meta_data['start_datetime_utc'].isoformat()[0:19] + "',"
-                add_values += str(meta_data['actual_value']) + "), "
-            # trim ", " at the end of string and then execute
-            cursor_energy_db.execute(add_values[:-2])
-            cnx_energy_db.commit()
-        except Exception as e:
-            error_string = "Error in step 4.1 of meter.worker " + str(e) + " for '" + meter['name'] + "'"
-            if cursor_energy_db:
-                cursor_energy_db.close()
-            if cnx_energy_db:
-                cnx_energy_db.close()
+    try:
+        add_values = (" INSERT INTO tbl_meter_hourly (meter_id, start_datetime_utc, actual_value) "
+                      " VALUES (%s, %s, %s) ")
+        for i in range(0, len(normalized_values), INSERT_BATCH_SIZE):
+            cursor_energy_db.executemany(add_values, normalized_values[i:i + INSERT_BATCH_SIZE])
+        cnx_energy_db.commit()
+    except Exception as e:
+        error_string = "Error in step 4.1 of meter.worker " + str(e) + " for " + str(len(meter_list)) + " meters"
+        if cursor_energy_db:
+            cursor_energy_db.close()
+        if cnx_energy_db:
+            cnx_energy_db.close()
 
-            print(error_string)
-            return error_string
+        print(error_string)
+        error_list.append(error_string)
+        return error_list
 
     if cursor_energy_db:
         cursor_energy_db.close()
     if cnx_energy_db:
         cnx_energy_db.close()
 
-    print("End of processing meter: " + "'" + meter['name'] + "'")
-    return None
+    print("End of processing " + str(len(meter_list)) + " meters")
+    return error_list
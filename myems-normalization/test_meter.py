@@ -0,0 +1,195 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from meter import normalize_energy_values
+
+
+########################################################################################################################
+# Regression tests of the normalization of energy values in meter.worker
+# The cases are built from the special test cases documented in meter.normalize_energy_values,
+# and random cases are checked against the slot by slot algorithm used before the single pass normalization.
+#
+# Usage: python3 -m unittest test_meter
+########################################################################################################################
+
+
+def utc(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def naive(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def reference_normalize_energy_values(rows, start_datetime_utc, end_datetime_utc, minutes_to_count,
+                                      previous_value, low_limit, high_limit):
+    """The slot by slot normalization of meter.worker before the single pass normalization"""
+    rows = list(rows)
+    normalized_values = list()
+    if len(rows) == 0:
+        current_datetime_utc = start_datetime_utc
+        while current_datetime_utc < end_datetime_utc:
+            normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': Decimal(0.0)})
+            current_datetime_utc += timedelta(minutes=minutes_to_count)
+        return normalized_values
+
+    maximum = Decimal(0.0)
+    if previous_value is not None and previous_value > Decimal(0.0):
+        maximum = previous_value
+    current_datetime_utc = start_datetime_utc
+    while current_datetime_utc < end_datetime_utc:
+        initial_maximum = maximum
+        current_energy_values = list()
+        while len(rows) > 0:
+            row = rows.pop(0)
+            if row[0].replace(tzinfo=timezone.utc) < current_datetime_utc + timedelta(minutes=minutes_to_count):
+                current_energy_values.append(row)
+            else:
+                rows.insert(0, row)
+                break
+        increment = Decimal(0.0)
+        for current_energy_value in current_energy_values:
+            if maximum < current_energy_value[1]:
+                increment += current_energy_value[1] - maximum
+            maximum = current_energy_value[1]
+        if initial_maximum <= Decimal(0.1):
+            increment = Decimal(0.0)
+        if increment < low_limit:
+            increment = Decimal(0.0)
+        if increment > high_limit:
+            increment = Decimal(0.0)
+        normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': increment})
+        current_datetime_utc += timedelta(minutes=minutes_to_count)
+    return normalized_values
+
+
+class NormalizeEnergyValuesTest(unittest.TestCase):
+
+    def normalize(self, rows, start, end, previous_value, low_limit=Decimal(0), high_limit=Decimal(100000),
+                  minutes_to_count=60):
+        result = normalize_energy_values(iter(rows), utc(start), utc(end), minutes_to_count,
+                                         previous_value, low_limit, high_limit)
+        expected = reference_normalize_energy_values(rows, utc(start), utc(end), minutes_to_count,
+                                                     previous_value, low_limit, high_limit)
+        self.assertEqual(result, expected)
+        return [(value['start_datetime_utc'], value['actual_value']) for value in result]
+
+    def test_disconnected(self):
+        # special test case 1 (disconnected)
+        rows = [(naive('2016-12-05 23:58:46'), Decimal('38312088')),
+                (naive('2016-12-05 23:59:48'), Decimal('38312088')),
+                (naive('2016-12-06 06:14:49'), Decimal('38315900')),
+                (naive('2016-12-06 06:15:50'), Decimal('38315928')),
+                (naive('2016-12-06 06:16:52'), Decimal('38315928'))]
+        result = self.normalize(rows, '2016-12-05 23:00:00', '2016-12-06 07:00:00', Decimal('38312000'))
+        self.assertEqual(len(result), 8)
+        self.assertEqual(result[0], (utc('2016-12-05 23:00:00'), Decimal('88')))
+        self.assertTrue(all(value == Decimal(0) for _, value in result[1:7]))
+        # the consumption during disconnection is counted in the time slot of reconnection
+        self.assertEqual(result[7], (utc('2016-12-06 06:00:00'), Decimal('3840')))
+
+        # the consumption during disconnection exceeds the hourly high limit and is omitted
+        result = self.normalize(rows, '2016-12-05 23:00:00', '2016-12-06 07:00:00', Decimal('38312000'),
+                                high_limit=Decimal('1000'))
+        self.assertEqual(result[0][1], Decimal('88'))
+        self.assertEqual(result[7][1], Decimal(0))
+
+    def test_new_added_used_meter(self):
+        # special test case 2 (a new added used meter)
+        rows = [(naive('2017-03-27 02:30:48'), Decimal('56842157.90797222')),
+                (naive('2017-03-27 02:31:53'), Decimal('56842170.812365524')),
+                (naive('2017-03-27 02:32:58'), Decimal('56842183.48610827')),
+                (naive('2017-03-27 02:34:01'), Decimal('56842195.95270827')),
+                (naive('2017-03-27 02:35:04'), Decimal('56842208.420127675')),
+                (naive('2017-03-27 02:36:07'), Decimal('56842220.77297248')),
+                (naive('2017-03-27 03:10:00'), Decimal('56842300'))]
+        result = self.normalize(rows, '2017-03-27 02:00:00', '2017-03-27 04:00:00', None)
+        # the huge initial value of the meter is omitted
+        self.assertEqual(result[0][1], Decimal(0))
+        self.assertEqual(result[1][1], Decimal('56842300') - Decimal('56842220.77297248'))
+
+    def test_high_limit_exceeded(self):
+        # special test case 3 (hi_limit exceeded), the meter is reset
+        rows = [(naive('2016-12-24 08:26:14'), Decimal('999984.0625')),
+                (naive('2016-12-24 08:27:15'), Decimal('999984.0625')),
+                (naive('2016-12-24 08:28:17'), Decimal('999984.0625')),
+                (naive('2016-12-24 08:29:18'), Decimal('20')),
+                (naive('2016-12-24 08:30:20'), Decimal('20')),
+                (naive('2016-12-24 08:31:21'), Decimal('20')),
+                (naive('2016-12-24 09:05:00'), Decimal('25'))]
+        result = self.normalize(rows, '2016-12-24 08:00:00', '2016-12-24 10:00:00', Decimal('999984.0625'))
+        self.assertEqual(result[0][1], Decimal(0))
+        # the increment after reset is counted from the value after reset
+        self.assertEqual(result[1][1], Decimal('5'))
+
+    def test_recovered_from_bad_zeroes(self):
+        # test case 4 (recovered from bad zeroes)
+        good_rows = [(naive('2019-03-14 01:20:00'), Decimal('1103300')),
+                     (naive('2019-03-14 01:37:06'), Decimal('1103325.75')),
+                     (naive('2019-03-14 02:03:20'), Decimal('1103860.625'))]
+        zero_rows = [(naive('2019-03-14 01:' + str(minute) + ':00'), Decimal(0)) for minute in range(25, 37)]
+        # bad zeroes are excluded from the values to be normalized
+        result = self.normalize(good_rows, '2019-03-14 01:00:00', '2019-03-14 03:00:00', Decimal('1103290'))
+        self.assertEqual(result[0][1], Decimal('35.75'))
+        self.assertEqual(result[1][1], Decimal('534.875'))
+
+        # zeroes not tagged bad make a huge increment which exceeds the hourly high limit
+        rows = sorted(good_rows + zero_rows)
+        result = self.normalize(rows, '2019-03-14 01:00:00', '2019-03-14 03:00:00', Decimal('1103290'),
+                                high_limit=Decimal('10000'))
+        self.assertEqual(result[0][1], Decimal(0))
+        self.assertEqual(result[1][1], Decimal('534.875'))
+
+        # the huge value of a meter recovered from zeroes in the previous time slot is omitted
+        rows = [(naive('2019-03-14 02:03:20'), Decimal('1103860.625'))]
+        result = self.normalize(rows, '2019-03-14 02:00:00', '2019-03-14 03:00:00', Decimal(0))
+        self.assertEqual(result[0][1], Decimal(0))
+
+    def test_hourly_low_limit(self):
+        rows = [(naive('2020-01-01 00:10:00'), Decimal('100.5')),
+                (naive('2020-01-01 01:10:00'), Decimal('110'))]
+        result = self.normalize(rows, '2020-01-01 00:00:00', '2020-01-01 02:00:00', Decimal('100'),
+                                low_limit=Decimal('1'))
+        self.assertEqual(result[0][1], Decimal(0))
+        self.assertEqual(result[1][1], Decimal('9.5'))
+
+    def test_no_values(self):
+        result = self.normalize(list(), '2020-01-01 00:00:00', '2020-01-01 03:00:00', Decimal('100'))
+        self.assertEqual(result, [(utc('2020-01-01 00:00:00'), Decimal(0)),
+                                  (utc('2020-01-01 01:00:00'), Decimal(0)),
+                                  (utc('2020-01-01 02:00:00'), Decimal(0))])
+
+    def test_random_values(self):
+        random_generator = random.Random(20240707)
+        for minutes_to_count in (15, 30, 60):
+            for _ in range(200):
+                number_of_slots = random_generator.randint(1, 30)
+                start = utc('2024-01-01 00:00:00')
+                end = start + timedelta(minutes=minutes_to_count * number_of_slots)
+                value = Decimal(random_generator.choice((0, 0.05, 1000)))
+                current_datetime = start.replace(tzinfo=None)
+                rows = list()
+                while True:
+                    current_datetime += timedelta(seconds=random_generator.choice((10, 61, 600, 3600, 7200)))
+                    if current_datetime >= end.replace(tzinfo=None):
+                        break
+                    choice = random_generator.random()
+                    if choice < 0.05:
+                        value = Decimal(0)
+                    elif choice < 0.1:
+                        value = value * 3
+                    else:
+                        value += Decimal(random_generator.randint(0, 5000)) / 8
+                    rows.append((current_datetime, value))
+                previous_value = random_generator.choice((None, Decimal(0), Decimal(500)))
+                result = normalize_energy_values(iter(rows), start, end, minutes_to_count,
+                                                 previous_value, Decimal(1), Decimal(5000))
+                expected = reference_normalize_energy_values(rows, start, end, minutes_to_count,
+                                                             previous_value, Decimal(1), Decimal(5000))
+                self.assertEqual(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
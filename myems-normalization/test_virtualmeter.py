@@ -0,0 +1,71 @@
+import random
+import unittest
+from decimal import Decimal
+
+from sympy import sympify
+
+from virtualmeter import compile_equation, evaluate_equation
+
+
+########################################################################################################################
+# Correctness tests of the compiled equations of virtual meters
+# The values of compiled equations over aligned series are compared with evalf of SymPy expressions
+# with substitutions at each time slot, which is how equations were evaluated before they were compiled.
+#
+# Usage: python3 -m unittest test_virtualmeter
+########################################################################################################################
+
+EQUATION_LIST = ['x1',
+                 'x1+x2',
+                 'X1+X2-X3',
+                 'x1-x2*0.8',
+                 '(x1+x2)/2',
+                 'x1*1.5-x2+100',
+                 'x1/3+x2/7',
+                 '0.2*(x1+x2+x3)-0.05*x4',
+                 'max(x1,x2)',
+                 'abs(x1-x2)',
+                 'x1**2/1000+x2',
+                 '100']
+
+
+def random_series(random_generator, length):
+    return [Decimal(random_generator.randint(0, 10 ** 9)) / 1000 for _ in range(length)]
+
+
+class EvaluateEquationTest(unittest.TestCase):
+
+    def assertCloseTo(self, actual_value, expected_value):
+        # values are saved as DECIMAL(18, 3), the difference must be far less than the precision of storage
+        expected_value = Decimal(str(expected_value))
+        actual_value = Decimal(repr(actual_value))
+        tolerance = max(Decimal(1), abs(expected_value)) * Decimal('1e-12')
+        self.assertLessEqual(abs(actual_value - expected_value), tolerance,
+                             str(actual_value) + " != " + str(expected_value))
+
+    def test_equations(self):
+        random_generator = random.Random(20240707)
+        for equation in EQUATION_LIST:
+            expr = sympify(equation.lower())
+            length = 48
+            series_dict = {'x' + str(i): random_series(random_generator, length) for i in range(1, 5)}
+            value_list = evaluate_equation(equation, series_dict, length)
+            self.assertEqual(len(value_list), length)
+            for i, actual_value in enumerate(value_list):
+                subs = {name: series[i] for name, series in series_dict.items()}
+                self.assertCloseTo(actual_value, expr.evalf(subs=subs))
+
+    def test_zero_values(self):
+        series_dict = {'x1': [Decimal(0.0)] * 3, 'x2': [Decimal('1.5')] * 3}
+        self.assertEqual(evaluate_equation('x1+x2', series_dict, 3), [1.5, 1.5, 1.5])
+
+    def test_cache(self):
+        self.assertIs(compile_equation('x1+x2'), compile_equation('x1+x2'))
+
+    def test_undefined_variables(self):
+        with self.assertRaises(ValueError):
+            evaluate_equation('x1+x9', {'x1': [Decimal(1)]}, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sympy import Piecewise, sympify, symbols
+
+from virtualpoint import align_as_of, compile_expression
+
+
+########################################################################################################################
+# Correctness tests of the evaluation of virtual points
+# The as-of join is compared with a scan of all values of a point at each date time,
+# and the compiled expressions are compared with evalf of algebraic expressions and subs of piecewise functions
+# at each date time, which is how expressions were evaluated before they were compiled.
+#
+# Usage: python3 -m unittest test_virtualpoint
+########################################################################################################################
+
+
+def utc(minute):
+    return datetime(2024, 1, 1) + timedelta(minutes=minute)
+
+
+def reference_align_as_of(utc_date_time_list, point_values):
+    """The latest value at or before each date time by scanning all values of the point"""
+    value_list = list()
+    for utc_date_time in utc_date_time_list:
+        current_value = None
+        for point_utc_date_time, actual_value in point_values:
+            if point_utc_date_time <= utc_date_time:
+                current_value = float(actual_value)
+        value_list.append(current_value)
+    return value_list
+
+
+def reference_evaluate(expression, variable_name_list, value_list):
+    """The per-row evaluation of virtualpoint.worker before the expressions were compiled"""
+    subs = dict(zip(variable_name_list, value_list))
+    if ',' in expression:
+        symbol_dict = {variable_name: symbols(variable_name) for variable_name in variable_name_list}
+        expr = eval(expression, {'Piecewise': Piecewise}, symbol_dict)
+        return Decimal(str(Piecewise(*expr).subs(subs)))
+    return Decimal(str(sympify(expression).evalf(subs=subs)))
+
+
+class AlignAsOfTest(unittest.TestCase):
+
+    def test_later_first_value(self):
+        utc_date_time_list = [utc(0), utc(1), utc(2), utc(3)]
+        # the point has no value before its first value
+        self.assertEqual(align_as_of(utc_date_time_list, [(utc(2), Decimal('5.5'))]), [None, None, 5.5, 5.5])
+        self.assertEqual(align_as_of(utc_date_time_list, [(utc(0), Decimal(1)), (utc(3), Decimal(2))]),
+                         [1.0, 1.0, 1.0, 2.0])
+
+    def test_duplicate_date_times(self):
+        # the last one of values at the same date time wins
+        point_values = [(utc(0), Decimal(1)), (utc(1), Decimal(2)), (utc(1), Decimal(3)), (utc(2), Decimal(4))]
+        self.assertEqual(align_as_of([utc(1), utc(2)], point_values), [3.0, 4.0])
+        self.assertEqual(align_as_of([utc(1), utc(1), utc(2)], point_values), [3.0, 3.0, 4.0])
+
+    def test_empty_inputs(self):
+        self.assertEqual(align_as_of(list(), [(utc(0), Decimal(1))]), list())
+        self.assertEqual(align_as_of([utc(0), utc(1)], list()), [None, None])
+        self.assertEqual(align_as_of(list(), list()), list())
+
+    def test_random_values(self):
+        random_generator = random.Random(20240707)
+        for _ in range(100):
+            point_values = [(utc(random_generator.randint(0, 100)), Decimal(random_generator.randint(0, 1000)))
+                            for _ in range(random_generator.randint(0, 30))]
+            # values are in time order, and values at the same date time are in any order
+            point_values.sort(key=lambda row: row[0])
+            utc_date_time_list = sorted(set(utc(random_generator.randint(0, 100)) for _ in range(30)))
+            self.assertEqual(align_as_of(utc_date_time_list, point_values),
+                             reference_align_as_of(utc_date_time_list, point_values))
+
+
+class CompileExpressionTest(unittest.TestCase):
+
+    def assertCloseTo(self, actual_value, expected_value):
+        # values are saved as DECIMAL(18, 3), the difference must be far less than the precision of storage
+        actual_value = Decimal(str(actual_value))
+        tolerance = max(Decimal(1), abs(expected_value)) * Decimal('1e-12')
+        self.assertLessEqual(abs(actual_value - expected_value), tolerance,
+                             str(actual_value) + " != " + str(expected_value))
+
+    def test_cache(self):
+        function = compile_expression('x1-x2', ['x1', 'x2'])
+        self.assertIs(compile_expression('x1-x2', ['x1', 'x2']), function)
+        # the order of variables is a part of the cache key
+        self.assertIsNot(compile_expression('x1-x2', ['x2', 'x1']), function)
+        self.assertEqual(function(5.0, 3.0), 2.0)
+        self.assertEqual(compile_expression('x1-x2', ['x2', 'x1'])(5.0, 3.0), -2.0)
+
+    def test_algebraic_expressions(self):
+        random_generator = random.Random(20240707)
+        for expression in ('x1-x2', 'x1+x2*0.8', '(x1+x2)/2', 'x1*x2/1000-x3', 'abs(x1-x2)', 'x1**2/1000+x3', '100'):
+            variable_name_list = ['x1', 'x2', 'x3']
+            function = compile_expression(expression, variable_name_list)
+            for _ in range(50):
+                value_list = [random_generator.randint(0, 10 ** 9) / 1000 for _ in variable_name_list]
+                self.assertCloseTo(function(*value_list),
+                                   reference_evaluate(expression, variable_name_list, value_list))
+
+    def test_piecewise_functions(self):
+        expression = '(1, x<200), (2, x>=500), (x/10, True)'
+        function = compile_expression(expression, ['x'])
+        self.assertIs(compile_expression(expression, ['x']), function)
+        for value in (0.0, 199.9, 200.0, 350.0, 499.9, 500.0, 1000.0):
+            self.assertCloseTo(function(value), reference_evaluate(expression, ['x'], [value]))
+
+        expression = '(x1-x2, x1>x2), (0, True)'
+        function = compile_expression(expression, ['x1', 'x2'])
+        for value_list in ((3.0, 1.0), (1.0, 3.0), (2.0, 2.0)):
+            self.assertCloseTo(function(*value_list), reference_evaluate(expression, ['x1', 'x2'], value_list))
+
+    def test_evaluate_aligned_values(self):
+        # values of points sampled at different date times are evaluated at every date time of any point
+        x1_values = [(utc(0), Decimal(10)), (utc(2), Decimal(20)), (utc(4), Decimal(30))]
+        x2_values = [(utc(1), Decimal(1)), (utc(4), Decimal(2))]
+        utc_date_time_list = sorted(set(row[0] for row in x1_values + x2_values))
+        column_list = [align_as_of(utc_date_time_list, x1_values), align_as_of(utc_date_time_list, x2_values)]
+        function = compile_expression('x1-x2', ['x1', 'x2'])
+        result = [(utc_date_time, function(*values))
+                  for utc_date_time, values in zip(utc_date_time_list, zip(*column_list)) if None not in values]
+        self.assertEqual(result, [(utc(1), 9.0), (utc(2), 19.0), (utc(4), 28.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
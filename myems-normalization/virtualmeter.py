@@ -1,21 +1,34 @@
+import queue
 import random
 import time
 from datetime import datetime, timedelta
 from decimal import Decimal
 from multiprocessing import Pool
 import mysql.connector
-from sympy import sympify
+from sympy import lambdify, sympify
 import config
+import connection_pool
 
 
 ########################################################################################################################
 # PROCEDURES:
-# Step 1: Query all virtual meters
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 1: Query all virtual meters and the virtual meters they depend on
+# Step 2: Call worker in parallel with the multiprocessing pool in the order of dependencies
+#
+# A virtual meter is calculated after all virtual meters in its equation are calculated in the same cycle,
+# and virtual meters which do not depend on each other are calculated in parallel,
+# so that nested virtual meters are current on the same cycle as their inputs.
+# Virtual meters in or depending on a cyclic dependency are not calculated.
 ########################################################################################################################
 
 def calculate_hourly(logger):
 
+    # the multiprocessing pool lives as long as this process, so that its worker processes reuse their
+    # connections to databases in all cycles, see connection_pool.py
+    p = Pool(processes=config.pool_size,
+             initializer=connection_pool.initialize,
+             initargs=(logger, [config.myems_energy_db, config.myems_system_db],))
+
     while True:
         # the outermost while loop to reconnect server if there is a connection error
         cnx_system_db = None
@@ -36,6 +49,7 @@ def calculate_hourly(logger):
         print("Connected to MyEMS System Database")
 
         virtual_meter_list = list()
+        dependency_list = list()
         try:
             cursor_system_db.execute(" SELECT id, name, equation "
                                      " FROM tbl_virtual_meters "
@@ -51,6 +65,15 @@ def calculate_hourly(logger):
                 meta_result = {"id": row[0], "name": row[1], "equation": row[2]}
                 virtual_meter_list.append(meta_result)
 
+            # get the virtual meters in the equations of virtual meters
+            cursor_system_db.execute(" SELECT virtual_meter_id, meter_id "
+                                     " FROM tbl_variables "
+                                     " WHERE meter_type = 'virtual_meter' ")
+            rows_dependencies = cursor_system_db.fetchall()
+            if rows_dependencies is not None and len(rows_dependencies) > 0:
+                for row in rows_dependencies:
+                    dependency_list.append((row[0], row[1]))
+
         except Exception as e:
             logger.error("Error in step 1 of virtual meter calculate hourly " + str(e))
             # sleep and continue the outer loop to reconnect the database
@@ -66,23 +89,127 @@ def calculate_hourly(logger):
         random.shuffle(virtual_meter_list)
 
         print("Got all virtual meters in MyEMS System Database")
+
+        dependent_dict, dependency_count_dict = build_dependency_graph(virtual_meter_list, dependency_list)
+        cyclic_id_list = find_cyclic_virtual_meters(dependent_dict, dependency_count_dict)
+        if len(cyclic_id_list) > 0:
+            logger.error("Virtual meters in or depending on a cyclic dependency are not calculated: " +
+                         ', '.join(str(virtual_meter_id) for virtual_meter_id in sorted(cyclic_id_list)))
+
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Call worker in parallel with the multiprocessing pool in the order of dependencies
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
-        error_list = p.map(worker, virtual_meter_list)
-        p.close()
-        p.join()
-
-        for error in error_list:
+        virtual_meter_dict = {virtual_meter['id']: virtual_meter for virtual_meter in virtual_meter_list}
+        completed_queue = queue.Queue()
+
+        def submit(virtual_meter_id):
+            p.apply_async(worker, (virtual_meter_dict[virtual_meter_id],),
+                          callback=lambda error: completed_queue.put((virtual_meter_id, error)),
+                          error_callback=lambda e: completed_queue.put((virtual_meter_id, str(e))))
+
+        # virtual meters without dependencies are calculated first, in the shuffled order
+        running_count = 0
+        for virtual_meter in virtual_meter_list:
+            if dependency_count_dict[virtual_meter['id']] == 0:
+                submit(virtual_meter['id'])
+                running_count += 1
+
+        # a virtual meter is submitted as soon as all virtual meters it depends on are completed
+        while running_count > 0:
+            virtual_meter_id, error = completed_queue.get()
+            running_count -= 1
             if error is not None and len(error) > 0:
                 logger.error(error)
+            for dependent_id in dependent_dict[virtual_meter_id]:
+                dependency_count_dict[dependent_id] -= 1
+                if dependency_count_dict[dependent_id] == 0:
+                    submit(dependent_id)
+                    running_count += 1
 
         print("go to sleep ...")
         time.sleep(60)
         print("wake from sleep, and continue to work...")
 
 
+def build_dependency_graph(virtual_meter_list, dependency_list):
+    """
+    Build the dependency graph of virtual meters
+    :param virtual_meter_list: list of virtual meters
+    :param dependency_list: list of (virtual meter id, id of a virtual meter in its equation)
+    :return: (dictionary of virtual meter id to the list of ids of virtual meters depending on it,
+              dictionary of virtual meter id to the number of virtual meters it depends on)
+    """
+    dependent_dict = {virtual_meter['id']: list() for virtual_meter in virtual_meter_list}
+    dependency_count_dict = {virtual_meter['id']: 0 for virtual_meter in virtual_meter_list}
+    # a virtual meter may have several variables of the same virtual meter
+    for virtual_meter_id, dependency_id in set(dependency_list):
+        if virtual_meter_id not in dependent_dict or dependency_id not in dependent_dict:
+            continue
+        dependent_dict[dependency_id].append(virtual_meter_id)
+        dependency_count_dict[virtual_meter_id] += 1
+    return dependent_dict, dependency_count_dict
+
+
+def find_cyclic_virtual_meters(dependent_dict, dependency_count_dict):
+    """
+    Find the virtual meters in or depending on a cyclic dependency by topological sort
+    :return: list of ids of virtual meters which can not be sorted in topological order
+    """
+    count_dict = dict(dependency_count_dict)
+    ready_list = [virtual_meter_id for virtual_meter_id, count in count_dict.items() if count == 0]
+    sorted_count = 0
+    while len(ready_list) > 0:
+        virtual_meter_id = ready_list.pop()
+        sorted_count += 1
+        for dependent_id in dependent_dict[virtual_meter_id]:
+            count_dict[dependent_id] -= 1
+            if count_dict[dependent_id] == 0:
+                ready_list.append(dependent_id)
+    if sorted_count == len(count_dict):
+        return list()
+    return [virtual_meter_id for virtual_meter_id, count in count_dict.items() if count > 0]
+
+
+# equation text -> (compiled function, list of variable names in the order of arguments)
+compiled_equation_dict = dict()
+
+
+def compile_equation(equation):
+    """
+    Compile the equation of a virtual meter into a function of its variables, cached by the equation text
+    The sympify function(that’s sympify, not to be confused with simplify) converts the string into an expression,
+    and lambdify translates the expression into a Python function with the math module,
+    which is evaluated much faster than evalf of the expression with substitutions.
+    :return: (function, list of variable names in the order of arguments)
+    """
+    compiled_equation = compiled_equation_dict.get(equation)
+    if compiled_equation is None:
+        expr = sympify(equation.lower())
+        print("the expression to be compiled: " + str(expr))
+        symbol_list = sorted(expr.free_symbols, key=lambda symbol: symbol.name)
+        compiled_equation = (lambdify(symbol_list, expr, modules='math'), [symbol.name for symbol in symbol_list])
+        compiled_equation_dict[equation] = compiled_equation
+    return compiled_equation
+
+
+def evaluate_equation(equation, series_dict, length):
+    """
+    Evaluate the equation over the aligned series of its variables
+    :param equation: the equation text of the virtual meter
+    :param series_dict: dictionary of variable name to the list of values aligned with time slots
+    :param length: the number of time slots
+    :return: list of values of time slots
+    """
+    function, variable_name_list = compile_equation(equation)
+    missing_variable_name_list = [name for name in variable_name_list if name not in series_dict]
+    if len(missing_variable_name_list) > 0:
+        raise ValueError("variables " + ', '.join(missing_variable_name_list) + " are not defined")
+    if len(variable_name_list) == 0:
+        return [function()] * length
+    column_list = [[float(value) for value in series_dict[name]] for name in variable_name_list]
+    return [function(*values) for values in zip(*column_list)]
+
+
 ########################################################################################################################
 # Step 1: get start datetime and end datetime
 # Step 2: parse the expression and get all meters, virtual meters, offline meters associated with the expression
@@ -96,7 +223,7 @@ def worker(virtual_meter):
     cursor_energy_db = None
 
     try:
-        cnx_energy_db = mysql.connector.connect(**config.myems_energy_db)
+        cnx_energy_db = connection_pool.connect(config.myems_energy_db)
         cursor_energy_db = cnx_energy_db.cursor()
     except Exception as e:
         if cursor_energy_db:
@@ -174,7 +301,7 @@ def worker(virtual_meter):
     cnx_system_db = None
     cursor_system_db = None
     try:
-        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
+        cnx_system_db = connection_pool.connect(config.myems_system_db)
         cursor_system_db = cnx_system_db.cursor()
     except Exception as e:
         if cursor_system_db:
@@ -379,66 +506,45 @@ def worker(virtual_meter):
                     if common_end_datetime_utc > max(energy_hourly.keys()):
                         common_end_datetime_utc = max(energy_hourly.keys())
 
-    print("evaluating the equation with SymPy...")
+    print("evaluating the compiled equation...")
     normalized_values = list()
 
     ############################################################################################################
-    # Converting Strings to SymPy Expressions
-    # The sympify function(that’s sympify, not to be confused with simplify) can be used to
-    # convert strings into SymPy expressions.
+    # The equation is compiled once for each worker process and cached by the equation text,
+    # and evaluated over the aligned series of all variables at once instead of with evalf at each time slot.
     ############################################################################################################
     try:
-        expr = sympify(virtual_meter['equation'].lower())
-        print("the expression to be evaluated: " + str(expr))
-        current_datetime_utc = common_start_datetime_utc
         print("common_start_datetime_utc: " + str(common_start_datetime_utc))
         print("common_end_datetime_utc: " + str(common_end_datetime_utc))
-        while common_start_datetime_utc is not None \
-                and common_end_datetime_utc is not None \
-                and current_datetime_utc <= common_end_datetime_utc:
-            meta_data = dict()
-            meta_data['start_datetime_utc'] = current_datetime_utc
+        if common_start_datetime_utc is not None and common_end_datetime_utc is not None:
+            datetime_list = list()
+            current_datetime_utc = common_start_datetime_utc
+            while current_datetime_utc <= common_end_datetime_utc:
+                datetime_list.append(current_datetime_utc)
+                current_datetime_utc += timedelta(minutes=config.minutes_to_count)
 
             ####################################################################################################
-            # create a dictionary of Symbol: point pairs
-            ####################################################################################################
-
-            subs = dict()
-
-            ####################################################################################################
-            # Evaluating the expression at current_datetime_utc
-            ####################################################################################################
-
-            if meter_list_in_expression is not None and len(meter_list_in_expression) > 0:
-                for meter_in_expression in meter_list_in_expression:
-                    meter_id = str(meter_in_expression['meter_id'])
-                    actual_value = energy_meter_hourly[meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[meter_in_expression['variable_name']] = actual_value
-
-            if virtual_meter_list_in_expression is not None and len(virtual_meter_list_in_expression) > 0:
-                for virtual_meter_in_expression in virtual_meter_list_in_expression:
-                    virtual_meter_id = str(virtual_meter_in_expression['virtual_meter_id'])
-                    actual_value = energy_virtual_meter_hourly[virtual_meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[virtual_meter_in_expression['variable_name']] = actual_value
-
-            if offline_meter_list_in_expression is not None and len(offline_meter_list_in_expression) > 0:
-                for offline_meter_in_expression in offline_meter_list_in_expression:
-                    offline_meter_id = str(offline_meter_in_expression['offline_meter_id'])
-                    actual_value = energy_offline_meter_hourly[offline_meter_id].get(current_datetime_utc, Decimal(0.0))
-                    subs[offline_meter_in_expression['variable_name']] = actual_value
-
-            ####################################################################################################
-            # To numerically evaluate an expression with a Symbol at a point,
-            # we might use subs followed by evalf,
-            # but it is more efficient and numerically stable to pass the substitution to evalf
-            # using the subs flag, which takes a dictionary of Symbol: point pairs.
+            # align the series of all variables with the time slots, missing values are zero
             ####################################################################################################
+            series_dict = dict()
+            for meter_in_expression in meter_list_in_expression:
+                energy_hourly = energy_meter_hourly[str(meter_in_expression['meter_id'])]
+                series_dict[meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            meta_data['actual_value'] = expr.evalf(subs=subs)
+            for virtual_meter_in_expression in virtual_meter_list_in_expression:
+                energy_hourly = energy_virtual_meter_hourly[str(virtual_meter_in_expression['virtual_meter_id'])]
+                series_dict[virtual_meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            normalized_values.append(meta_data)
+            for offline_meter_in_expression in offline_meter_list_in_expression:
+                energy_hourly = energy_offline_meter_hourly[str(offline_meter_in_expression['offline_meter_id'])]
+                series_dict[offline_meter_in_expression['variable_name']] = \
+                    [energy_hourly.get(current_datetime_utc, Decimal(0.0)) for current_datetime_utc in datetime_list]
 
-            current_datetime_utc += timedelta(minutes=config.minutes_to_count)
+            value_list = evaluate_equation(virtual_meter['equation'], series_dict, len(datetime_list))
+            for current_datetime_utc, actual_value in zip(datetime_list, value_list):
+                normalized_values.append({'start_datetime_utc': current_datetime_utc, 'actual_value': actual_value})
 
     except Exception as e:
         if cursor_energy_db:
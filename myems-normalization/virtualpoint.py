@@ -7,18 +7,25 @@ from decimal import Decimal
 from multiprocessing import Pool
 
 import mysql.connector
-from sympy import sympify, Piecewise, symbols
+from sympy import lambdify, sympify, Piecewise, symbols
 
 import config
+import connection_pool
 
 
 ########################################################################################################################
 # PROCEDURES:
 # Step 1: Query all virtual points
-# Step 2: Create multiprocessing pool to call worker in parallel
+# Step 2: Call worker in parallel with the multiprocessing pool
 ########################################################################################################################
 
 def calculate(logger):
+    # the multiprocessing pool lives as long as this process, so that its worker processes reuse their
+    # connections to databases in all cycles, see connection_pool.py
+    p = Pool(processes=config.pool_size,
+             initializer=connection_pool.initialize,
+             initargs=(logger, [config.myems_historical_db, config.myems_system_db],))
+
     while True:
         # the outermost while loop to reconnect server if there is a connection error
         cnx_system_db = None
@@ -76,12 +83,9 @@ def calculate(logger):
 
         print("Got all virtual points in MyEMS System Database")
         ################################################################################################################
-        # Step 2: Create multiprocessing pool to call worker in parallel
+        # Step 2: Call worker in parallel with the multiprocessing pool
         ################################################################################################################
-        p = Pool(processes=config.pool_size)
         error_list = p.map(worker, virtual_point_list)
-        p.close()
-        p.join()
 
         for error in error_list:
             if error is not None and len(error) > 0:
@@ -92,6 +96,55 @@ def calculate(logger):
         print("wake from sleep, and continue to work")
 
 
+# the number of virtual point values inserted in one statement
+INSERT_BATCH_SIZE = 1000
+
+# (expression, variable names) -> compiled function of the variables in the order of variable names
+compiled_expression_dict = dict()
+
+
+def compile_expression(expression, variable_name_list):
+    """
+    Compile the expression of a virtual point into a function of its variables, cached by the expression text
+    An expression with ',' is a piecewise function of (value, condition) pairs, else it is an algebraic expression.
+    The sympify function(that’s sympify, not to be confused with simplify) converts the string into an expression,
+    and lambdify translates the expression into a Python function with the math module,
+    which is evaluated much faster than evalf or subs of the expression at each date time.
+    :return: the function of the variables in the order of variable names
+    """
+    key = (expression, tuple(variable_name_list))
+    function = compiled_expression_dict.get(key)
+    if function is None:
+        symbol_list = [symbols(variable_name) for variable_name in variable_name_list]
+        if re.search(',', expression):
+            expr = Piecewise(*eval(expression, globals(), dict(zip(variable_name_list, symbol_list))))
+            print("the expression will be evaluated as piecewise function: " + str(expr))
+        else:
+            expr = sympify(expression)
+            print("the expression will be evaluated as algebraic expression: " + str(expr))
+        function = lambdify(symbol_list, expr, modules='math')
+        compiled_expression_dict[key] = function
+    return function
+
+
+def align_as_of(utc_date_time_list, point_values):
+    """
+    Align the values of a point with the date times by as-of join in a single merge pass
+    :param utc_date_time_list: sorted list of date times
+    :param point_values: list of (utc_date_time, actual_value) of the point in time order
+    :return: list of the latest values at or before each date time as float, None before the first value
+    """
+    value_list = list()
+    index = 0
+    current_value = None
+    for utc_date_time in utc_date_time_list:
+        while index < len(point_values) and point_values[index][0] <= utc_date_time:
+            current_value = float(point_values[index][1])
+            index += 1
+        value_list.append(current_value)
+    return value_list
+
+
 ########################################################################################################################
 # Step 1: get start datetime and end datetime
 # Step 2: parse the expression and get all points in substitutions
@@ -105,7 +158,7 @@ def worker(virtual_point):
     cursor_historical_db = None
 
     try:
-        cnx_historical_db = mysql.connector.connect(**config.myems_historical_db)
+        cnx_historical_db = connection_pool.connect(config.myems_historical_db)
         cursor_historical_db = cnx_historical_db.cursor()
     except Exception as e:
         if cursor_historical_db:
@@ -165,6 +218,10 @@ def worker(virtual_point):
                 or 'substitutions' not in address.keys() \
                 or len(address['expression']) == 0 \
                 or len(address['substitutions']) == 0:
+            if cursor_historical_db:
+                cursor_historical_db.close()
+            if cnx_historical_db:
+                cnx_historical_db.close()
             return "Error in step 2.1 of virtual point worker for '" + virtual_point['name'] + "'"
         expression = address['expression']
         substitutions = address['substitutions']
@@ -184,32 +241,45 @@ def worker(virtual_point):
     cnx_system_db = None
     cursor_system_db = None
     try:
-        cnx_system_db = mysql.connector.connect(**config.myems_system_db)
+        cnx_system_db = connection_pool.connect(config.myems_system_db)
         cursor_system_db = cnx_system_db.cursor()
     except Exception as e:
-        print("Error in step 3 of virtual point worker " + str(e))
         if cursor_system_db:
             cursor_system_db.close()
         if cnx_system_db:
             cnx_system_db.close()
-        return
+        if cursor_historical_db:
+            cursor_historical_db.close()
+        if cnx_historical_db:
+            cnx_historical_db.close()
+        return "Error in step 3.1 of virtual point worker " + str(e) + " for '" + virtual_point['name'] + "'"
 
     print("Connected to MyEMS System Database")
 
     all_point_dict = dict()
     try:
+        # query only the points in substitutions
         cursor_system_db.execute(" SELECT id, object_type "
-                                 " FROM tbl_points ")
+                                 " FROM tbl_points "
+                                 " WHERE id IN (" + ', '.join(['%s'] * len(point_list)) + ") ",
+                                 tuple(point['point_id'] for point in point_list))
         rows_points = cursor_system_db.fetchall()
 
         if rows_points is None or len(rows_points) == 0:
-            return
+            if cursor_historical_db:
+                cursor_historical_db.close()
+            if cnx_historical_db:
+                cnx_historical_db.close()
+            return "points in substitutions not found " + " for '" + virtual_point['name'] + "'"
 
         for row in rows_points:
             all_point_dict[row[0]] = row[1]
     except Exception as e:
-        print("Error in step 1 of virtual point calculate " + str(e))
-        return
+        if cursor_historical_db:
+            cursor_historical_db.close()
+        if cnx_historical_db:
+            cnx_historical_db.close()
+        return "Error in step 3.2 of virtual point worker " + str(e) + " for '" + virtual_point['name'] + "'"
     finally:
         if cursor_system_db:
             cursor_system_db.close()
@@ -220,40 +290,48 @@ def worker(virtual_point):
     ############################################################################################################
 
     print("getting point values ")
+    # point id -> list of (utc_date_time, actual_value) in time order,
+    # beginning with the latest value at or before start_datetime_utc if there is one
     point_values_dict = dict()
     if point_list is not None and len(point_list) > 0:
         try:
             for point in point_list:
                 point_object_type = all_point_dict.get(point['point_id'])
                 if point_object_type is None:
+                    if cursor_historical_db:
+                        cursor_historical_db.close()
+                    if cnx_historical_db:
+                        cnx_historical_db.close()
                     return "variable point type should not be None " + " for '" + virtual_point['name'] + "'"
                 if point_object_type == 'ANALOG_VALUE':
-                    query = (" SELECT utc_date_time, actual_value "
-                             " FROM tbl_analog_value "
-                             " WHERE point_id = %s AND utc_date_time > %s AND utc_date_time < %s "
-                             " ORDER BY utc_date_time ")
-                    cursor_historical_db.execute(query, (point['point_id'], start_datetime_utc, end_datetime_utc,))
-                    rows = cursor_historical_db.fetchall()
-                    if rows is not None and len(rows) > 0:
-                        point_values_dict[point['point_id']] = dict()
-                        for row in rows:
-                            point_values_dict[point['point_id']][row[0]] = row[1]
+                    table_name = "tbl_analog_value"
                 elif point_object_type == 'ENERGY_VALUE':
-                    query = (" SELECT utc_date_time, actual_value "
-                             " FROM tbl_energy_value "
-                             " WHERE point_id = %s AND utc_date_time > %s AND utc_date_time < %s "
-                             " ORDER BY utc_date_time ")
-                    cursor_historical_db.execute(query, (point['point_id'], start_datetime_utc, end_datetime_utc,))
-                    rows = cursor_historical_db.fetchall()
-                    if rows is not None and len(rows) > 0:
-                        point_values_dict[point['point_id']] = dict()
-                        for row in rows:
-                            point_values_dict[point['point_id']][row[0]] = row[1]
-                    else:
-                        point_values_dict[point['point_id']] = None
+                    table_name = "tbl_energy_value"
                 else:
                     # point type should not be DIGITAL_VALUE
+                    if cursor_historical_db:
+                        cursor_historical_db.close()
+                    if cnx_historical_db:
+                        cnx_historical_db.close()
                     return "variable point type should not be DIGITAL_VALUE " + " for '" + virtual_point['name'] + "'"
+
+                query = (" SELECT utc_date_time, actual_value "
+                         " FROM " + table_name +
+                         " WHERE point_id = %s AND utc_date_time <= %s "
+                         " ORDER BY utc_date_time DESC "
+                         " LIMIT 1 ")
+                cursor_historical_db.execute(query, (point['point_id'], start_datetime_utc,))
+                row = cursor_historical_db.fetchone()
+                point_values_dict[point['point_id']] = [(row[0], row[1])] if row is not None else list()
+
+                query = (" SELECT utc_date_time, actual_value "
+                         " FROM " + table_name +
+                         " WHERE point_id = %s AND utc_date_time > %s AND utc_date_time < %s "
+                         " ORDER BY utc_date_time ")
+                cursor_historical_db.execute(query, (point['point_id'], start_datetime_utc, end_datetime_utc,))
+                rows = cursor_historical_db.fetchall()
+                if rows is not None and len(rows) > 0:
+                    point_values_dict[point['point_id']].extend((row[0], row[1]) for row in rows)
         except Exception as e:
             if cursor_historical_db:
                 cursor_historical_db.close()
@@ -265,68 +343,30 @@ def worker(virtual_point):
     # Step 5: evaluate the equation with points values
     ############################################################################################################
 
-    print("getting date time set for all points")
+    print("getting date time list for all points")
     utc_date_time_set = set()
-    if point_values_dict is not None and len(point_values_dict) > 0:
-        for point_id, point_values in point_values_dict.items():
-            if point_values is not None and len(point_values) > 0:
-                utc_date_time_set = utc_date_time_set.union(point_values.keys())
+    for point_id, point_values in point_values_dict.items():
+        utc_date_time_set.update(utc_date_time for utc_date_time, _ in point_values
+                                 if utc_date_time > start_datetime_utc)
+    utc_date_time_list = sorted(utc_date_time_set)
 
-    print("evaluating the equation with SymPy")
+    print("evaluating the compiled equation")
     normalized_values = list()
-
-    ############################################################################################################
-    # Converting Strings to SymPy Expressions
-    # The sympify function(that’s sympify, not to be confused with simplify) can be used to
-    # convert strings into SymPy expressions.
-    ############################################################################################################
     try:
-        if re.search(',', expression):
-            for item in substitutions.keys():
-                locals()[item] = symbols(item)
-            expr = eval(expression)
-            print("the expression will be evaluated as piecewise function: " + str(expr))
-        else:
-            expr = sympify(expression)
-            print("the expression will be evaluated as algebraic expression: " + str(expr))
-
-        for utc_date_time in utc_date_time_set:
-            meta_data = dict()
-            meta_data['utc_date_time'] = utc_date_time
-
-            ####################################################################################################
-            # create a dictionary of Symbol: point pairs
-            ####################################################################################################
-
-            subs = dict()
-
-            ####################################################################################################
-            # Evaluating the expression at current_datetime_utc
-            ####################################################################################################
+        function = compile_expression(expression, [point['variable_name'] for point in point_list])
 
-            if point_list is not None and len(point_list) > 0:
-                for point in point_list:
-                    actual_value = point_values_dict[point['point_id']].get(utc_date_time, None)
-                    if actual_value is None:
-                        break
-                    subs[point['variable_name']] = actual_value
+        ################################################################################################################
+        # align the values of all points with the date times by as-of join,
+        # the value of a point at a date time is its latest value at or before the date time
+        ################################################################################################################
+        column_list = [align_as_of(utc_date_time_list, point_values_dict[point['point_id']])
+                       for point in point_list]
 
-            if len(subs) != len(point_list):
+        for utc_date_time, values in zip(utc_date_time_list, zip(*column_list)):
+            # the date times before any value of a point are omitted
+            if None in values:
                 continue
-
-            ####################################################################################################
-            # To numerically evaluate an expression with a Symbol at a point,
-            # we might use subs followed by evalf,
-            # but it is more efficient and numerically stable to pass the substitution to evalf
-            # using the subs flag, which takes a dictionary of Symbol: point pairs.
-            ####################################################################################################
-            if re.search(',', expression):
-                formula = Piecewise(*expr)
-                meta_data['actual_value'] = Decimal(str(formula.subs(subs)))
-                normalized_values.append(meta_data)
-            else:
-                meta_data['actual_value'] = Decimal(str(expr.evalf(subs=subs)))
-                normalized_values.append(meta_data)
+            normalized_values.append((virtual_point['id'], utc_date_time, Decimal(str(function(*values)))))
     except Exception as e:
         if cursor_historical_db:
             cursor_historical_db.close()
@@ -342,57 +382,33 @@ def worker(virtual_point):
         elif virtual_point['object_type'] == 'ENERGY_VALUE':
             table_name = "tbl_energy_value"
         else:
-            return "variable point type should not be DIGITAL_VALUE " + " for '" + virtual_point['name'] + "'"
-
-        latest_meta_data = normalized_values[0]
-        try:
-            add_values = (" INSERT INTO " + table_name +
-                          " (point_id, utc_date_time, actual_value) "
-                          " VALUES  ")
-
-            for meta_data in normalized_values:
-                add_values += " (" + str(virtual_point['id']) + ","
-                add_values += "'" + meta_data['utc_date_time'].isoformat()[0:19] + "',"
-                add_values += str(meta_data['actual_value']) + "), "
-
-                if meta_data['utc_date_time'] > latest_meta_data['utc_date_time']:
-                    latest_meta_data = meta_data
-
-            print("add_values:" + add_values)
-            # trim ", " at the end of string and then execute
-            cursor_historical_db.execute(add_values[:-2])
-            cnx_historical_db.commit()
-        except Exception as e:
             if cursor_historical_db:
                 cursor_historical_db.close()
             if cnx_historical_db:
                 cnx_historical_db.close()
-            return "Error in step 5.2 virtual point worker " + str(e) + " for '" + virtual_point['name'] + "'"
+            return "variable point type should not be DIGITAL_VALUE " + " for '" + virtual_point['name'] + "'"
 
         try:
-            # update tbl_analog_value_latest
-            delete_value = " DELETE FROM " + table_name + "_latest WHERE point_id = {} ".format(virtual_point['id'])
-            latest_value = (" INSERT INTO " + table_name + "_latest (point_id, utc_date_time, actual_value) "
-                            " VALUES ({}, '{}', {}) "
-                            .format(virtual_point['id'],
-                                    latest_meta_data['utc_date_time'].isoformat()[0:19],
-                                    latest_meta_data['actual_value']))
-
-            print("delete_value:" + delete_value)
-            print("latest_value:" + latest_value)
-
-            cursor_historical_db.execute(delete_value)
-            cnx_historical_db.commit()
+            # NOTE: the values are bulk inserted with multi-row inserts, and the latest value is upserted,
+            # all in one transaction
+            add_values = (" INSERT INTO " + table_name +
+                          " (point_id, utc_date_time, actual_value) "
+                          " VALUES (%s, %s, %s) ")
+            for i in range(0, len(normalized_values), INSERT_BATCH_SIZE):
+                cursor_historical_db.executemany(add_values, normalized_values[i:i + INSERT_BATCH_SIZE])
 
-            cursor_historical_db.execute(latest_value)
+            latest_value = (" INSERT INTO " + table_name + "_latest (point_id, utc_date_time, actual_value) "
+                            " VALUES (%s, %s, %s) "
+                            " ON DUPLICATE KEY UPDATE "
+                            " utc_date_time = VALUES(utc_date_time), actual_value = VALUES(actual_value) ")
+            cursor_historical_db.execute(latest_value, normalized_values[-1])
             cnx_historical_db.commit()
-
         except Exception as e:
             if cursor_historical_db:
                 cursor_historical_db.close()
             if cnx_historical_db:
                 cnx_historical_db.close()
-            return "Error in step 5.3 virtual point worker " + str(e) + " for '" + virtual_point['name'] + "'"
+            return "Error in step 5.2 virtual point worker " + str(e) + " for '" + virtual_point['name'] + "'"
 
     if cursor_historical_db:
         cursor_historical_db.close()